@@ -1,16 +1,70 @@
 import argparse
 import json
+import multiprocessing
+import os
 import sys
-from collections import defaultdict
+from collections import Counter
+from typing import List, Tuple
 
 
-def read_log(log_file: str):
-    d = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
-    with open(log_file, 'r') as fp:
-        for line in fp:
-            line = line.strip('\r\n')
-            key, pos, char = line.split('\t')
-            d[key][pos][char] += 1
+def split_log(log_file: str, chunk_size: int = 1 << 24) -> List[Tuple[int, int]]:
+    """Byte ranges of about chunk_size bytes covering the log, each ending after a newline"""
+    ranges = []
+    with open(log_file, 'rb') as fp:
+        size = os.fstat(fp.fileno()).st_size
+        start = 0
+        while start < size:
+            fp.seek(min(start + chunk_size, size) - 1)
+            fp.readline()
+            stop = min(fp.tell(), size)
+            ranges.append((start, stop))
+            start = stop
+    return ranges
+
+
+def count_range(log_file: str, start: int, stop: int) -> Counter:
+    """Count every (key, position, character) line in a byte range of the log, in order of first occurrence"""
+    with open(log_file, 'rb') as fp:
+        fp.seek(start)
+        block = fp.read(stop - start)
+    lines = block.decode('utf-8').split('\n')
+    if not lines[-1]:
+        lines.pop()
+    counter = Counter()
+    for line, n in Counter(lines).items():
+        key, pos, char = line.strip('\r\n').split('\t')
+        counter[key, pos, char] += n
+    return counter
+
+
+def _count_range(args):
+    log_file, start, stop = args
+    return count_range(log_file, start, stop), stop - start
+
+
+def read_log(log_file: str, processes: int = 1, chunk_size: int = 1 << 24):
+    """
+    Count the deletions of a log as JSON: {key: {position: {character: count}}}.
+    The log is cut into ranges of chunk_size bytes counted in processes, their
+    counts are merged in order, so the result doesn't depend on processes.
+    """
+    tasks = [(log_file, start, stop) for start, stop in split_log(log_file, chunk_size)]
+    total_size = tasks[-1][2] if tasks else 0
+    counts = Counter()
+    done = 0
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    results = pool.imap(_count_range, tasks) if pool is not None else map(_count_range, tasks)
+    try:
+        for counter, size in results:
+            counts.update(counter)
+            done += size
+            print(f"{100 * done // total_size}%", end='\r', flush=True, file=sys.stderr)
+    finally:
+        if pool is not None:
+            pool.terminate()
+    d = {}
+    for (key, pos, char), n in counts.items():
+        d.setdefault(key, {}).setdefault(pos, {})[char] = n
     res = json.dumps(d)
     return res
 
@@ -19,13 +73,15 @@ def wrapper():
     cli = argparse.ArgumentParser("")
     cli.add_argument('-l', '--log', dest='log', required=True, help='log file generated by PyRuleEngineDelete.py')
     cli.add_argument('-s', '--save', dest='save', help='save result')
+    cli.add_argument('-j', '--processes', dest='processes', type=int, default=1, help='number of processes')
+    cli.add_argument('--chunk-size', dest='chunk_size', type=int, default=1 << 24, help='bytes counted at a time')
     args = cli.parse_args()
     log_file, save_file = args.log, args.save
     if save_file is not None:
         f_out = open(save_file, 'w')
     else:
         f_out = sys.stdout
-    res = read_log(log_file)
+    res = read_log(log_file, args.processes, args.chunk_size)
     f_out.write(res)
     f_out.flush()
     f_out.close()
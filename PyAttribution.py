@@ -0,0 +1,93 @@
+"""
+Attribute the targets of a leak to the (word, rule) pairs which crack them,
+working backwards from the targets: every target is reversed through every
+rule with the ReversionEngine, the results are looked up in an index of the
+dictionary, and a hit is confirmed by applying the rule to the word forwards.
+The work is targets x rules, instead of words x rules for applying every rule
+to every word, which is much less for dictionaries larger than the targets.
+Functions losing information branch into a few likely preimages, so the
+attribution is a lower bound of what the forward run finds.
+"""
+import argparse
+import sys
+from typing import Dict, Generator, Iterable, Sequence, Tuple
+
+from PyHashcat import read_dict, read_rules, read_target
+from PyReversionEngine import ReversionEngine, ReversionIndex
+from PyRuleEngine import RuleContext, RuleEngine
+
+
+class Attribution(object):
+    """
+    >>> attribution = Attribution(['$1', 'r', '^x$1', 'u'], {'password': 1, 'abc': 1, 'Abc': 1})
+    >>> list(attribution.attribute(['password1', 'cba', 'xabc1', 'ABC']))
+    [('password1', 'password', 0), ('cba', 'abc', 1), ('xabc1', 'abc', 2), ('ABC', 'abc', 3), ('ABC', 'Abc', 3)]
+    >>> attribution.stats
+    {'targets': 4, 'lookups': 16, 'found': 6, 'confirmed': 5}
+
+    dictionary is a ReversionIndex or the words, e.g. the dict of
+    PyHashcat.read_dict. found counts the preimages in the dictionary,
+    confirmed those the rule gives back: '^x$1' reverses 'password1' to
+    'password', which it doesn't give. k and limit bound the branching, see
+    ReversionEngine.preimages.
+    """
+
+    def __init__(self, rules: Sequence[str], dictionary, rejected_rules: Sequence[str] = None,
+                 k: int = 3, limit: int = 256):
+        self.rules = list(rules)
+        self.index = dictionary if isinstance(dictionary, ReversionIndex) else ReversionIndex(dictionary)
+        self.k = k
+        self.limit = limit
+        self.forward = RuleEngine(self.rules, rejected_rules)
+        self.reversion = ReversionEngine(self.rules)
+        self.stats = {'targets': 0, 'lookups': 0, 'found': 0, 'confirmed': 0}
+
+    def attribute(self, targets: Iterable[str]) -> Generator[Tuple[str, str, int], None, None]:
+        """Yield (target, word, rule id) for every rule and word giving a target"""
+        preimages = self.reversion.preimages
+        compiled = self.forward.compiled
+        ctx = RuleContext()
+        stats = self.stats
+        for target in targets:
+            stats['targets'] += 1
+            for idx in range(len(self.rules)):
+                stats['lookups'] += 1
+                for word in preimages(target, idx, self.index, self.k, self.limit):
+                    stats['found'] += 1
+                    if compiled[idx](word, ctx) == target:
+                        stats['confirmed'] += 1
+                        yield target, word, idx
+
+    def rule_hits(self, targets: Dict[str, int]) -> Dict[str, int]:
+        """How many targets every rule cracks, counting a target as often as it occurs"""
+        hits = dict.fromkeys(self.rules, 0)
+        for target, _, idx in self.attribute(targets):
+            hits[self.rules[idx]] += targets[target]
+        return hits
+
+
+def wrapper():
+    cli = argparse.ArgumentParser('Attribute targets to words and rules by reversing the rules')
+    cli.add_argument('-w', '--words', dest='words', required=True, help='dictionary')
+    cli.add_argument('-r', '--rules', dest='rules', required=True, help='rule file')
+    cli.add_argument('-t', '--target', dest='target', required=True, help='target passwords')
+    cli.add_argument('-s', '--save', dest='save', help='save target, word and rule of every hit')
+    cli.add_argument('-k', dest='k', type=int, default=3, help='characters guessed for every deleted character')
+    cli.add_argument('--limit', dest='limit', type=int, default=256, help='preimages followed at every step')
+    args = cli.parse_args()
+    if args.save is not None:
+        f_out = open(args.save, 'w')
+    else:
+        f_out = sys.stdout
+    attribution = Attribution(read_rules(args.rules), read_dict(args.words), k=args.k, limit=args.limit)
+    for target, word, idx in attribution.attribute(read_target(args.target)):
+        f_out.write(f"{target}\t{word}\t{attribution.rules[idx]}\n")
+    f_out.flush()
+    f_out.close()
+    stats = attribution.stats
+    print(f"targets: {stats['targets']}, lookups: {stats['lookups']}, found: {stats['found']}, "
+          f"confirmed: {stats['confirmed']}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    wrapper()
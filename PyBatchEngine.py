@@ -0,0 +1,630 @@
+"""
+Batch mode of the rule engine. A word list is stored in a fixed-width NumPy
+byte matrix with a vector of lengths, and every function of a rule is executed
+as a column-wise array operation across all words at once.
+
+Words are encoded to bytes (latin-1 by default), so the functions follow the
+byte semantics of hashcat: case functions only touch ASCII letters and
+'L', 'R', '+', '-' wrap around at 256. For ASCII words the candidates are the
+same as the ones of RuleEngine.apply.
+"""
+from typing import Generator, List, Sequence, Tuple
+
+import numpy as np
+
+from PyRuleEngine import RuleContext, fuse_rule
+
+LOWER = np.arange(256, dtype=np.uint8)
+LOWER[65:91] += 32
+UPPER = np.arange(256, dtype=np.uint8)
+UPPER[97:123] -= 32
+SWAP = np.arange(256, dtype=np.uint8)
+SWAP[65:91] += 32
+SWAP[97:123] -= 32
+
+
+def encode_words(words: Sequence[str], encoding: str = 'latin-1',
+                 failed: List[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Store words in a zero padded byte matrix and return it with the lengths.
+    With encoding None the words are bytes already. If failed is a list, words
+    which can't be encoded are stored empty and their indices appended to it,
+    otherwise they raise UnicodeEncodeError.
+    """
+    if encoding is None:
+        encoded = words
+    elif failed is None:
+        encoded = [w.encode(encoding) for w in words]
+    else:
+        try:
+            encoded = [w.encode(encoding) for w in words]
+        except UnicodeEncodeError:
+            encoded = []
+            for i, w in enumerate(words):
+                try:
+                    encoded.append(w.encode(encoding))
+                except UnicodeEncodeError:
+                    encoded.append(b'')
+                    failed.append(i)
+    lens = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    width = max(int(lens.max()), 1) if len(encoded) else 1
+    buf = np.zeros((len(encoded), width), dtype=np.uint8)
+    buf[_cols(width) < lens[:, None]] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return buf, lens
+
+
+def decode_words(buf: np.ndarray, lens: np.ndarray, encoding: str = 'latin-1', alive=None) -> List[str]:
+    """
+    Inverse of encode_words, rows which are not alive are decoded to None.
+    With encoding None the rows are returned as bytes.
+    """
+    if alive is not None and not alive.all():
+        words = decode_words(buf, lens, encoding)
+        return [w if a else None for w, a in zip(words, alive.tolist())]
+    if encoding == 'latin-1' and len(lens):
+        last = buf[np.arange(buf.shape[0]), np.maximum(lens - 1, 0)]
+        if not ((last == 0) & (lens > 0)).any():
+            # latin-1 bytes are code points, and NumPy strips the zero padding
+            width = buf.shape[1]
+            return np.ascontiguousarray(buf, dtype=np.uint32).view('U%d' % width).ravel().tolist()
+    raw = buf.tobytes()
+    width = buf.shape[1]
+    if encoding is None:
+        return [raw[i * width:i * width + n] for i, n in enumerate(lens.tolist())]
+    return [raw[i * width:i * width + n].decode(encoding, 'surrogateescape')
+            for i, n in enumerate(lens.tolist())]
+
+
+def _cols(width):
+    return np.arange(width)[None, :]
+
+
+def _gather(buf, idx, new_lens):
+    """Build a new matrix where row r, column j is buf[r, idx[r, j]]"""
+    width = max(int(new_lens.max()), 1)
+    idx = np.broadcast_to(idx, (buf.shape[0], idx.shape[1]))[:, :width]
+    if idx.shape[1] < width:
+        idx = np.pad(idx, ((0, 0), (0, width - idx.shape[1])), mode='edge')
+    out = np.take_along_axis(buf, np.clip(idx, 0, buf.shape[1] - 1), axis=1)
+    out[_cols(width) >= new_lens[:, None]] = 0
+    return out
+
+
+def _widen(buf, width):
+    """Copy of buf with at least width columns"""
+    return np.pad(buf, ((0, 0), (0, max(width - buf.shape[1], 0))))
+
+
+def _width_for(lens):
+    return max(int(lens.max()), 1)
+
+
+def _map_table(table):
+    return lambda buf, lens, state: (table[buf], lens)
+
+
+def _capitalize(first, rest):
+    def kernel(buf, lens, state):
+        buf = rest[buf]
+        buf[:, 0] = first[buf[:, 0]]
+        return buf, lens
+
+    return kernel
+
+
+def _reverse(buf, lens, state):
+    return _gather(buf, lens[:, None] - 1 - _cols(buf.shape[1]), lens), lens
+
+
+def _reflect(buf, lens, state):
+    new_lens = lens * 2
+    cols = _cols(_width_for(new_lens))
+    idx = np.where(cols < lens[:, None], cols, 2 * lens[:, None] - 1 - cols)
+    return _gather(buf, idx, new_lens), new_lens
+
+
+def _rotate(shift):
+    def kernel(buf, lens, state):
+        idx = (_cols(buf.shape[1]) + shift) % np.maximum(lens, 1)[:, None]
+        return _gather(buf, idx, lens), lens
+
+    return kernel
+
+
+def _truncate_left(buf, lens, state):
+    new_lens = np.maximum(lens - 1, 0)
+    return _gather(buf, _cols(buf.shape[1]) + 1, new_lens), new_lens
+
+
+def _truncate_right(buf, lens, state):
+    new_lens = np.maximum(lens - 1, 0)
+    return _gather(buf, _cols(buf.shape[1]), new_lens), new_lens
+
+
+def _duplicate_all(buf, lens, state):
+    new_lens = lens * 2
+    return _gather(buf, _cols(_width_for(new_lens)) // 2, new_lens), new_lens
+
+
+def _swap_front(buf, lens, state):
+    rows = lens > 1
+    if rows.any():
+        buf = buf.copy()
+        buf[rows, 0], buf[rows, 1] = buf[rows, 1], buf[rows, 0].copy()
+    return buf, lens
+
+
+def _swap_back(buf, lens, state):
+    rows = np.nonzero(lens > 1)[0]
+    if len(rows):
+        buf = buf.copy()
+        last, before = lens[rows] - 1, lens[rows] - 2
+        buf[rows, last], buf[rows, before] = buf[rows, before], buf[rows, last].copy()
+    return buf, lens
+
+
+def _append(suffix):
+    def kernel(buf, lens, state):
+        new_lens = lens + len(suffix)
+        buf = _widen(buf, _width_for(new_lens))
+        rows = np.arange(buf.shape[0])
+        for j, c in enumerate(suffix):
+            buf[rows, lens + j] = c
+        return buf, new_lens
+
+    return kernel
+
+
+def _prepend(prefix):
+    def kernel(buf, lens, state):
+        new_lens = lens + len(prefix)
+        buf = _gather(buf, _cols(_width_for(new_lens)) - len(prefix), new_lens)
+        for j, c in enumerate(prefix):
+            buf[:, j] = c
+        return buf, new_lens
+
+    return kernel
+
+
+def _memorize(buf, lens, state):
+    state['mem'] = (buf, lens)
+    return buf, lens
+
+
+def _splice(start, length, at):
+    """Insert mem[start:start + length] at position at, for per row arrays"""
+
+    def kernel(buf, lens, state):
+        mem, mem_lens = state['mem']
+        seg_start = np.minimum(start(mem_lens), mem_lens)
+        seg_len = np.maximum(np.minimum(seg_start + length(mem_lens), mem_lens) - seg_start, 0)
+        pos = np.minimum(at(lens), lens)[:, None]
+        new_lens = lens + seg_len
+        seg_len = seg_len[:, None]
+        cols = _cols(_width_for(new_lens))
+        combined = np.concatenate([buf, mem], axis=1)
+        idx = np.where(cols < pos, cols,
+                       np.where(cols < pos + seg_len, buf.shape[1] + seg_start[:, None] + cols - pos,
+                                cols - seg_len))
+        return _gather(combined, idx, new_lens), new_lens
+
+    return kernel
+
+
+def _title(sep):
+    def kernel(buf, lens, state):
+        lowered = LOWER[buf]
+        last = lowered[np.arange(buf.shape[0]), np.maximum(lens - 1, 0)]
+        rows = (lens > 0) & (last != sep)
+        valid = _cols(buf.shape[1]) < lens[:, None]
+        starts = np.zeros(buf.shape, dtype=bool)
+        starts[:, 0] = True
+        starts[:, 1:] = lowered[:, :-1] == sep
+        titled = np.where(starts & valid, UPPER[lowered], lowered)
+        return np.where(rows[:, None], titled, buf), lens
+
+    return kernel
+
+
+def _toggle_at(n):
+    def kernel(buf, lens, state):
+        rows = n < lens
+        if rows.any():
+            buf = buf.copy()
+            buf[rows, n] = SWAP[buf[rows, n]]
+        return buf, lens
+
+    return kernel
+
+
+def _duplicate_n(n):
+    def kernel(buf, lens, state):
+        new_lens = lens * (n + 1)
+        idx = _cols(_width_for(new_lens)) % np.maximum(lens, 1)[:, None]
+        return _gather(buf, idx, new_lens), new_lens
+
+    return kernel
+
+
+def _delete_at(n):
+    def kernel(buf, lens, state):
+        rows = (n < lens)[:, None]
+        cols = _cols(buf.shape[1])
+        new_lens = lens - rows[:, 0]
+        return _gather(buf, np.where(rows, cols + (cols >= n), cols), new_lens), new_lens
+
+    return kernel
+
+
+def _extract(n, m):
+    def kernel(buf, lens, state):
+        start = np.minimum(n, lens)
+        new_lens = np.maximum(np.minimum(m, lens) - start, 0)
+        return _gather(buf, _cols(buf.shape[1]) + start[:, None], new_lens), new_lens
+
+    return kernel
+
+
+def _omit(n, m):
+    def kernel(buf, lens, state):
+        rows = (n + m <= lens)[:, None]
+        cols = _cols(buf.shape[1])
+        new_lens = lens - m * rows[:, 0]
+        return _gather(buf, np.where(rows, cols + m * (cols >= n), cols), new_lens), new_lens
+
+    return kernel
+
+
+def _insert(n, c):
+    def kernel(buf, lens, state):
+        rows = n <= lens
+        new_lens = lens + rows
+        cols = _cols(_width_for(new_lens))
+        buf = _gather(buf, np.where(rows[:, None], cols - (cols > n), cols), new_lens)
+        if rows.any():
+            buf[rows, n] = c
+        return buf, new_lens
+
+    return kernel
+
+
+def _overwrite(n, c):
+    def kernel(buf, lens, state):
+        rows = n < lens
+        if rows.any():
+            buf = buf.copy()
+            buf[rows, n] = c
+        return buf, lens
+
+    return kernel
+
+
+def _truncate_at(n):
+    def kernel(buf, lens, state):
+        new_lens = np.minimum(lens, n)
+        return _gather(buf, _cols(buf.shape[1]), new_lens), new_lens
+
+    return kernel
+
+
+def _replace(a, b):
+    def kernel(buf, lens, state):
+        valid = _cols(buf.shape[1]) < lens[:, None]
+        return np.where(valid & (buf == a), np.uint8(b), buf), lens
+
+    return kernel
+
+
+def _purge(c):
+    def kernel(buf, lens, state):
+        keep = (_cols(buf.shape[1]) < lens[:, None]) & (buf != c)
+        new_lens = keep.sum(axis=1)
+        order = np.argsort(~keep, axis=1, kind='stable')
+        return _gather(buf, order, new_lens), new_lens
+
+    return kernel
+
+
+def _duplicate_first(n):
+    def kernel(buf, lens, state):
+        new_lens = lens + n * (lens > 0)
+        idx = np.maximum(_cols(_width_for(new_lens)) - n, 0)
+        return _gather(buf, idx, new_lens), new_lens
+
+    return kernel
+
+
+def _duplicate_last(n):
+    def kernel(buf, lens, state):
+        new_lens = lens + n * (lens > 0)
+        idx = np.minimum(_cols(_width_for(new_lens)), np.maximum(lens - 1, 0)[:, None])
+        return _gather(buf, idx, new_lens), new_lens
+
+    return kernel
+
+
+def _swap(n, m):
+    if n > m:
+        n, m = m, n
+
+    def kernel(buf, lens, state):
+        rows = m < lens
+        if n == m:
+            # same as RuleEngine, where '*NN' duplicates the character N
+            new_lens = lens + rows
+            cols = _cols(_width_for(new_lens))
+            return _gather(buf, np.where(rows[:, None], cols - (cols > n), cols), new_lens), new_lens
+        if rows.any():
+            buf = buf.copy()
+            buf[rows, n], buf[rows, m] = buf[rows, m], buf[rows, n].copy()
+        return buf, lens
+
+    return kernel
+
+
+def _byte_op(n, op):
+    def kernel(buf, lens, state):
+        rows = n < lens
+        if rows.any():
+            buf = buf.copy()
+            buf[rows, n] = op(buf[rows, n].astype(np.int64)) & 0xFF
+        return buf, lens
+
+    return kernel
+
+
+def _replace_plus(n):
+    def kernel(buf, lens, state):
+        rows = n + 1 < lens
+        if rows.any():
+            buf = buf.copy()
+            buf[rows, n] = buf[rows, n + 1]
+        return buf, lens
+
+    return kernel
+
+
+def _replace_minus(n):
+    def kernel(buf, lens, state):
+        rows = (lens > 0) & (n <= lens)
+        new_lens = lens + (rows & (n == lens))
+        buf = _widen(buf, max(_width_for(new_lens), n + 1))
+        src = buf[np.arange(buf.shape[0]), (n - 1) % np.maximum(lens, 1)]
+        buf[rows, n] = src[rows]
+        return buf, new_lens
+
+    return kernel
+
+
+def _duplicate_front(n):
+    def kernel(buf, lens, state):
+        k = np.minimum(n, lens)[:, None]
+        new_lens = lens + k[:, 0]
+        cols = _cols(_width_for(new_lens))
+        return _gather(buf, np.where(cols < k, cols, cols - k), new_lens), new_lens
+
+    return kernel
+
+
+def _duplicate_back(n):
+    def kernel(buf, lens, state):
+        k = lens if n == 0 else np.minimum(n, lens)
+        new_lens = lens + k
+        cols = _cols(_width_for(new_lens))
+        return _gather(buf, np.where(cols < lens[:, None], cols, cols - k[:, None]), new_lens), new_lens
+
+    return kernel
+
+
+def _title_n(n, c):
+    def kernel(buf, lens, state):
+        occ = (_cols(buf.shape[1]) < lens[:, None]) & (buf == c)
+        target = occ & (np.cumsum(occ, axis=1) == n + 1)
+        pos = target.argmax(axis=1) + 1
+        rows = np.nonzero(target.any(axis=1) & (pos < lens))[0]
+        if len(rows):
+            buf = buf.copy()
+            buf[rows, pos[rows]] = UPPER[buf[rows, pos[rows]]]
+        return buf, lens
+
+    return kernel
+
+
+def _append_memory(buf, lens, state):
+    return _splice(lambda m: 0, lambda m: m, lambda w: w)(buf, lens, state)
+
+
+def _prepend_memory(buf, lens, state):
+    return _splice(lambda m: 0, lambda m: m, lambda w: 0)(buf, lens, state)
+
+
+def _extract_memory(pos, length, i):
+    return _splice(lambda m: pos, lambda m: length, lambda w: i)
+
+
+def _reject(predicate):
+    """Kernel of a reject function, marking the rows where predicate is True"""
+
+    def kernel(buf, lens, state):
+        state['alive'] &= ~predicate(buf, lens, state)
+        return buf, lens
+
+    return kernel
+
+
+def _valid(buf, lens):
+    return _cols(buf.shape[1]) < lens[:, None]
+
+
+def _at(buf, lens, n):
+    """Byte at column n of every row, 0 where n is out of range"""
+    if n >= buf.shape[1]:
+        return np.zeros(buf.shape[0], dtype=np.uint8)
+    return np.where(n < lens, buf[:, n], 0)
+
+
+def _reject_equal_memory(buf, lens, state):
+    mem, mem_lens = state['mem']
+    width = max(buf.shape[1], mem.shape[1])
+    return (lens == mem_lens) & (_widen(buf, width) == _widen(mem, width)).all(axis=1)
+
+
+def _reject_at(n, c):
+    return _reject(lambda buf, lens, state: (lens <= n) | (_at(buf, lens, n) != c))
+
+
+def _reject_less_than(n, c):
+    return _reject(lambda buf, lens, state: ((buf == c) & _valid(buf, lens)).sum(axis=1) < n)
+
+
+batch_map_no_args = {
+    'l': _map_table(LOWER),
+    'u': _map_table(UPPER),
+    't': _map_table(SWAP),
+    'c': _capitalize(UPPER, LOWER),
+    'C': _capitalize(LOWER, UPPER),
+    'r': _reverse,
+    'd': _duplicate_n(1),
+    'f': _reflect,
+    '{': _rotate(1),
+    '}': _rotate(-1),
+    '[': _truncate_left,
+    ']': _truncate_right,
+    'q': _duplicate_all,
+    'k': _swap_front,
+    'K': _swap_back,
+    'E': _title(32),
+    'M': _memorize,
+    '4': _append_memory,
+    '6': _prepend_memory,
+    'Q': _reject(_reject_equal_memory),
+}
+
+# key -> (builder, argument kinds), 'n' is a base 36 number and 'c' a byte
+batch_map = {
+    'T': (_toggle_at, 'n'),
+    'p': (_duplicate_n, 'n'),
+    'D': (_delete_at, 'n'),
+    'x': (_extract, 'nn'),
+    'O': (_omit, 'nn'),
+    'i': (_insert, 'nc'),
+    'o': (_overwrite, 'nc'),
+    "'": (_truncate_at, 'n'),
+    's': (_replace, 'cc'),
+    '@': (_purge, 'c'),
+    'z': (_duplicate_first, 'n'),
+    'Z': (_duplicate_last, 'n'),
+    '*': (_swap, 'nn'),
+    'L': (lambda n: _byte_op(n, lambda c: c << 1), 'n'),
+    'R': (lambda n: _byte_op(n, lambda c: c >> 1), 'n'),
+    '+': (lambda n: _byte_op(n, lambda c: c + 1), 'n'),
+    '-': (lambda n: _byte_op(n, lambda c: c - 1), 'n'),
+    '.': (_replace_plus, 'n'),
+    ',': (_replace_minus, 'n'),
+    'y': (_duplicate_front, 'n'),
+    'Y': (_duplicate_back, 'n'),
+    'e': (_title, 'c'),
+    '3': (_title_n, 'nc'),
+    'X': (_extract_memory, 'nnn'),
+    '<': (lambda n: _reject(lambda buf, lens, state: lens > n), 'n'),
+    '>': (lambda n: _reject(lambda buf, lens, state: lens < n), 'n'),
+    '_': (lambda n: _reject(lambda buf, lens, state: lens != n), 'n'),
+    '!': (lambda c: _reject(lambda buf, lens, state: ((buf == c) & _valid(buf, lens)).any(axis=1)), 'c'),
+    '/': (lambda c: _reject(lambda buf, lens, state: ~((buf == c) & _valid(buf, lens)).any(axis=1)), 'c'),
+    '(': (lambda c: _reject(lambda buf, lens, state: (lens == 0) | (buf[:, 0] != c)), 'c'),
+    ')': (lambda c: _reject(lambda buf, lens, state: (lens == 0) | (_last(buf, lens) != c)), 'c'),
+    '=': (_reject_at, 'nc'),
+    '%': (_reject_less_than, 'nc'),
+}
+
+
+def _last(buf, lens):
+    return buf[np.arange(buf.shape[0]), np.maximum(lens - 1, 0)]
+
+
+def compile_batch_rule(rule, encoding: str = 'latin-1'):
+    """
+    Compile a parsed rule into a list of array kernels. Returns None if the rule
+    uses something the batch mode can't express, e.g. the positional argument
+    'p' or a character which is not a single byte in the given encoding.
+    """
+    kernels = []
+    for key, remain in fuse_rule(rule):
+        if key in '$^':
+            try:
+                data = remain.encode(encoding)
+            except UnicodeEncodeError:
+                return None
+            kernels.append(_append(data) if key == '$' else _prepend(data))
+        elif key in batch_map_no_args:
+            kernels.append(batch_map_no_args[key])
+        elif key in batch_map:
+            builder, kinds = batch_map[key]
+            args = []
+            for a, kind in zip(remain, kinds):
+                if kind == 'n':
+                    if a == 'p':
+                        return None
+                    args.append(int(a, 36))
+                else:
+                    try:
+                        a = a.encode(encoding)
+                    except UnicodeEncodeError:
+                        return None
+                    if len(a) != 1:
+                        return None
+                    args.append(a[0])
+            kernels.append(builder(*args))
+        else:
+            return None
+    return kernels
+
+
+def run_kernels(kernels, buf: np.ndarray, lens: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Apply compiled kernels to a byte matrix. Returns the new matrix, the
+    lengths and a mask of the rows which were not rejected.
+    """
+    state = {
+        'mem': (np.zeros((buf.shape[0], 1), dtype=np.uint8), np.zeros_like(lens)),
+        'alive': np.ones(buf.shape[0], dtype=bool),
+    }
+    for kernel in kernels:
+        buf, lens = kernel(buf, lens, state)
+        if not state['alive'].any():
+            break
+    return buf, lens, state['alive']
+
+
+def apply_batch(engine, words: Sequence[str], encoding: str = 'latin-1',
+                chunk_size: int = 65536) -> Generator[Tuple[List[str], List[str]], None, None]:
+    """
+    Apply the rules of engine to a list of words. For every chunk of words, and
+    within the chunk for every rule in engine.indices, yields the candidates of
+    all words in the chunk together with the rule. Words rejected by the rule
+    have None as candidate. With encoding None words and candidates are bytes.
+    Rules that can't be compiled into kernels, and words which can't be
+    encoded, are applied word by word.
+    """
+    kernels = {}
+    rejected = [f for r in engine.rejected_rules for f in r]
+    for idx in engine.indices:
+        if idx not in kernels:
+            # rule arguments of engines working on bytes are latin-1
+            kernels[idx] = compile_batch_rule(engine.rules[idx] + rejected, encoding or 'latin-1')
+    for start in range(0, len(words), chunk_size):
+        chunk = words[start:start + chunk_size]
+        failed = []
+        buf, lens = encode_words(chunk, encoding, failed)
+        for idx in engine.indices:
+            rule = engine.rules[idx]
+            compiled = engine.compiled[idx]
+            if kernels[idx] is None:
+                ctx = RuleContext(engine.empty)
+                yield [compiled(w, ctx) for w in chunk], rule
+            else:
+                new_buf, new_lens, alive = run_kernels(kernels[idx], buf, lens)
+                candidates = decode_words(new_buf, new_lens, encoding, alive)
+                for i in failed:
+                    candidates[i] = compiled(chunk[i], RuleContext(engine.empty))
+                yield candidates, rule
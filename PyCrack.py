@@ -0,0 +1,214 @@
+"""
+Crack target hashes in the same process which generates the candidates.
+Candidates are hashed in batches and looked up in a compact table of the
+target digests, and every hit is reported with the word and the rule which
+generated it. For plaintext targets the hits of every rule are counted.
+"""
+import argparse
+import array
+import bisect
+import hashlib
+import struct
+import sys
+from typing import Callable, Generator, Iterable, Tuple
+
+from PyHashcat import TargetStore, iter_lines, read_rules, read_words, read_words_bytes
+from PyHitLog import HitLogWriter
+from PyRuleEngine import RuleEngine
+
+# digest size in bytes of the supported algorithms
+__digest_sizes__ = {'md5': 16, 'sha1': 20, 'sha256': 32, 'ntlm': 16}
+# order of the message words in the third round of MD4
+__md4_round3__ = (0, 8, 4, 12, 2, 10, 6, 14, 1, 9, 5, 13, 3, 11, 7, 15)
+
+
+def _md4(data: bytes) -> bytes:
+    """MD4 (RFC 1320) for hashlib builds without it, e.g. OpenSSL 3"""
+    mask = 0xffffffff
+    n = len(data)
+    data = data + b'\x80' + b'\x00' * ((55 - n) % 64) + struct.pack('<Q', n * 8)
+    h = [0x67452301, 0xefcdab89, 0x98badcfe, 0x10325476]
+    for offset in range(0, len(data), 64):
+        x = struct.unpack('<16I', data[offset:offset + 64])
+        a, b, c, d = h
+        for i in range(16):
+            t = (a + ((b & c) | (~b & d)) + x[i]) & mask
+            s = (3, 7, 11, 19)[i % 4]
+            a, b, c, d = d, (t << s | t >> (32 - s)) & mask, b, c
+        for i in range(16):
+            t = (a + ((b & c) | (b & d) | (c & d)) + x[i % 4 * 4 + i // 4] + 0x5a827999) & mask
+            s = (3, 5, 9, 13)[i % 4]
+            a, b, c, d = d, (t << s | t >> (32 - s)) & mask, b, c
+        for i in range(16):
+            t = (a + (b ^ c ^ d) + x[__md4_round3__[i]] + 0x6ed9eba1) & mask
+            s = (3, 9, 11, 15)[i % 4]
+            a, b, c, d = d, (t << s | t >> (32 - s)) & mask, b, c
+        h = [(v + w) & mask for v, w in zip(h, (a, b, c, d))]
+    return struct.pack('<4I', *h)
+
+
+def _md4_function() -> Callable[[bytes], bytes]:
+    try:
+        hashlib.new('md4')
+    except ValueError:
+        return _md4
+    return lambda data: hashlib.new('md4', data).digest()
+
+
+def hash_function(algorithm: str, encoding: str = 'utf-8') -> Callable[[bytes], bytes]:
+    """
+    Function returning the digest of an encoded candidate. NTLM hashes the
+    UTF-16LE encoding of the candidate, which is decoded with encoding first.
+    """
+    if algorithm == 'ntlm':
+        md4 = _md4_function()
+        return lambda data: md4(data.decode(encoding, 'surrogateescape').encode('utf-16le', 'surrogatepass'))
+    if algorithm not in __digest_sizes__:
+        raise ValueError(f"unsupported algorithm {algorithm}, choose from {', '.join(__digest_sizes__)}")
+    constructor = getattr(hashlib, algorithm)
+    return lambda data: constructor(data).digest()
+
+
+class DigestTable(object):
+    """
+    Compact set of digests of one size: the first 8 bytes of every digest in a
+    sorted array('Q'), used to find candidates with bisect, and the whole
+    digests in one bytes object in the same order, used to confirm them.
+    """
+
+    def __init__(self, digests: Iterable[bytes], size: int):
+        self.size = size
+        digests = sorted(set(digests))
+        self.prefixes = array.array('Q', (int.from_bytes(d[:8], 'big') for d in digests))
+        self.digests = b''.join(digests)
+
+    @classmethod
+    def from_file(cls, hash_path: str, algorithm: str) -> 'DigestTable':
+        """
+        Read hex digests, one per line. Anything after a ':' is ignored, as are
+        lines which are not a digest of the algorithm.
+        """
+        size = __digest_sizes__[algorithm]
+        digests = []
+        for _, line in iter_lines(hash_path):
+            line = line.split(b':', 1)[0].strip()
+            if len(line) != 2 * size:
+                continue
+            try:
+                digests.append(bytes.fromhex(line.decode('ascii')))
+            except ValueError:
+                continue
+        return cls(digests, size)
+
+    def __contains__(self, digest: bytes) -> bool:
+        prefixes = self.prefixes
+        prefix = int.from_bytes(digest[:8], 'big')
+        i = bisect.bisect_left(prefixes, prefix)
+        size = self.size
+        while i < len(prefixes) and prefixes[i] == prefix:
+            if self.digests[i * size:(i + 1) * size] == digest:
+                return True
+            i += 1
+        return False
+
+    def __len__(self) -> int:
+        return len(self.prefixes)
+
+
+def crack(engine: RuleEngine, words: Iterable, table: DigestTable, algorithm: str, batch_size: int = 4096,
+          encoding: str = 'utf-8', unique: bool = True) -> Generator[Tuple[str, list, str, str], None, None]:
+    """
+    Apply the rules of engine to words and yield (candidate, word, rule, hex
+    digest) for every candidate whose digest is in table. With unique=True
+    every digest is reported once, for the first candidate hitting it.
+    """
+    digest = hash_function(algorithm, encoding)
+    found = set()
+    rules = engine.rules
+    binary = engine.binary
+    batch = []
+    for word in words:
+        for idx, candidate in engine.apply_indexed(word):
+            batch.append((candidate, word, idx))
+        if len(batch) >= batch_size:
+            yield from _check(batch, digest, table, found, rules, binary, encoding, unique)
+            batch = []
+    yield from _check(batch, digest, table, found, rules, binary, encoding, unique)
+
+
+def _check(batch, digest, table, found, rules, binary, encoding, unique):
+    if binary:
+        digests = [digest(candidate) for candidate, _, _ in batch]
+    else:
+        digests = [digest(candidate.encode(encoding, 'surrogateescape')) for candidate, _, _ in batch]
+    for (candidate, word, idx), d in zip(batch, digests):
+        if d in table and not (unique and d in found):
+            found.add(d)
+            yield candidate, word, rules[idx], d.hex()
+
+
+def count_hits(engine: RuleEngine, words: Iterable, targets: TargetStore,
+               hit_log: HitLogWriter = None) -> array.array:
+    """
+    Count for every rule how many plaintext targets its candidates hit, a
+    target occurring n times in the target list counts n times. The rules
+    hitting a word are written to hit_log, if given.
+    """
+    hits = array.array('Q', bytes(8 * len(engine.rules)))
+    count = targets.count
+    for word in words:
+        rule_ids = []
+        for idx, candidate in engine.apply_indexed(word):
+            n = count(candidate)
+            if n:
+                hits[idx] += n
+                rule_ids.append(idx)
+        if hit_log is not None and rule_ids:
+            if isinstance(word, bytes):
+                word = word.decode('utf-8', 'surrogateescape')
+            hit_log.write(word, rule_ids)
+    return hits
+
+
+def wrapper():
+    cli = argparse.ArgumentParser('Crack hashes with rules')
+    cli.add_argument('-w', '--words', dest='words', required=True, help='word list')
+    cli.add_argument('-r', '--rules', dest='rules', required=True, help='rule file')
+    cli.add_argument('-t', '--target', dest='target', required=True, help='target hashes or passwords')
+    cli.add_argument('-m', '--mode', dest='mode', choices=list(__digest_sizes__) + ['plain'], default='md5',
+                     help='hash algorithm of the targets, plain counts the hits of every rule on passwords')
+    cli.add_argument('-s', '--save', dest='save', help='save result')
+    cli.add_argument('-b', '--binary', dest='binary', action='store_true',
+                     help='apply the rules to the bytes of the words, like hashcat')
+    cli.add_argument('-H', '--hit-log', dest='hit_log', default=None,
+                     help='save the rules hitting every word as a binary hit log, in plain mode')
+    args = cli.parse_args()
+    if args.save is not None:
+        f_out = open(args.save, 'w')
+    else:
+        f_out = sys.stdout
+    rules = read_rules(args.rules)
+    engine = RuleEngine(rules, binary=args.binary)
+    words = read_words_bytes(args.words) if args.binary else read_words(args.words)
+    words = (word for _, word in words)
+    if args.mode == 'plain':
+        if args.hit_log is not None:
+            with open(args.hit_log, 'wb') as f_log, HitLogWriter(f_log, rules) as hit_log:
+                hits = count_hits(engine, words, TargetStore.from_file(args.target), hit_log)
+        else:
+            hits = count_hits(engine, words, TargetStore.from_file(args.target))
+        for rule, n in zip(rules, hits):
+            f_out.write(f"{rule}\t{n}\n")
+    else:
+        table = DigestTable.from_file(args.target, args.mode)
+        for candidate, word, rule, digest in crack(engine, words, table, args.mode):
+            if args.binary:
+                candidate = candidate.decode('utf-8', 'surrogateescape')
+                word = word.decode('utf-8', 'surrogateescape')
+            f_out.write(f"{digest}:{candidate}\t{word}\t{''.join(rule)}\n")
+    f_out.flush()
+    f_out.close()
+
+
+if __name__ == '__main__':
+    wrapper()
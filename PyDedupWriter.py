@@ -0,0 +1,173 @@
+"""
+Write candidates without duplicates using bounded memory. Duplicates of the
+same base word are removed exactly with a set, duplicates across base words
+with a Bloom filter, which may drop a small configurable fraction of unique
+candidates (its false positive rate) but never lets a duplicate through.
+Candidates are written in large buffered blocks of bytes.
+"""
+import argparse
+import hashlib
+import math
+import sys
+from typing import BinaryIO, Dict, Iterable, Tuple
+
+from PyHashcat import read_rules, read_words, read_words_bytes
+from PyRuleEngine import RuleEngine
+
+
+class BloomFilter(object):
+    """
+    Bloom filter over bytes. Positions are derived from a blake2b digest, so a
+    filter saved by one process gives the same answers in another.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: bytes):
+        digest = hashlib.blake2b(item, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def add(self, item: bytes) -> bool:
+        """Add item, and return whether it was (probably) already there"""
+        bits = self.bits
+        present = True
+        for pos in self._positions(item):
+            byte, mask = pos >> 3, 1 << (pos & 7)
+            if not bits[byte] & mask:
+                present = False
+                bits[byte] |= mask
+        return present
+
+    def __contains__(self, item: bytes) -> bool:
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def save(self, f_out: BinaryIO):
+        f_out.write(b'%d %r %d\n' % (self.capacity, self.error_rate, len(self.bits)))
+        f_out.write(self.bits)
+
+    @classmethod
+    def load(cls, f_in: BinaryIO) -> 'BloomFilter':
+        capacity, error_rate, n_bytes = f_in.readline().split()
+        bloom = cls(int(capacity), float(error_rate))
+        bloom.bits = bytearray(f_in.read(int(n_bytes)))
+        return bloom
+
+
+class DedupWriter(object):
+    """
+    Feed it the (candidate, rule) pairs of RuleEngine.apply, one base word at a
+    time, and it writes every new candidate followed by a newline to f_out,
+    which must be opened in binary mode. Candidates of an engine working on
+    bytes are written as they are.
+    >>> import io
+    >>> f_out = io.BytesIO()
+    >>> writer = DedupWriter(f_out, capacity=1000)
+    >>> engine = RuleEngine([':', 'l', 'c', '$1'])
+    >>> for word in ['Password', 'password']:
+    ...     writer.feed(engine.apply(word))
+    ...
+    >>> writer.flush()
+    >>> f_out.getvalue().split()
+    [b'Password', b'password', b'Password1', b'password1']
+    """
+
+    def __init__(self, f_out: BinaryIO, capacity: int = 10000000, error_rate: float = 0.001,
+                 buffer_size: int = 1 << 20, encoding: str = 'utf-8'):
+        self.f_out = f_out
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.buffer_size = buffer_size
+        self.encoding = encoding
+        self.buffer = []
+        self.buffered = 0
+        self.candidates = 0
+        self.word_duplicates = 0
+        self.global_duplicates = 0
+        self.written = 0
+        self.bytes_written = 0
+
+    def feed(self, results: Iterable[Tuple[str, list]]):
+        """Write the candidates generated from one base word"""
+        seen = set()
+        encoding = self.encoding
+        bloom_add = self.bloom.add
+        buffer = self.buffer
+        for candidate, _ in results:
+            self.candidates += 1
+            if candidate in seen:
+                self.word_duplicates += 1
+                continue
+            seen.add(candidate)
+            if isinstance(candidate, str):
+                candidate = candidate.encode(encoding, 'surrogateescape')
+            if bloom_add(candidate):
+                self.global_duplicates += 1
+                continue
+            buffer.append(candidate)
+            self.buffered += len(candidate) + 1
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.buffer.append(b'')
+            block = b'\n'.join(self.buffer)
+            self.f_out.write(block)
+            self.written += len(self.buffer) - 1
+            self.bytes_written += len(block)
+            self.buffer = []
+            self.buffered = 0
+        self.f_out.flush()
+
+    def stats(self) -> Dict[str, float]:
+        duplicates = self.word_duplicates + self.global_duplicates
+        return {
+            'candidates': self.candidates,
+            'written': self.written + len(self.buffer),
+            'bytes_written': self.bytes_written + self.buffered,
+            'word_duplicates': self.word_duplicates,
+            'global_duplicates': self.global_duplicates,
+            'duplicate_ratio': duplicates / self.candidates if self.candidates else 0.0,
+        }
+
+
+def wrapper():
+    cli = argparse.ArgumentParser('Generate candidates without duplicates')
+    cli.add_argument('-w', '--words', dest='words', required=True, help='word list')
+    cli.add_argument('-r', '--rules', dest='rules', required=True, help='rule file')
+    cli.add_argument('-s', '--save', dest='save', help='save candidates')
+    cli.add_argument('-c', '--capacity', dest='capacity', type=int, default=10000000,
+                     help='expected number of unique candidates')
+    cli.add_argument('-e', '--error-rate', dest='error_rate', type=float, default=0.001,
+                     help='false positive rate of the Bloom filter')
+    cli.add_argument('-b', '--binary', dest='binary', action='store_true',
+                     help='apply the rules to the bytes of the words, like hashcat')
+    args = cli.parse_args()
+    if args.save is not None:
+        f_out = open(args.save, 'wb')
+    else:
+        f_out = sys.stdout.buffer
+    engine = RuleEngine(read_rules(args.rules), binary=args.binary)
+    writer = DedupWriter(f_out, args.capacity, args.error_rate)
+    words = read_words_bytes(args.words) if args.binary else read_words(args.words)
+    for _, word in words:
+        writer.feed(engine.apply(word))
+    writer.flush()
+    f_out.close()
+    stats = writer.stats()
+    print(f"candidates: {stats['candidates']}, written: {stats['written']}, "
+          f"duplicates: {stats['word_duplicates']} same word, {stats['global_duplicates']} across words "
+          f"({stats['duplicate_ratio']:.2%})", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    wrapper()
@@ -0,0 +1,251 @@
+"""
+Split a generation job into work units for several workers or hosts. A plan
+cuts the keyspace into chunks, each a range of lines of the word list times
+a range of rules, of about the same estimated cost, and stores them in a
+SQLite queue. Workers claim chunks from the queue one at a time, write the
+candidates of a chunk to their own file in a shared directory and record
+their statistics in the queue. Merging concatenates the chunk files in chunk
+order and sums the statistics, so the result doesn't depend on which worker
+did what. A chunk claimed by a worker which died is claimed again after a
+timeout.
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Dict, List, Sequence
+
+from PyEstimator import estimate, load_calibration, sample_words, split_rules, split_words
+from PyHashcat import read_rules, read_words_bytes
+from PyRuleEngine import RuleEngine
+from PyRuleParser import parse_rules
+
+__schema__ = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    word_start INTEGER, word_stop INTEGER,
+    rule_start INTEGER, rule_stop INTEGER,
+    cost REAL,
+    state TEXT DEFAULT 'pending',
+    worker TEXT, claimed REAL, finished REAL,
+    candidates TEXT
+);
+"""
+
+
+def plan_chunks(rules: Sequence[str], words_path: str, word_parts: int, rule_parts: int,
+                sample_size: int = 10000, seed: int = 0, calibration: Dict[str, float] = None) -> List[Dict]:
+    """
+    Chunks of about equal estimated cost: rule ranges of equal cost on a
+    sample of the words, times ranges of the same number of words. The rule
+    costs are the seconds predicted from the per function calibration of
+    load_calibration, or the candidates of every rule without one, so a plan
+    only depends on its input, not on the speed of the machine making it.
+    """
+    n_words, sample = sample_words(words_path, sample_size, seed)
+    result = estimate(rules, n_words, sample, calibration=calibration)
+    if calibration is not None:
+        costs = [r['seconds'] for r in result['rules']]
+    else:
+        costs = [max(r['candidates'], 1) for r in result['rules']]
+    chunks = []
+    for word_start, word_stop in split_words(n_words, word_parts):
+        for rule_start, rule_stop in split_rules(costs, rule_parts):
+            chunks.append({
+                'id': len(chunks),
+                'word_start': word_start, 'word_stop': word_stop,
+                'rule_start': rule_start, 'rule_stop': rule_stop,
+                'cost': sum(costs[rule_start:rule_stop]) * (word_stop - word_start) / max(n_words, 1),
+            })
+    return chunks
+
+
+def _connect(queue_path: str) -> sqlite3.Connection:
+    db = sqlite3.connect(queue_path, timeout=60, isolation_level=None)
+    db.executescript(__schema__)
+    return db
+
+
+def create_queue(queue_path: str, words_path: str, rules: Sequence[str], chunks: Sequence[Dict]):
+    """Store the job and its chunks in a new queue"""
+    db = _connect(queue_path)
+    with db:
+        db.execute('BEGIN IMMEDIATE')
+        if db.execute('SELECT COUNT(*) FROM chunks').fetchone()[0]:
+            raise ValueError(f"queue {queue_path} already has chunks")
+        db.executemany('INSERT INTO meta VALUES (?, ?)', [('words', os.path.abspath(words_path)),
+                                                         ('rules', json.dumps(list(rules)))])
+        db.executemany('INSERT INTO chunks (id, word_start, word_stop, rule_start, rule_stop, cost) '
+                       'VALUES (:id, :word_start, :word_stop, :rule_start, :rule_stop, :cost)', chunks)
+    db.close()
+
+
+def claim(db: sqlite3.Connection, worker: str, timeout: float = 3600.0):
+    """
+    Claim the first pending chunk, or a chunk whose worker claimed it more
+    than timeout seconds ago. Returns the chunk as a dict, None if there is
+    nothing left to do.
+    """
+    now = time.time()
+    with db:
+        db.execute('BEGIN IMMEDIATE')
+        row = db.execute("SELECT id, word_start, word_stop, rule_start, rule_stop FROM chunks "
+                         "WHERE state = 'pending' OR (state = 'running' AND claimed < ?) ORDER BY id LIMIT 1",
+                         (now - timeout,)).fetchone()
+        if row is None:
+            return None
+        db.execute("UPDATE chunks SET state = 'running', worker = ?, claimed = ? WHERE id = ?", (worker, now, row[0]))
+    return dict(zip(('id', 'word_start', 'word_stop', 'rule_start', 'rule_stop'), row))
+
+
+def chunk_path(out_dir: str, chunk_id: int) -> str:
+    return os.path.join(out_dir, 'chunk-%06d.txt' % chunk_id)
+
+
+def run_chunk(engine: RuleEngine, words_path: str, chunk: Dict, out_dir: str) -> List[int]:
+    """
+    Write the candidates of a chunk to its file and return the candidates of
+    every rule. The file is written under a name of its own and renamed, so a
+    worker running a chunk which was claimed again doesn't clash with the new
+    one.
+    """
+    engine.change_indices(range(chunk['rule_start'], chunk['rule_stop']))
+    candidates = [0] * (chunk['rule_stop'] - chunk['rule_start'])
+    rule_start = chunk['rule_start']
+    path = chunk_path(out_dir, chunk['id'])
+    words = read_words_bytes(words_path, chunk['word_start'])
+    fd, tmp_path = tempfile.mkstemp('.tmp', os.path.basename(path) + '.', out_dir)
+    with os.fdopen(fd, 'wb') as f_out:
+        for _, line in itertools.islice(words, chunk['word_stop'] - chunk['word_start']):
+            word = line.decode('utf-8', 'surrogateescape')
+            block = []
+            for idx, candidate in engine.apply_indexed(word):
+                candidates[idx - rule_start] += 1
+                block.append(candidate.encode('utf-8', 'surrogateescape'))
+            if block:
+                block.append(b'')
+                f_out.write(b'\n'.join(block))
+    os.replace(tmp_path, path)
+    return candidates
+
+
+def work(queue_path: str, out_dir: str, worker: str = None, timeout: float = 3600.0) -> int:
+    """Claim and run chunks until the queue is empty, return the number of chunks done"""
+    if worker is None:
+        worker = f'{socket.gethostname()}-{os.getpid()}'
+    db = _connect(queue_path)
+    meta = dict(db.execute('SELECT key, value FROM meta'))
+    # only the rules of the chunks claimed are compiled
+    engine = RuleEngine.from_tokens(tuple(map(list, parse_rules(json.loads(meta['rules'])))), indices=())
+    done = 0
+    while True:
+        chunk = claim(db, worker, timeout)
+        if chunk is None:
+            break
+        candidates = run_chunk(engine, meta['words'], chunk, out_dir)
+        with db:
+            db.execute("UPDATE chunks SET state = 'done', finished = ?, candidates = ? WHERE id = ? AND worker = ?",
+                       (time.time(), json.dumps(candidates), chunk['id'], worker))
+        done += 1
+    db.close()
+    return done
+
+
+def work_local(queue_path: str, out_dir: str, processes: int = None, timeout: float = 3600.0) -> int:
+    """Run workers in processes on this machine, return the number of chunks done"""
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    with multiprocessing.Pool(processes) as pool:
+        results = [pool.apply_async(work, (queue_path, out_dir, None, timeout)) for _ in range(processes)]
+        return sum(result.get() for result in results)
+
+
+def status(queue_path: str) -> Dict[str, int]:
+    """Number of chunks in every state"""
+    db = _connect(queue_path)
+    counts = dict(db.execute('SELECT state, COUNT(*) FROM chunks GROUP BY state'))
+    db.close()
+    return counts
+
+
+def merge(queue_path: str, out_dir: str, f_out) -> Dict:
+    """
+    Concatenate the chunk files in chunk order into f_out, opened in binary
+    mode, and return the candidates of every rule and in total.
+    """
+    db = _connect(queue_path)
+    meta = dict(db.execute('SELECT key, value FROM meta'))
+    rows = db.execute('SELECT id, rule_start, state, candidates FROM chunks ORDER BY id').fetchall()
+    db.close()
+    pending = [chunk_id for chunk_id, _, state, _ in rows if state != 'done']
+    if pending:
+        raise ValueError(f"{len(pending)} chunks are not done, e.g. chunk {pending[0]}")
+    per_rule = [0] * len(json.loads(meta['rules']))
+    for chunk_id, rule_start, _, candidates in rows:
+        for i, n in enumerate(json.loads(candidates)):
+            per_rule[rule_start + i] += n
+        with open(chunk_path(out_dir, chunk_id), 'rb') as f_chunk:
+            while True:
+                block = f_chunk.read(1 << 20)
+                if not block:
+                    break
+                f_out.write(block)
+    return {'chunks': len(rows), 'candidates': sum(per_rule), 'rules': per_rule}
+
+
+def wrapper():
+    cli = argparse.ArgumentParser('Distributed candidate generation')
+    commands = cli.add_subparsers(dest='command', required=True)
+    plan_cli = commands.add_parser('plan', help='split a job into chunks and queue them')
+    plan_cli.add_argument('-w', '--words', dest='words', required=True, help='word list')
+    plan_cli.add_argument('-r', '--rules', dest='rules', required=True, help='rule file')
+    plan_cli.add_argument('--word-parts', dest='word_parts', type=int, default=1)
+    plan_cli.add_argument('--rule-parts', dest='rule_parts', type=int, default=1)
+    plan_cli.add_argument('--sample', dest='sample', type=int, default=10000, help='words to estimate costs on')
+    plan_cli.add_argument('-c', '--calibration', dest='calibration',
+                          help='bench.py JSON results to predict the cost of the rules')
+    work_cli = commands.add_parser('work', help='claim and run chunks until the queue is empty')
+    work_cli.add_argument('-j', '--processes', dest='processes', type=int, default=1, help='number of workers')
+    work_cli.add_argument('--timeout', dest='timeout', type=float, default=3600.0,
+                          help='seconds after which a chunk still running is claimed again')
+    merge_cli = commands.add_parser('merge', help='merge the chunks of a finished job')
+    merge_cli.add_argument('-s', '--save', dest='save', help='save candidates')
+    commands.add_parser('status', help='count chunks by state')
+    for command in (plan_cli, work_cli, merge_cli, commands.choices['status']):
+        command.add_argument('-q', '--queue', dest='queue', required=True, help='SQLite queue file')
+    for command in (work_cli, merge_cli):
+        command.add_argument('-o', '--out-dir', dest='out_dir', required=True, help='directory of chunk files')
+    args = cli.parse_args()
+    if args.command == 'plan':
+        rules = read_rules(args.rules)
+        calibration = load_calibration(args.calibration) if args.calibration is not None else None
+        chunks = plan_chunks(rules, args.words, args.word_parts, args.rule_parts, args.sample,
+                             calibration=calibration)
+        create_queue(args.queue, args.words, rules, chunks)
+        print(f"chunks: {len(chunks)}", file=sys.stderr)
+    elif args.command == 'work':
+        os.makedirs(args.out_dir, exist_ok=True)
+        if args.processes > 1:
+            done = work_local(args.queue, args.out_dir, args.processes, args.timeout)
+        else:
+            done = work(args.queue, args.out_dir, timeout=args.timeout)
+        print(f"chunks done: {done}", file=sys.stderr)
+    elif args.command == 'merge':
+        f_out = open(args.save, 'wb') if args.save is not None else sys.stdout.buffer
+        stats = merge(args.queue, args.out_dir, f_out)
+        f_out.flush()
+        f_out.close()
+        print(f"chunks: {stats['chunks']}, candidates: {stats['candidates']}", file=sys.stderr)
+    else:
+        print(json.dumps(status(args.queue)))
+
+
+if __name__ == '__main__':
+    wrapper()
@@ -0,0 +1,180 @@
+"""
+Estimate how many candidates a rule set generates on a word list, and how
+long it takes, without generating them. The rules are applied to a random
+sample of the words: rules without reject functions or length filters give
+one candidate per word, so their count is exact, the others are estimated
+from their pass rate on the sample. The runtime of every rule is measured on
+the sample, or predicted from the per function throughput of a bench.py
+result. The estimates are used to split a job into balanced parts.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from typing import Dict, List, Sequence, Tuple
+
+from PyHashcat import read_rules, read_words
+from PyRuleEngine import RuleContext, RuleEngine, is_reject
+
+
+def sample_words(words_path: str, size: int = 10000, seed: int = 0) -> Tuple[int, List[str]]:
+    """Number of words of the word list and a uniform sample of them (reservoir sampling)"""
+    rng = random.Random(seed)
+    sample = []
+    n = 0
+    for n, (_, word) in enumerate(read_words(words_path), 1):
+        if len(sample) < size:
+            sample.append(word)
+        else:
+            i = rng.randrange(n)
+            if i < size:
+                sample[i] = word
+    return n, sample
+
+
+def load_calibration(bench_path: str) -> Dict[str, float]:
+    """Seconds per candidate of every function, from the 'function/' results of bench.py"""
+    with open(bench_path) as f_in:
+        results = json.load(f_in)['results']
+    return {name[len('function/'):]: 1 / result['candidates_per_second']
+            for name, result in results.items()
+            if name.startswith('function/') and result['candidates_per_second']}
+
+
+def estimate(rules: Sequence[str], n_words: int, sample: Sequence[str], rejected_rules: Sequence[str] = None,
+             min_length: int = 0, max_length: int = None, calibration: Dict[str, float] = None) -> dict:
+    """
+    Estimate the candidates and the runtime of every rule on n_words words, of
+    which sample is a uniform sample. Candidates shorter than min_length or
+    longer than max_length are not counted. The duplicate ratio is the one of
+    the candidates of the sample, and only a lower bound for the whole list,
+    where more candidates collide.
+    >>> result = estimate([':', '$1', '>5'], 1000, ['pass', 'password', 'abc', 'monkey'])
+    >>> [(r['rule'], r['candidates'], r['exact']) for r in result['rules']]
+    [(':', 1000, True), ('$1', 1000, True), ('>5', 500, False)]
+    """
+    engine = RuleEngine(rules, rejected_rules)
+    length_filter = min_length > 0 or max_length is not None
+    if max_length is None:
+        max_length = float('inf')
+    complete = len(sample) >= n_words
+    scale = n_words / len(sample) if sample else 0.0
+    ctx = RuleContext()
+    seen = set()
+    sample_candidates = 0
+    per_rule = []
+    for idx, (rule, compiled) in enumerate(zip(rules, engine.compiled)):
+        start = time.perf_counter()
+        candidates = [compiled(word, ctx) for word in sample]
+        elapsed = time.perf_counter() - start
+        candidates = [c for c in candidates if c is not None and min_length <= len(c) <= max_length]
+        sample_candidates += len(candidates)
+        seen.update(candidates)
+        rejects = any(is_reject(f[0]) for f in engine.rules[idx]) or bool(engine.rejected_rules)
+        exact = complete or not (rejects or length_filter)
+        if calibration is not None:
+            default = max(calibration.values()) if calibration else 0.0
+            seconds = n_words * sum(calibration.get(f[0], default) for f in engine.rules[idx])
+        else:
+            seconds = elapsed * scale
+        per_rule.append({
+            'rule': rule,
+            'candidates': n_words if exact and not complete else round(len(candidates) * scale),
+            'exact': exact,
+            'seconds': seconds,
+        })
+    duplicate_ratio = 1 - len(seen) / sample_candidates if sample_candidates else 0.0
+    candidates = sum(r['candidates'] for r in per_rule)
+    return {
+        'words': n_words,
+        'sample': len(sample),
+        'rules': per_rule,
+        'candidates': candidates,
+        'duplicate_ratio': duplicate_ratio,
+        'unique_candidates': round(candidates * (1 - duplicate_ratio)),
+        'seconds': sum(r['seconds'] for r in per_rule),
+    }
+
+
+def split_rules(seconds: Sequence[float], parts: int) -> List[Tuple[int, int]]:
+    """
+    Split the rules into at most parts contiguous (start, stop) ranges of about
+    the same total runtime.
+    >>> split_rules([1, 1, 1, 1, 4], 2)
+    [(0, 4), (4, 5)]
+    """
+    parts = max(1, min(parts, len(seconds)))
+    total = sum(seconds)
+    ranges = []
+    start = 0
+    done = 0.0
+    for idx, s in enumerate(seconds):
+        done += s
+        remaining_parts = parts - len(ranges) - 1
+        remaining_rules = len(seconds) - idx - 1
+        if remaining_parts and (done >= total * (len(ranges) + 1) / parts or remaining_rules == remaining_parts):
+            ranges.append((start, idx + 1))
+            start = idx + 1
+    ranges.append((start, len(seconds)))
+    return ranges
+
+
+def split_words(n_words: int, parts: int) -> List[Tuple[int, int]]:
+    """
+    Split the words into at most parts ranges of 1-based line numbers, as
+    (start_at, stop_before), like the start_at of read_words.
+    >>> split_words(10, 3)
+    [(1, 5), (5, 8), (8, 11)]
+    """
+    parts = max(1, min(parts, n_words))
+    step, extra = divmod(n_words, parts)
+    ranges = []
+    start = 1
+    for i in range(parts):
+        stop = start + step + (1 if i < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def wrapper():
+    cli = argparse.ArgumentParser('Estimate candidates and runtime of rules')
+    cli.add_argument('-w', '--words', dest='words', required=True, help='word list')
+    cli.add_argument('-r', '--rules', dest='rules', required=True, help='rule file')
+    cli.add_argument('-s', '--save', dest='save', help='save the estimate as JSON')
+    cli.add_argument('--sample', dest='sample', type=int, default=10000, help='number of words to sample')
+    cli.add_argument('--seed', dest='seed', type=int, default=0)
+    cli.add_argument('--min-length', dest='min_length', type=int, default=0, help='shortest candidate to count')
+    cli.add_argument('--max-length', dest='max_length', type=int, default=None, help='longest candidate to count')
+    cli.add_argument('-c', '--calibration', dest='calibration', help='bench.py JSON results to predict runtime')
+    cli.add_argument('-p', '--parts', dest='parts', type=int, default=1, help='split the job into parts')
+    cli.add_argument('--split', dest='split', choices=['rules', 'words'], default='rules',
+                     help='split the job by rules or by words')
+    args = cli.parse_args()
+    rules = read_rules(args.rules)
+    n_words, sample = sample_words(args.words, args.sample, args.seed)
+    calibration = load_calibration(args.calibration) if args.calibration is not None else None
+    result = estimate(rules, n_words, sample, min_length=args.min_length, max_length=args.max_length,
+                      calibration=calibration)
+    if args.split == 'rules':
+        result['parts'] = [{'rules': [start, stop], 'words': [1, n_words + 1],
+                            'seconds': sum(r['seconds'] for r in result['rules'][start:stop])}
+                           for start, stop in split_rules([r['seconds'] for r in result['rules']], args.parts)]
+    else:
+        result['parts'] = [{'rules': [0, len(rules)], 'words': [start, stop],
+                            'seconds': result['seconds'] * (stop - start) / n_words}
+                           for start, stop in split_words(n_words, args.parts)]
+    if args.save is not None:
+        with open(args.save, 'w') as f_out:
+            json.dump(result, f_out, indent=2)
+    print(f"words: {n_words}, rules: {len(rules)}, candidates: {result['candidates']}, "
+          f"unique: {result['unique_candidates']} ({result['duplicate_ratio']:.2%} duplicates), "
+          f"time: {result['seconds']:.1f} s", file=sys.stderr)
+    for i, part in enumerate(result['parts']):
+        print(f"part {i}: rules {part['rules'][0]}-{part['rules'][1]}, "
+              f"words {part['words'][0]}-{part['words'][1]}, time: {part['seconds']:.1f} s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    wrapper()
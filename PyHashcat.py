@@ -1,6 +1,11 @@
+import array
+import bisect
 import collections
+import hashlib
+import mmap
+import os
 from collections import defaultdict
-from typing import Dict, List, Generator, Tuple
+from typing import Dict, Iterable, List, Generator, Tuple
 
 
 def read_rules(rule_path) -> List[str]:
@@ -42,3 +47,180 @@ def read_target(target_path) -> Dict[str, int]:
             pwd_set[line] += 1
         pass
     return pwd_set
+
+
+"""
+Readers for very large files. Lines are read as bytes from a memory map, no
+text decoding is done, and lines of the form $HEX[...] are decoded to the
+bytes they stand for.
+"""
+
+
+def decode_hex(line: bytes) -> bytes:
+    """Decode hashcat's $HEX[...] notation, other lines are returned as they are"""
+    if line[:5] == b'$HEX[' and line[-1:] == b']':
+        try:
+            return bytes.fromhex(line[5:-1].decode('ascii'))
+        except ValueError:
+            pass
+    return line
+
+
+def iter_lines(path: str, offset: int = 0) -> Generator[Tuple[int, bytes], None, None]:
+    """
+    Yield (byte offset, line) for each line of the file, starting at the given
+    byte offset, which must be the start of a line.
+    """
+    with open(path, 'rb') as f_in:
+        size = os.fstat(f_in.fileno()).st_size
+        if size <= offset:
+            return
+        with mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            find = mm.find
+            while offset < size:
+                end = find(b'\n', offset)
+                if end < 0:
+                    end = size
+                line = mm[offset:end]
+                if line[-1:] == b'\r':
+                    line = line[:-1]
+                yield offset, decode_hex(line)
+                offset = end + 1
+
+
+__index_magic__ = b'PYHCIDX1'
+# (path, size, mtime_ns) -> (step, offsets) of the indexes which couldn't be saved
+_unsaved_indexes = {}
+
+
+def _index_path(path: str) -> str:
+    return path + '.idx'
+
+
+def build_line_index(path: str, step: int = 4096) -> Tuple[int, array.array]:
+    """
+    Index the byte offset of every step-th line of a file, and save the index
+    next to it, or keep it in memory if it can't be saved. Returns step and
+    the offsets.
+    """
+    offsets = array.array('Q')
+    with open(path, 'rb') as f_in:
+        stat = os.fstat(f_in.fileno())
+        if stat.st_size:
+            with mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                offset = 0
+                line = 0
+                while offset < stat.st_size:
+                    if line % step == 0:
+                        offsets.append(offset)
+                    end = mm.find(b'\n', offset)
+                    if end < 0:
+                        break
+                    offset = end + 1
+                    line += 1
+    try:
+        with open(_index_path(path), 'wb') as f_idx:
+            f_idx.write(b'%s %d %d %d\n' % (__index_magic__, stat.st_size, stat.st_mtime_ns, step))
+            f_idx.write(offsets.tobytes())
+    except OSError:
+        _unsaved_indexes[path, stat.st_size, stat.st_mtime_ns] = step, offsets
+    return step, offsets
+
+
+def load_line_index(path: str, step: int = 4096) -> Tuple[int, array.array]:
+    """Load the saved line index of a file, rebuilding it if the file changed"""
+    stat = os.stat(path)
+    unsaved = _unsaved_indexes.get((path, stat.st_size, stat.st_mtime_ns))
+    if unsaved is not None:
+        return unsaved
+    try:
+        with open(_index_path(path), 'rb') as f_idx:
+            magic, size, mtime_ns, saved_step = f_idx.readline().split()
+            if magic == __index_magic__ and int(size) == stat.st_size and int(mtime_ns) == stat.st_mtime_ns:
+                offsets = array.array('Q')
+                offsets.frombytes(f_idx.read())
+                return int(saved_step), offsets
+    except (OSError, ValueError):
+        pass
+    return build_line_index(path, step)
+
+
+def seek_line(path: str, line: int) -> int:
+    """Byte offset of the line with the given 0-based number, using the line index"""
+    step, offsets = load_line_index(path)
+    if not offsets:
+        return 0
+    block = min(line // step, len(offsets) - 1)
+    offset = offsets[block]
+    remaining = line - block * step
+    if remaining:
+        with open(path, 'rb') as f_in:
+            with mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for _ in range(remaining):
+                    end = mm.find(b'\n', offset)
+                    if end < 0:
+                        return len(mm)
+                    offset = end + 1
+    return offset
+
+
+def read_words_bytes(words_path: str, start_at: int = 1) -> Generator[Tuple[int, bytes], None, None]:
+    """
+    Like read_words, but yields lines as bytes and jumps to start_at (a line
+    number) through the line index instead of reading the lines before it.
+    """
+    start_at = max(1, start_at)
+    offset = seek_line(words_path, start_at - 1) if start_at > 1 else 0
+    for idx, (_, line) in enumerate(iter_lines(words_path, offset), start_at - 1):
+        yield idx, line
+
+
+def digest64(item) -> int:
+    """64 bit digest used by TargetStore"""
+    if isinstance(item, str):
+        item = item.encode('utf-8', 'surrogateescape')
+    return int.from_bytes(hashlib.blake2b(item, digest_size=8).digest(), 'little')
+
+
+class TargetStore(object):
+    """
+    Compact set of targets with counts: a sorted array of 64 bit digests of
+    the targets and a parallel array of how often each one occurred, i.e. 12
+    bytes per distinct target instead of a dict of strings. Membership is
+    decided on the digest, so a false positive has a chance of about
+    len(store) / 2 ** 64.
+    """
+
+    def __init__(self, targets: Iterable = ()):
+        digests = sorted(map(digest64, targets))
+        self.digests = array.array('Q')
+        self.counts = array.array('I')
+        for digest in digests:
+            if self.digests and self.digests[-1] == digest:
+                self.counts[-1] += 1
+            else:
+                self.digests.append(digest)
+                self.counts.append(1)
+
+    @classmethod
+    def from_file(cls, target_path: str) -> 'TargetStore':
+        return cls(line for _, line in iter_lines(target_path))
+
+    def find(self, item) -> int:
+        """Index of item among the distinct targets, -1 if it isn't one"""
+        digest = digest64(item)
+        i = bisect.bisect_left(self.digests, digest)
+        if i < len(self.digests) and self.digests[i] == digest:
+            return i
+        return -1
+
+    def __contains__(self, item) -> bool:
+        return self.find(item) >= 0
+
+    def count(self, item) -> int:
+        """How often item occurs in the targets, 0 if it doesn't"""
+        i = self.find(item)
+        return self.counts[i] if i >= 0 else 0
+
+    def __len__(self) -> int:
+        return len(self.digests)
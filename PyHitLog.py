@@ -0,0 +1,293 @@
+"""
+Binary hit log: which rules hit for which words, as read by
+PyRuleEngineDelete. It replaces the JSON lines log, a JSON meta line with the
+rules followed by a [word, rule_ids] line for every word, whose decoding
+dominates reading large logs.
+
+The file starts with a header of the magic, the version and the rule table,
+every rule a varint length and its UTF-8 bytes. The records follow in chunks
+of chunk_size records, stored by column so that a chunk is decoded with a few
+calls instead of a loop over its bytes: a chunk header of varints (number of
+records, number of rule ids, length of the words) and the type codes of its
+arrays, then the length of every word, the number of rule ids of every word,
+the words in UTF-8 and the rule ids, each array with the smallest unsigned
+type holding its values. Closing the writer appends an index of the offset
+and the number of records of every chunk, which lets readers start at any
+chunk. A log without index, e.g. of a writer which didn't finish, is read up
+to its last complete chunk.
+"""
+import argparse
+import array
+import json
+import mmap
+import os
+import struct
+import sys
+from json import JSONDecodeError
+from typing import BinaryIO, Generator, Iterable, List, Sequence, Tuple
+
+__magic__ = b'PyHL'
+__version__ = 1
+# offset of the index and magic, at the end of a closed log
+__footer__ = struct.Struct('<Q4s')
+__index_magic__ = b'PyHI'
+
+
+def encode_varint(n: int, out: bytearray):
+    while n >= 0x80:
+        out.append(n & 0x7f | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def decode_varint(data, pos: int) -> Tuple[int, int]:
+    """The varint at pos and the position after it"""
+    n = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _encode_string(string: str, out: bytearray):
+    data = string.encode('utf-8', 'surrogatepass')
+    encode_varint(len(data), out)
+    out += data
+
+
+def _pack(values: List[int]) -> array.array:
+    """values in the smallest unsigned array, little endian"""
+    top = max(values, default=0)
+    packed = array.array('B' if top < 1 << 8 else 'H' if top < 1 << 16 else 'I', values)
+    if sys.byteorder != 'little':
+        packed.byteswap()
+    return packed
+
+
+def _unpack(typecode: str, data) -> List[int]:
+    values = array.array(typecode, data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values.tolist()
+
+
+class HitLogWriter(object):
+    """
+    >>> import io
+    >>> f_log = io.BytesIO()
+    >>> with HitLogWriter(f_log, ['$1', 'u', 'D2']) as writer:
+    ...     writer.write('password', [0, 2])
+    ...     writer.write('abc', [1])
+    >>> log = HitLogReader(f_log.getvalue())
+    >>> log.rules, list(log)
+    (['$1', 'u', 'D2'], [('password', [0, 2]), ('abc', [1])])
+    """
+
+    def __init__(self, f_out: BinaryIO, rules: Sequence[str], chunk_size: int = 65536):
+        self.f_out = f_out
+        self.chunk_size = chunk_size
+        header = bytearray(__magic__ + struct.pack('<H', __version__))
+        encode_varint(len(rules), header)
+        for rule in rules:
+            _encode_string(rule, header)
+        f_out.write(header)
+        self.offset = len(header)
+        self.chunks = []
+        self._clear()
+
+    def _clear(self):
+        self.words = []
+        self.counts = []
+        self.rule_ids = []
+
+    def write(self, word: str, rule_ids: Iterable[int]):
+        n = len(self.rule_ids)
+        self.rule_ids.extend(rule_ids)
+        self.words.append(word)
+        self.counts.append(len(self.rule_ids) - n)
+        if len(self.words) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Write the records written so far as a chunk"""
+        if not self.words:
+            return
+        text = ''.join(self.words).encode('utf-8', 'surrogatepass')
+        lengths = _pack([len(word) for word in self.words])
+        counts = _pack(self.counts)
+        rule_ids = _pack(self.rule_ids)
+        chunk = bytearray()
+        for n in (len(self.words), len(self.rule_ids), len(text)):
+            encode_varint(n, chunk)
+        chunk += (lengths.typecode + counts.typecode + rule_ids.typecode).encode('ascii')
+        chunk += lengths.tobytes() + counts.tobytes() + text + rule_ids.tobytes()
+        self.f_out.write(chunk)
+        self.chunks.append((self.offset, len(self.words)))
+        self.offset += len(chunk)
+        self._clear()
+
+    def close(self):
+        """Write the last chunk and the index, the file stays open"""
+        self.flush()
+        index = bytearray()
+        encode_varint(len(self.chunks), index)
+        last = 0
+        for offset, n_records in self.chunks:
+            encode_varint(offset - last, index)
+            encode_varint(n_records, index)
+            last = offset
+        self.f_out.write(bytes(index) + __footer__.pack(self.offset, __index_magic__))
+        self.f_out.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class HitLogReader(object):
+    """
+    Reader of a hit log, a path, which is memory mapped, or the bytes of a
+    log. chunks is the list of (offset, number of records) of the index, None
+    if the log has none.
+    """
+
+    def __init__(self, log):
+        if isinstance(log, (str, os.PathLike)):
+            with open(log, 'rb') as f_log:
+                log = mmap.mmap(f_log.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = log
+        if log[:4] != __magic__:
+            raise ValueError("not a hit log")
+        version, = struct.unpack_from('<H', log, 4)
+        if version != __version__:
+            raise ValueError(f"unsupported hit log version {version}")
+        n_rules, pos = decode_varint(log, 6)
+        self.rules = []
+        for _ in range(n_rules):
+            length, pos = decode_varint(log, pos)
+            self.rules.append(bytes(log[pos:pos + length]).decode('utf-8', 'surrogatepass'))
+            pos += length
+        self.start = pos
+        self.end = len(log)
+        self.chunks = None
+        if len(log) - pos >= __footer__.size:
+            index_offset, magic = __footer__.unpack_from(log, len(log) - __footer__.size)
+            if magic == __index_magic__ and pos <= index_offset <= len(log) - __footer__.size:
+                self.end = index_offset
+                self.chunks = []
+                n_chunks, pos = decode_varint(log, index_offset)
+                offset = 0
+                for _ in range(n_chunks):
+                    delta, pos = decode_varint(log, pos)
+                    n_records, pos = decode_varint(log, pos)
+                    offset += delta
+                    self.chunks.append((offset, n_records))
+
+    def _chunk(self, pos: int):
+        """Records of the chunk at pos and the position after it, None if it is incomplete"""
+        data = self.data
+        try:
+            n_records, pos = decode_varint(data, pos)
+            n_ids, pos = decode_varint(data, pos)
+            text_size, pos = decode_varint(data, pos)
+        except IndexError:
+            return None, pos
+        typecodes = bytes(data[pos:pos + 3]).decode('latin-1')
+        if len(typecodes) < 3 or not all(typecode in 'BHI' for typecode in typecodes):
+            return None, pos
+        pos += 3
+        sizes = [n_records * array.array(typecodes[0]).itemsize, n_records * array.array(typecodes[1]).itemsize,
+                 text_size, n_ids * array.array(typecodes[2]).itemsize]
+        if pos + sum(sizes) > self.end:
+            return None, pos
+        lengths = _unpack(typecodes[0], data[pos:pos + sizes[0]])
+        pos += sizes[0]
+        counts = _unpack(typecodes[1], data[pos:pos + sizes[1]])
+        pos += sizes[1]
+        text = data[pos:pos + sizes[2]].decode('utf-8', 'surrogatepass')
+        pos += sizes[2]
+        rule_ids = _unpack(typecodes[2], data[pos:pos + sizes[3]])
+        pos += sizes[3]
+        records = []
+        w = 0
+        k = 0
+        for length, count in zip(lengths, counts):
+            records.append((text[w:w + length], rule_ids[k:k + count]))
+            w += length
+            k += count
+        return records, pos
+
+    def read_chunk(self, i: int) -> List[Tuple[str, List[int]]]:
+        """Records of chunk i of the index"""
+        return self._chunk(self.chunks[i][0])[0] or []
+
+    def __iter__(self) -> Generator[Tuple[str, List[int]], None, None]:
+        """Yield (word, rule ids) for every record"""
+        pos = self.start
+        while pos < self.end:
+            records, pos = self._chunk(pos)
+            if records is None:
+                return
+            yield from records
+
+
+def is_hit_log(path: str) -> bool:
+    with open(path, 'rb') as f_log:
+        return f_log.read(4) == __magic__
+
+
+def read_json_log(path: str) -> Tuple[List[str], Generator[Tuple[str, List[int]], None, None]]:
+    """Rules and records of a JSON lines log, which ends at its first line which isn't JSON"""
+    f_log = open(path, 'r')
+    meta = json.loads(f_log.readline())
+
+    def records():
+        with f_log:
+            for line in f_log:
+                try:
+                    word, rule_ids = json.loads(line)
+                except JSONDecodeError:
+                    return
+                yield word, rule_ids
+
+    return meta['rules'], records()
+
+
+def read_log(path: str) -> Tuple[List[str], Iterable[Tuple[str, List[int]]]]:
+    """Rules and records of a hit log or a JSON lines log"""
+    if is_hit_log(path):
+        log = HitLogReader(path)
+        return log.rules, log
+    return read_json_log(path)
+
+
+def convert(json_path: str, log_path: str, chunk_size: int = 65536) -> int:
+    """Convert a JSON lines log into a hit log, return the number of records"""
+    rules, records = read_json_log(json_path)
+    n = 0
+    with open(log_path, 'wb') as f_out:
+        with HitLogWriter(f_out, rules, chunk_size) as writer:
+            for word, rule_ids in records:
+                writer.write(word, rule_ids)
+                n += 1
+    return n
+
+
+def wrapper():
+    cli = argparse.ArgumentParser('Convert a JSON lines hit log into a binary hit log')
+    cli.add_argument('-l', '--log', dest='log', required=True, help='JSON lines log')
+    cli.add_argument('-s', '--save', dest='save', required=True, help='save binary log')
+    cli.add_argument('--chunk-size', dest='chunk_size', type=int, default=65536, help='records per chunk')
+    args = cli.parse_args()
+    n = convert(args.log, args.save, args.chunk_size)
+    print(f"records: {n}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    wrapper()
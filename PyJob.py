@@ -0,0 +1,191 @@
+"""
+Long running generation job which can be stopped at any time and resumed
+where it stopped. The job periodically saves a checkpoint with the byte offset
+of the current word, the index of the next rule to apply to it, the size of
+the output written so far and the state of the duplicate filter. On resume the
+output is truncated to the checkpointed size and generation continues from the
+checkpointed word offset, without reading the lines before it. A checkpoint
+isn't resumed with other rules, another word list or a word list whose size or
+modification time changed since the checkpoint.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Sequence
+
+from PyDedupWriter import BloomFilter, DedupWriter
+from PyHashcat import iter_lines, read_rules
+from PyRuleEngine import RuleEngine
+
+
+def _replace(path: str, data: bytes):
+    """Atomically replace the content of path"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f_tmp:
+        f_tmp.write(data)
+        f_tmp.flush()
+        os.fsync(f_tmp.fileno())
+    os.replace(tmp_path, path)
+
+
+def rules_digest(rules: Sequence[str]) -> str:
+    """SHA-256 of the rules, one per line"""
+    return hashlib.sha256('\n'.join(rules).encode('utf-8', 'surrogateescape')).hexdigest()
+
+
+class GenerationJob(object):
+    """
+    Apply rules to every word of words_path and write the unique candidates to
+    out_path. Calling run() again after an interruption resumes the job from
+    its checkpoint. With binary=True the rules are applied to the bytes of the
+    words, see RuleEngine, and encoding is not used.
+    """
+
+    def __init__(self, words_path: str, rules: Sequence[str], out_path: str, checkpoint_path: str = None,
+                 interval: float = 60.0, capacity: int = 10000000, error_rate: float = 0.001,
+                 rule_block: int = 4096, encoding: str = 'utf-8', binary: bool = False):
+        self.words_path = words_path
+        self.rules = list(rules)
+        self.out_path = out_path
+        self.checkpoint_path = checkpoint_path if checkpoint_path is not None else out_path + '.checkpoint'
+        self.interval = interval
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rule_block = rule_block
+        self.encoding = encoding
+        self.binary = binary
+        self.sequence = 0
+
+    def load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, 'r') as f_ckpt:
+                return json.load(f_ckpt)
+        except FileNotFoundError:
+            return None
+
+    def save_checkpoint(self, writer: DedupWriter, f_out, word_offset: int, rule_index: int, done: bool = False):
+        """
+        Save the state after the output was flushed to disk. The filter goes to
+        a new file referenced by the checkpoint, so the checkpoint and the filter
+        are replaced together by the final rename.
+        """
+        writer.flush()
+        os.fsync(f_out.fileno())
+        self.sequence += 1
+        bloom_path = '%s.bloom.%d' % (self.checkpoint_path, self.sequence)
+        with open(bloom_path, 'wb') as f_bloom:
+            writer.bloom.save(f_bloom)
+            f_bloom.flush()
+            os.fsync(f_bloom.fileno())
+        words_stat = os.stat(self.words_path)
+        state = {
+            'words': os.path.abspath(self.words_path),
+            'words_size': words_stat.st_size,
+            'words_mtime_ns': words_stat.st_mtime_ns,
+            'rules': len(self.rules),
+            'rules_sha256': rules_digest(self.rules),
+            'word_offset': word_offset,
+            'rule_index': rule_index,
+            'out_offset': f_out.tell(),
+            'bloom': os.path.basename(bloom_path),
+            'sequence': self.sequence,
+            'done': done,
+            'stats': writer.stats(),
+        }
+        previous = self.load_checkpoint()
+        _replace(self.checkpoint_path, json.dumps(state).encode())
+        if previous is not None:
+            try:
+                os.remove(os.path.join(os.path.dirname(self.checkpoint_path), previous['bloom']))
+            except OSError:
+                pass
+
+    def run(self):
+        """Run or resume the job and return the statistics of the writer"""
+        state = self.load_checkpoint()
+        if state is not None and state['rules'] != len(self.rules):
+            raise ValueError(f"checkpoint {self.checkpoint_path} was made with {state['rules']} rules, "
+                             f"not {len(self.rules)}")
+        if state is not None and state.get('rules_sha256', rules_digest(self.rules)) != rules_digest(self.rules):
+            raise ValueError(f"checkpoint {self.checkpoint_path} was made with other rules")
+        if state is not None and state['words'] != os.path.abspath(self.words_path):
+            raise ValueError(f"checkpoint {self.checkpoint_path} was made with {state['words']}, "
+                             f"not {self.words_path}")
+        if state is not None and 'words_size' in state:
+            words_stat = os.stat(self.words_path)
+            if (state['words_size'], state['words_mtime_ns']) != (words_stat.st_size, words_stat.st_mtime_ns):
+                raise ValueError(f"checkpoint {self.checkpoint_path} was made with another version of "
+                                 f"{self.words_path}")
+        if state is None:
+            f_out = open(self.out_path, 'wb')
+            writer = DedupWriter(f_out, self.capacity, self.error_rate, encoding=self.encoding)
+            word_offset, rule_index = 0, 0
+        else:
+            f_out = open(self.out_path, 'r+b')
+            f_out.truncate(state['out_offset'])
+            f_out.seek(state['out_offset'])
+            writer = DedupWriter(f_out, self.capacity, self.error_rate, encoding=self.encoding)
+            with open(os.path.join(os.path.dirname(self.checkpoint_path), state['bloom']), 'rb') as f_bloom:
+                writer.bloom = BloomFilter.load(f_bloom)
+            stats = state['stats']
+            writer.candidates = stats['candidates']
+            writer.written = stats['written']
+            writer.word_duplicates = stats['word_duplicates']
+            writer.global_duplicates = stats['global_duplicates']
+            # checkpoints of older versions don't have it, their output was written from the start
+            writer.bytes_written = stats.get('bytes_written', state['out_offset'])
+            self.sequence = state['sequence']
+            word_offset, rule_index = state['word_offset'], state['rule_index']
+            if state['done']:
+                f_out.close()
+                return writer.stats()
+        engine = RuleEngine(self.rules, binary=self.binary)
+        n_rules = len(self.rules)
+        block = None
+        last = time.monotonic()
+        with f_out:
+            for word_offset, line in iter_lines(self.words_path, word_offset):
+                word = line if self.binary else line.decode(self.encoding, 'surrogateescape')
+                while rule_index < n_rules:
+                    stop = min(rule_index + self.rule_block, n_rules)
+                    # with a single block the indices are set once for all words
+                    if block != (rule_index, stop):
+                        block = rule_index, stop
+                        engine.change_indices(range(rule_index, stop))
+                    writer.feed(engine.apply(word))
+                    rule_index = stop
+                    if time.monotonic() - last >= self.interval:
+                        self.save_checkpoint(writer, f_out, word_offset, rule_index)
+                        last = time.monotonic()
+                rule_index = 0
+            self.save_checkpoint(writer, f_out, word_offset, n_rules, done=True)
+        return writer.stats()
+
+
+def wrapper():
+    cli = argparse.ArgumentParser('Resumable candidate generation')
+    cli.add_argument('-w', '--words', dest='words', required=True, help='word list')
+    cli.add_argument('-r', '--rules', dest='rules', required=True, help='rule file')
+    cli.add_argument('-s', '--save', dest='save', required=True, help='save candidates')
+    cli.add_argument('-c', '--checkpoint', dest='checkpoint', help='checkpoint file, default is save + .checkpoint')
+    cli.add_argument('-i', '--interval', dest='interval', type=float, default=60.0,
+                     help='seconds between checkpoints')
+    cli.add_argument('--capacity', dest='capacity', type=int, default=10000000,
+                     help='expected number of unique candidates')
+    cli.add_argument('--error-rate', dest='error_rate', type=float, default=0.001,
+                     help='false positive rate of the duplicate filter')
+    cli.add_argument('-b', '--binary', dest='binary', action='store_true',
+                     help='apply the rules to the bytes of the words, like hashcat')
+    args = cli.parse_args()
+    job = GenerationJob(args.words, read_rules(args.rules), args.save, args.checkpoint, args.interval,
+                        args.capacity, args.error_rate, binary=args.binary)
+    stats = job.run()
+    print(f"candidates: {stats['candidates']}, written: {stats['written']}, bytes: {stats['bytes_written']}",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    wrapper()
@@ -0,0 +1,128 @@
+"""
+Generate candidates with a pool of processes. Either the word list or the rule
+list is sharded into tasks. Every worker receives the rules once, when it is
+started, and a task only carries a chunk of words and a range of rule indices.
+Candidates come back as one list per task.
+"""
+import argparse
+import collections
+import multiprocessing
+import sys
+from typing import Generator, Iterable, List, Sequence
+
+from PyHashcat import read_rules, read_words
+from PyRuleEngine import RuleContext, RuleEngine
+
+__engine__ = [None]
+
+
+def _init_worker(rules):
+    __engine__[0] = RuleEngine(rules)
+
+
+def _generate(task) -> List[str]:
+    words, start, stop, order = task
+    compiled = __engine__[0].compiled[start:stop]
+    ctx = RuleContext()
+    if order == 'rule':
+        candidates = (rule(word, ctx) for rule in compiled for word in words)
+    else:
+        candidates = (rule(word, ctx) for word in words for rule in compiled)
+    # rejected candidates are None
+    return [c for c in candidates if c is not None]
+
+
+def chunked(words: Iterable[str], size: int) -> Generator[List[str], None, None]:
+    chunk = []
+    for word in words:
+        chunk.append(word)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def rule_ranges(n_rules: int, n_shards: int):
+    """Split range(n_rules) into n_shards contiguous (start, stop) ranges"""
+    n_shards = max(1, min(n_shards, n_rules))
+    step, extra = divmod(n_rules, n_shards)
+    start = 0
+    for i in range(n_shards):
+        stop = start + step + (1 if i < extra else 0)
+        yield start, stop
+        start = stop
+
+
+def generate(words: Iterable[str], rules: Sequence[str], processes: int = None, shard: str = 'words',
+             order: str = 'word', chunk_size: int = 10000,
+             ordered: bool = True) -> Generator[List[str], None, None]:
+    """
+    Apply rules to words in a process pool and yield the candidates in chunks.
+
+    shard='words' gives every task a chunk of words and all rules, shard='rules'
+    gives every task a chunk of words and a slice of the rules. order='word'
+    applies all rules of a task to a word before moving on to the next word
+    (the order of RuleEngine.apply), order='rule' applies a rule to all words of
+    a task before moving on to the next rule. With ordered=True chunks are
+    yielded in task order, so shard='words', order='word' produces exactly the
+    stream of RuleEngine.apply over the word list, and shard='rules',
+    order='rule' the rule-major stream within every chunk of words. With
+    ordered=False chunks are yielded as soon as they are done.
+    """
+    rules = list(rules)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if shard == 'rules':
+        ranges = list(rule_ranges(len(rules), processes))
+    else:
+        ranges = [(0, len(rules))]
+    window = processes * 2
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(rules,)) as pool:
+        pending = collections.deque()
+        for chunk in chunked(words, chunk_size):
+            for start, stop in ranges:
+                pending.append(pool.apply_async(_generate, ((chunk, start, stop, order),)))
+                while len(pending) >= window:
+                    yield _next_done(pending, ordered)
+        while pending:
+            yield _next_done(pending, ordered)
+
+
+def _next_done(pending, ordered):
+    """Pop the result of the oldest task, or of any finished task if not ordered"""
+    if not ordered:
+        for i, result in enumerate(pending):
+            if result.ready():
+                del pending[i]
+                return result.get()
+    return pending.popleft().get()
+
+
+def wrapper():
+    cli = argparse.ArgumentParser('Generate candidates in parallel')
+    cli.add_argument('-w', '--words', dest='words', required=True, help='word list')
+    cli.add_argument('-r', '--rules', dest='rules', required=True, help='rule file')
+    cli.add_argument('-s', '--save', dest='save', help='save candidates')
+    cli.add_argument('-j', '--processes', dest='processes', type=int, default=None, help='number of processes')
+    cli.add_argument('--shard', dest='shard', choices=['words', 'rules'], default='words')
+    cli.add_argument('--order', dest='order', choices=['word', 'rule'], default='word')
+    cli.add_argument('--chunk-size', dest='chunk_size', type=int, default=10000)
+    cli.add_argument('--unordered', dest='ordered', action='store_false', help='yield chunks as they are done')
+    cli.add_argument('--start-at', dest='start_at', type=int, default=1, help='line number to start at')
+    args = cli.parse_args()
+    if args.save is not None:
+        f_out = open(args.save, 'w')
+    else:
+        f_out = sys.stdout
+    rules = read_rules(args.rules)
+    words = (word for _, word in read_words(args.words, args.start_at))
+    for chunk in generate(words, rules, args.processes, args.shard, args.order, args.chunk_size, args.ordered):
+        f_out.write('\n'.join(chunk))
+        f_out.write('\n')
+    f_out.flush()
+    f_out.close()
+
+
+if __name__ == '__main__':
+    wrapper()
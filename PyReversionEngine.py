@@ -1,48 +1,116 @@
 """
 Library to implement hashcat style ``reversed`` rule engine.
 """
+import functools
+import itertools
 import json
+import marshal
 import os.path
 import re
 
 # based on hashcat rules from
 # https://hashcat.net/wiki/doku.php?id=rule_based_attack
-from typing import Tuple, List
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Optional, Sequence, Tuple
 
-__p__ = [0]
+from PyRuleEngine import RuleContext, compile_function
+from PyRuleParser import __reject_keys__, __signatures__, parse_rules
 
 
-def read_reversion_dist():
-    reversion_json = os.path.join(os.path.dirname(__file__), 'reversion.json')
+__reversion_json__ = os.path.join(os.path.dirname(__file__), 'reversion.json')
+# the reduced distribution is cached next to the JSON, marshalled after a
+# header of this magic, the marshal version and the size and mtime of the JSON
+__cache_magic__ = b'PRR2'
+# characters kept for every position, most frequent first
+__top_k__ = 16
+
+
+def read_reversion_top(reversion_json: str = __reversion_json__, k: int = __top_k__):
+    """
+    The k most frequent characters of every function and position of
+    reversion.json, as a string, most frequent first. Position -1 has the
+    most frequent characters over all positions.
+    """
     with open(reversion_json) as fp:
         dist = json.load(fp)
-    n_dist = {}
+    top = {}
     for key in dist:
-        n_dist[key] = {}
+        top[key] = {}
+        total = {}
         for pos in dist[key]:
             chrs = dist[key][pos]
             n_chrs = sorted(chrs.items(), key=lambda v: v[1], reverse=True)
-            n_dist[key][int(pos)] = n_chrs[0][0]
-    return n_dist
+            top[key][int(pos)] = ''.join(c for c, _ in n_chrs[:k])
+            for c, n in chrs.items():
+                total[c] = total.get(c, 0) + n
+        top[key][-1] = ''.join(sorted(total, key=total.get, reverse=True)[:k])
+    return top
 
 
-reversion_dist = read_reversion_dist()
+def read_reversion_dist(reversion_json: str = __reversion_json__):
+    """Most frequent character of every function and position of reversion.json"""
+    return _best(read_reversion_top(reversion_json, 1))
 
 
-def i36(string):
-    """Shorter way of converting base 36 string to integer"""
-    if string == 'p':
-        return __p__[0]
-    return int(string, 36)
+def _best(top):
+    return {key: {pos: chrs[0] for pos, chrs in top[key].items() if pos >= 0} for key in top}
+
+
+def _cache_header(reversion_json: str) -> bytes:
+    stat = os.stat(reversion_json)
+    return __cache_magic__ + marshal.dumps((marshal.version, stat.st_size, stat.st_mtime_ns))
 
 
-__memorized__ = ['']
+def load_reversion_top(reversion_json: str = __reversion_json__, cache_path: str = None):
+    """
+    read_reversion_top through a cache file, rebuilt when the JSON changed.
+    The cache is not written when its directory is read-only.
+    """
+    if cache_path is None:
+        cache_path = reversion_json + '.cache'
+    header = _cache_header(reversion_json)
+    try:
+        with open(cache_path, 'rb') as fp:
+            data = fp.read()
+        if data.startswith(header):
+            return marshal.loads(data[len(header):])
+    except (OSError, ValueError, EOFError, TypeError):
+        pass
+    top = read_reversion_top(reversion_json)
+    try:
+        with open(cache_path + '.tmp', 'wb') as fp:
+            fp.write(header + marshal.dumps(top))
+        os.replace(cache_path + '.tmp', cache_path)
+    except OSError:
+        pass
+    return top
+
+
+def load_reversion_dist(reversion_json: str = __reversion_json__, cache_path: str = None):
+    """read_reversion_dist through the cache of load_reversion_top"""
+    return _best(load_reversion_top(reversion_json, cache_path))
+
+
+@functools.lru_cache(maxsize=None)
+def get_reversion_top():
+    """The top characters of reversion.json, loaded on first use"""
+    return load_reversion_top()
+
+
+@functools.lru_cache(maxsize=None)
+def get_reversion_dist():
+    """The distribution of reversion.json, loaded on first use"""
+    return _best(get_reversion_top())
 
 
-def memorize(string, _):
-    """Store current string in memory"""
-    __memorized__[0] = string
-    return string
+def i36(string):
+    """
+    Shorter way of converting base 36 string to integer. The positional
+    argument 'p' is only known when a rule is applied forward, so it can't be
+    reversed.
+    """
+    if string == 'p':
+        raise NotImplementedError("positional argument 'p' can't be reversed")
+    return int(string, 36)
 
 
 def rule_regex_gen():
@@ -64,7 +132,21 @@ def rule_regex_gen():
     return re.compile(rule_regex)
 
 
-__functions_regex__ = rule_regex_gen()
+@functools.lru_cache(maxsize=None)
+def functions_regex():
+    """The regex of rule_regex_gen, compiled on first use"""
+    return rule_regex_gen()
+
+
+__lazy__ = {'__functions_regex__': functions_regex, 'reversion_dist': get_reversion_dist}
+
+
+def __getattr__(name):
+    """Module attributes built on first access (PEP 562), to keep the import fast"""
+    if name in __lazy__:
+        return __lazy__[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 """
 Note that we reverse all operations
@@ -114,10 +196,26 @@ def delete_doubled(word, _):
     return "".join(res)
 
 
-def delete_extracted_memory():
-    """Insert section of stored string into current string"""
-    saved = __memorized__[0]
-    return saved
+def delete_first_n_duplicated(word, indices):
+    """Reverse of 'y', which duplicates the whole word if it is shorter than n"""
+    n = i36(indices[0])
+    half = len(word) // 2
+    if len(word) >= 2 * n and word[:n] == word[n:2 * n]:
+        return word[n:]
+    if len(word) % 2 == 0 and half < n and word[:half] == word[half:]:
+        return word[:half]
+    return word
+
+
+def delete_last_n_duplicated(word, indices):
+    """Reverse of 'Y', which duplicates the whole word if n is 0 or more than its length"""
+    n = i36(indices[0])
+    half = len(word) // 2
+    if 0 < n and len(word) >= 2 * n and word[-2 * n:-n] == word[-n:]:
+        return word[:-n]
+    if len(word) % 2 == 0 and (n == 0 or half < n) and word[:half] == word[half:]:
+        return word[:half]
+    return word
 
 
 def delete_N(word, indices):
@@ -125,7 +223,7 @@ def delete_N(word, indices):
     n = i36(n)
     if n > len(word):
         return word
-    c = reversion_dist['D'][n]
+    c = get_reversion_dist()['D'][n]
     return word[:n] + c + word[n:]
 
 
@@ -167,12 +265,212 @@ function_map = {
     'z': delete_first_same_n,
     'Z': delete_last_same_n,
     'q': delete_doubled,
+    'y': delete_first_n_duplicated,
+    'Y': delete_last_n_duplicated,
     'M': not_implemented,
     'X': not_implemented,
     '4': not_implemented,
     '6': not_implemented,
 }
 
+"""
+Branching reversal. Functions which lose information have a set of
+preimages: the deleted characters are guessed from the top k characters of
+reversion.json at their position. The case of the words of a rule with a
+case function is unknown, so such rules are reversed on the lowered string,
+which is matched against a case folded index of the dictionary.
+"""
+
+
+def _top(pos: int, k: int) -> str:
+    top = get_reversion_top()['D']
+    return top.get(pos, top[-1])[:k]
+
+
+def _fill(start: int, length: int, k: int) -> Iterator[str]:
+    """Strings of length characters guessed for positions start and on, at most k"""
+    guesses = itertools.product(*[_top(start + i, k) for i in range(length)])
+    return (''.join(chars) for chars in itertools.islice(guesses, k))
+
+
+def branch_D(word, indices, k):
+    n = i36(indices[0])
+    if n >= len(word):
+        yield word
+    if n <= len(word):
+        for c in _top(n, k):
+            yield word[:n] + c + word[n:]
+
+
+def branch_delete_first(word, _, k):
+    for c in _top(0, k):
+        yield c + word
+
+
+def branch_delete_last(word, _, k):
+    for c in _top(-1, k):
+        yield word + c
+
+
+def branch_truncate(word, indices, k):
+    n = i36(indices[0])
+    if len(word) <= n:
+        yield word
+    if len(word) == n:
+        for c in _top(n, k):
+            yield word + c
+
+
+def branch_extract(word, indices, k):
+    n, m = i36(indices[0]), i36(indices[1])
+    if len(word) <= max(m - n, 0):
+        for prefix in _fill(0, n, k):
+            yield prefix + word
+
+
+def branch_omit(word, indices, k):
+    n, m = i36(indices[0]), i36(indices[1])
+    if n + m > len(word):
+        yield word
+    if n <= len(word):
+        for chars in _fill(n, m, k):
+            yield word[:n] + chars + word[n:]
+
+
+def branch_overwrite(word, indices, k):
+    n, c = i36(indices[0]), indices[1]
+    if n >= len(word):
+        yield word
+    elif word[n] == c:
+        for d in dict.fromkeys(c + _top(n, k)):
+            yield word[:n] + d + word[n + 1:]
+
+
+def branch_purge(word, indices, k):
+    """The word and the word with one c put back at the k positions where c is likeliest"""
+    c = indices[0]
+    if c in word:
+        return
+    yield word
+
+    def rank(i):
+        top = _top(i, __top_k__)
+        return top.index(c) if c in top else len(top)
+
+    for i in sorted(range(len(word) + 1), key=rank)[:k]:
+        yield word[:i] + c + word[i:]
+
+
+# key -> function yielding the preimages of a word, guessing k characters
+branch_map = {
+    'D': branch_D,
+    '[': branch_delete_first,
+    ']': branch_delete_last,
+    "'": branch_truncate,
+    'x': branch_extract,
+    'O': branch_omit,
+    'o': branch_overwrite,
+    '@': branch_purge,
+}
+# case functions which lose the case, and the words they give
+__case_checks__ = {
+    'l': str.lower,
+    'u': str.upper,
+    'c': str.capitalize,
+    'C': lambda x: x.capitalize().swapcase(),
+}
+# case functions which keep a lowered word lowered
+__case_functions__ = frozenset('tTEe3')
+# functions which don't change the length
+__same_length__ = frozenset('lucCtTsk*KLR+-.,Ee3o') | __reject_keys__ | {':', 'M'}
+# functions whose result length depends on more than the length of the word
+__content_length__ = frozenset('@X46')
+
+
+def forward_lengths(function: str, lengths: Iterable[int]) -> Optional[FrozenSet[int]]:
+    """
+    Lengths of the words function gives for words of lengths, None if they
+    don't only depend on the length.
+    >>> sorted(forward_lengths('D3', [2, 5])), sorted(forward_lengths('y2', [1, 5]))
+    ([2, 4], [2, 7])
+    """
+    key = function[0]
+    if key in __same_length__:
+        return frozenset(lengths)
+    if key in __content_length__:
+        return None
+    if any(kind == 'n' and arg == 'p' for kind, arg in zip(__signatures__.get(key, ''), function[1:])):
+        return None
+    step = compile_function(function)
+    return frozenset(len(step('a' * n, RuleContext())) for n in lengths)
+
+
+class ReversionIndex(object):
+    """
+    Index of a dictionary for branching reversal: the words, the words by
+    their lowered form and the lengths of the words, to prune branches.
+    """
+
+    def __init__(self, words: Iterable[str]):
+        self.words = set()
+        self.folded = {}
+        self.lengths = set()
+        for word in words:
+            self.words.add(word)
+            self.folded.setdefault(word.lower(), []).append(word)
+            self.lengths.add(len(word))
+        self._reachable = {}
+
+    def __contains__(self, word) -> bool:
+        return word in self.words
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def reachable_lengths(self, rule: Sequence[str]) -> List[Optional[FrozenSet[int]]]:
+        """
+        Lengths of the words of the index after every prefix of a parsed rule:
+        item j is for rule[:j], None if unknown
+        """
+        key = tuple(rule)
+        reachable = self._reachable.get(key)
+        if reachable is None:
+            reachable = [frozenset(self.lengths)]
+            for function in rule:
+                last = reachable[-1]
+                reachable.append(None if last is None else forward_lengths(function, last))
+            self._reachable[key] = reachable
+        return reachable
+
+    def lookup(self, word: str, folded: bool) -> List[str]:
+        """The words equal to word, ignoring case if folded"""
+        if folded:
+            return self.folded.get(word.lower(), [])
+        return [word] if word in self.words else []
+
+
+def reverse_function(key: str, remain: str, word: str, folded: bool, k: int) -> Iterator[Tuple[str, bool]]:
+    """Preimages of word under one function, with whether their case is unknown"""
+    if key in __case_checks__:
+        if folded or __case_checks__[key](word) == word:
+            yield word.lower(), True
+        return
+    if folded:
+        if key in __case_functions__:
+            yield word, True
+            return
+        remain = remain.lower()
+    branch = branch_map.get(key)
+    try:
+        if branch is not None:
+            for preimage in branch(word, remain, k):
+                yield preimage, folded
+            return
+        yield function_map.get(key, not_implemented)(word, remain), folded
+    except (IndexError, NotImplementedError):
+        """Like ReversionEngine.apply, the word is kept"""
+        yield word, folded
+
 
 class ReversionEngine(object):
     """
@@ -183,7 +481,7 @@ class ReversionEngine(object):
     def __init__(self, rules=None):
         if rules is None:
             rules = [':']
-        parsed_rules = tuple(map(__functions_regex__.findall, rules))
+        parsed_rules = tuple(map(list, parse_rules(rules)))
         self.rules = parsed_rules
         self.reversed_rules = tuple(rule[::-1] for rule in parsed_rules)
         self.indices = range(0, len(self.reversed_rules))
@@ -198,7 +496,7 @@ class ReversionEngine(object):
             for function in reversed_rule:
                 try:
                     key = function[0]
-                    func = function_map[key]
+                    func = function_map.get(key, not_implemented)
                     remain = function[1:]
                     target = func(target, remain)
                 except IndexError:
@@ -207,9 +505,47 @@ class ReversionEngine(object):
                     """Some operation could be hard to reverse"""
             yield target, self.rules[idx]
 
+    def preimages(self, string: str, idx: int, index: ReversionIndex, k: int = 3, limit: int = 256) -> List[str]:
+        """
+        Words of index which rule idx may turn into string, ignoring case if
+        the rule has a case function. Every lossy function branches into at
+        most k preimages and at most limit are followed at every step. After
+        every step, branches are pruned whose length no word of the index
+        reaches through the functions left to reverse, as long as these
+        lengths only depend on the length of the word. The words still have to
+        be confirmed by applying the rule.
+        >>> index = ReversionIndex(['Password', 'monkey', 'dragon1'])
+        >>> engine = ReversionEngine(['l$1', ']'])
+        >>> engine.preimages('password1', 0, index), engine.preimages('dragon', 1, index)
+        (['Password'], ['dragon1'])
+        """
+        reversed_rule = self.reversed_rules[idx]
+        reachable = index.reachable_lengths(self.rules[idx])
+        folded = any(function[0] in __case_checks__ for function in reversed_rule)
+        states = {(string.lower() if folded else string, folded): None}
+        for pos, function in enumerate(reversed_rule):
+            key, remain = function[0], function[1:]
+            # lengths of the index after the functions left to reverse
+            lengths = reachable[len(reversed_rule) - 1 - pos]
+            new_states = {}
+            for word, folded in states:
+                for state in reverse_function(key, remain, word, folded, k):
+                    if lengths is not None and len(state[0]) not in lengths:
+                        continue
+                    new_states[state] = None
+                    if len(new_states) >= limit:
+                        break
+                if len(new_states) >= limit:
+                    break
+            states = new_states
+        words = []
+        for word, folded in states:
+            words.extend(index.lookup(word, folded))
+        return list(dict.fromkeys(words))
+
     def change_rules(self, new_rules):
         """Replace current rules with new_rules"""
-        self.rules = tuple(map(__functions_regex__.findall, new_rules))
+        self.rules = tuple(map(list, parse_rules(new_rules)))
         self.reversed_rules = tuple(rule[::-1] for rule in self.rules)
         self.indices = range(0, len(self.rules))
 
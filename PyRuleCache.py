@@ -0,0 +1,156 @@
+"""
+Parsed rules of a rule file cached on disk, so large rule files are parsed
+once and not on every start of every worker. The cache is a binary file of
+opcodes: every function is the byte of its key followed by its arguments,
+positions as one byte, the index of their digit in __digits__, and characters
+in UTF-8. The index of 0-9 and A-Z is their value, 'p' is 36 and the lowercase
+letters follow, so a rule decodes to the text it was parsed from. An array of offsets gives the start of every rule, so a rule is
+decoded when it is first used, straight from the memory mapped file, whose
+pages are shared by all the processes using it.
+
+The header holds the SHA-256 of the rule file, a cache whose rule file
+changed is built again.
+"""
+import array
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from typing import List, Sequence
+
+from PyHashcat import read_rules
+from PyRuleParser import __signatures__, parse_rules
+
+__magic__ = b'PyRC'
+__version__ = 2
+# magic, version, flags, number of rules, SHA-256 of the rule file
+__header__ = struct.Struct('<4sHHI32s')
+# the rules were parsed strictly
+STRICT = 1
+__digits__ = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZpabcdefghijklmnoqrstuvwxyz'
+__digit_codes__ = {digit: i for i, digit in enumerate(__digits__)}
+
+
+def rule_file_digest(rule_path: str) -> bytes:
+    digest = hashlib.sha256()
+    with open(rule_path, 'rb') as f_rule:
+        for block in iter(lambda: f_rule.read(1 << 20), b''):
+            digest.update(block)
+    return digest.digest()
+
+
+def encode_rules(rules: Sequence[Sequence[str]], digest: bytes = bytes(32), flags: int = 0) -> bytes:
+    """Cache of parsed rules, see decode_rule"""
+    code = bytearray()
+    offsets = array.array('I', [0])
+    digit_codes = __digit_codes__
+    for rule in rules:
+        for function in rule:
+            key = function[0]
+            code.append(ord(key))
+            for kind, arg in zip(__signatures__[key], function[1:]):
+                if kind == 'n':
+                    code.append(digit_codes[arg])
+                else:
+                    code += arg.encode('utf-8', 'surrogatepass')
+        offsets.append(len(code))
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+    return __header__.pack(__magic__, __version__, flags, len(rules), digest) + offsets.tobytes() + bytes(code)
+
+
+def decode_rule(code, start: int, stop: int) -> List[str]:
+    """
+    Functions of the rule encoded in code[start:stop]
+    >>> code = encode_rules([['sa@', 'T3', '$1', 'Dp', 'Da']])
+    >>> decode_rule(code, len(code) - 11, len(code))
+    ['sa@', 'T3', '$1', 'Dp', 'Da']
+    """
+    rule = []
+    digits = __digits__
+    pos = start
+    while pos < stop:
+        key = chr(code[pos])
+        pos += 1
+        function = key
+        for kind in __signatures__[key]:
+            if kind == 'n':
+                function += digits[code[pos]]
+                pos += 1
+            else:
+                lead = code[pos]
+                size = 1 if lead < 0x80 else 2 if lead < 0xe0 else 3 if lead < 0xf0 else 4
+                function += bytes(code[pos:pos + size]).decode('utf-8', 'surrogatepass')
+                pos += size
+        rule.append(function)
+    return rule
+
+
+class RuleCache(object):
+    """
+    Sequence of the parsed rules of a cache, each decoded on first access and
+    kept. It can be passed to RuleEngine.from_tokens.
+    >>> rules = RuleCache(encode_rules([['$1'], ['u', 'T0']]))
+    >>> len(rules), rules[1]
+    (2, ['u', 'T0'])
+    """
+
+    def __init__(self, data):
+        magic, version, self.flags, n_rules, self.digest = __header__.unpack_from(data)
+        if magic != __magic__ or version != __version__:
+            raise ValueError("not a rule cache of this version")
+        start = __header__.size
+        stop = start + 4 * (n_rules + 1)
+        self.offsets = array.array('I', data[start:stop])
+        if sys.byteorder != 'little':
+            self.offsets.byteswap()
+        if len(self.offsets) != n_rules + 1 or len(data) != stop + self.offsets[-1]:
+            raise ValueError("truncated rule cache")
+        self.data = data
+        self.code = memoryview(data)[stop:]
+        self.decoded = [None] * n_rules
+
+    def __len__(self) -> int:
+        return len(self.decoded)
+
+    def __getitem__(self, idx: int) -> List[str]:
+        rule = self.decoded[idx]
+        if rule is None:
+            if idx < 0:
+                idx += len(self.decoded)
+            rule = self.decoded[idx] = decode_rule(self.code, self.offsets[idx], self.offsets[idx + 1])
+        return rule
+
+    def __iter__(self):
+        return (self[idx] for idx in range(len(self)))
+
+
+def _map(cache_path: str) -> RuleCache:
+    with open(cache_path, 'rb') as f_cache:
+        return RuleCache(mmap.mmap(f_cache.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def load_rules(rule_path: str, cache_path: str = None, strict: bool = False) -> RuleCache:
+    """
+    Parsed rules of a rule file, from its cache, rule_path + '.cache' by
+    default, which is built if it is missing or of another rule file. If the
+    cache can't be written the rules are parsed and kept in memory.
+    """
+    if cache_path is None:
+        cache_path = rule_path + '.cache'
+    digest = rule_file_digest(rule_path)
+    try:
+        rules = _map(cache_path)
+        if rules.digest == digest and (rules.flags & STRICT or not strict):
+            return rules
+    except (OSError, ValueError, struct.error):
+        pass
+    data = encode_rules(parse_rules(read_rules(rule_path), strict), digest, STRICT if strict else 0)
+    try:
+        with open(cache_path + '.tmp', 'wb') as f_cache:
+            f_cache.write(data)
+        os.replace(cache_path + '.tmp', cache_path)
+        return _map(cache_path)
+    except OSError:
+        return RuleCache(data)
@@ -1,19 +1,39 @@
 """
 Library to implement hashcat style rule engine.
 """
+import functools
 import re
 
 # based on hashcat rules from
 # https://hashcat.net/wiki/doku.php?id=rule_based_attack
-from typing import Tuple, List
+from typing import Callable, Tuple, List
 
-__p__ = [0]
+from PyRuleParser import parse_rejected_rules, parse_rules
 
 
-def i36(string):
+class RuleContext(object):
+    """
+    State of one rule application: the string stored by 'M' and the position
+    'p' set by the '%' and '/' reject functions. RuleEngine.apply owns one
+    context per word, and rules which use it start from a reset context. The
+    memory is empty, '' or b'' for engines working on bytes.
+    """
+    __slots__ = ('memory', 'p', 'empty')
+
+    def __init__(self, empty=''):
+        self.empty = empty
+        self.memory = empty
+        self.p = 0
+
+    def reset(self):
+        self.memory = self.empty
+        self.p = 0
+
+
+def i36(string, ctx=None):
     """Shorter way of converting base 36 string to integer"""
     if string == 'p':
-        return __p__[0]
+        return ctx.p if ctx is not None else 0
     return int(string, 36)
 
 
@@ -25,45 +45,6 @@ def reject_rules_gen():
     return re.compile(rule_regex)
 
 
-__rejected_rules__ = reject_rules_gen()
-
-
-def at_least_n_x(word, indices):
-    n, x = indices
-    n = i36(n)
-    cnt = 0
-    for i, c in enumerate(word):
-        if c == x:
-            cnt += 1
-        if cnt == n:
-            __p__[0] = i
-            return True
-    return False
-
-
-def no_x(word, indices):
-    x, = indices
-    for i, c in enumerate(word):
-        if c == x:
-            __p__[0] = i
-            return False
-    return True
-
-
-rejected_map = {
-    '<': lambda x, i: len(x) > i36(i[0]),
-    '>': lambda x, i: len(x) < i36(i[0]),
-    '_': lambda x, i: len(x) != i36(i[0]),
-    '!': lambda x, i: any(c == i[0] for c in x),
-    '/': lambda x, i: no_x,
-    '(': lambda x, i: x[0] != i[0],
-    ')': lambda x, i: x[-1] != i[0],
-    '=': lambda x, i: len(x) <= i36(i[0]) or x[i36(i[0])] != i[1],
-    '%': lambda x, i: at_least_n_x,
-    'Q': lambda x, i: x == __memorized__[0]
-}
-
-
 def rule_regex_gen():
     """Generates regex to parse rules"""
     functions = [
@@ -74,67 +55,94 @@ def rule_regex_gen():
     functions += [r'X\w\w\w', '4', '6', 'M']
     functions += ['k', 'K', r'*\w\w', r'L\w', r'R\w', r'+\w', r'-\w',
                   r'.\w', r',\w', r'y\w', r'Y\w', 'E', 'e.', r'3\w.']
+    # reject functions
+    functions += [r'<\w', r'>\w', r'_\w', '!.', '/.', '(.', ').', r'=\w.', r'%\w.', 'Q']
     for i, func in enumerate(functions):
         functions[i] = re.escape(func[0]) + func[1:].replace(r'\w', '[a-zA-Z0-9]')
     rule_regex = '|'.join(functions)
     return re.compile(rule_regex)
 
 
-__functions_regex__ = rule_regex_gen()
+@functools.lru_cache(maxsize=None)
+def functions_regex():
+    """The regex of rule_regex_gen, compiled on first use"""
+    return rule_regex_gen()
+
+
+@functools.lru_cache(maxsize=None)
+def rejected_rules_regex():
+    """The regex of reject_rules_gen, compiled on first use"""
+    return reject_rules_gen()
 
+
+__lazy__ = {'__functions_regex__': functions_regex, '__rejected_rules__': rejected_rules_regex}
+
+
+def __getattr__(name):
+    """Module attributes built on first access (PEP 562), to keep the import fast"""
+    if name in __lazy__:
+        return __lazy__[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Interpreted functions, kept for callers of the old API, RuleEngine uses the
+# compiled functions below. Every function takes the word, its arguments and
+# optionally the RuleContext of the application, which holds the memory and
+# the positional argument 'p'. Without a context the memory is empty and 'p'
+# is 0, nothing is shared between calls.
 function_map = {
-    ':': lambda x, i: x,
-    'l': lambda x, i: x.lower(),
-    'u': lambda x, i: x.upper(),
-    'c': lambda x, i: x.capitalize(),
-    'C': lambda x, i: x.capitalize().swapcase(),
-    't': lambda x, i: x.swapcase()
+    ':': lambda x, i, ctx=None: x,
+    'l': lambda x, i, ctx=None: x.lower(),
+    'u': lambda x, i, ctx=None: x.upper(),
+    'c': lambda x, i, ctx=None: x.capitalize(),
+    'C': lambda x, i, ctx=None: x.capitalize().swapcase(),
+    't': lambda x, i, ctx=None: x.swapcase()
 }
 
 
-def T(x, i):
-    number = i36(i)
+def T(x, i, ctx=None):
+    number = i36(i, ctx)
     return ''.join((x[:number], x[number].swapcase(), x[number + 1:]))
 
 
-def delete_m_start_at_n(word, indices):
+def delete_m_start_at_n(word, indices, ctx=None):
     n, m = indices
-    n = i36(n)
-    m = i36(m)
+    n = i36(n, ctx)
+    m = i36(m, ctx)
     if n + m <= len(word):
         return word[:n] + word[n + m:]
     else:
         return word
 
 
-def overwrite_with_x_at_n(word, indices):
+def overwrite_with_x_at_n(word, indices, ctx=None):
     n, x = indices
-    n = i36(n)
+    n = i36(n, ctx)
     if n >= len(word):
         return word
     return word[:n] + x + word[n + 1:]
 
 
-def insert_x_at_n(word, indices):
+def insert_x_at_n(word, indices, ctx=None):
     n, x = indices
-    n = i36(n)
+    n = i36(n, ctx)
     if n > len(word):
         return word
     return word[:n] + x + word[n:]
 
 
-def delete_at_n(word, indices):
+def delete_at_n(word, indices, ctx=None):
     n, = indices
-    n = i36(n)
+    n = i36(n, ctx)
     if n >= len(word):
         return word
     return word[:n] + word[n + 1:]
 
 
-def swap_nm(word, indices):
+def swap_nm(word, indices, ctx=None):
     n, m = indices
-    n = i36(n)
-    m = i36(m)
+    n = i36(n, ctx)
+    m = i36(m, ctx)
     if n > m:
         bak = n
         n = m
@@ -142,65 +150,65 @@ def swap_nm(word, indices):
     return word[:n] + word[m] + word[n + 1:m] + word[n] + word[m + 1:]
 
 
-def bitwise_left(word, indices):
+def bitwise_left(word, indices, ctx=None):
     n, = indices
-    n = i36(n)
+    n = i36(n, ctx)
     c = ord(word[n])
     c <<= 1
     return word[:n] + chr(c) + word[n + 1:]
 
 
-def bitwise_right(word, indices):
+def bitwise_right(word, indices, ctx=None):
     n, = indices
-    n = i36(n)
+    n = i36(n, ctx)
     c = ord(word[n])
     c >>= 1
     return word[:n] + chr(c) + word[n + 1:]
 
 
-def ascii_incr(word, indices):
+def ascii_incr(word, indices, ctx=None):
     n, = indices
-    n = i36(n)
+    n = i36(n, ctx)
     c = chr(ord(word[n]) + 1)
     return word[:n] + c + word[n + 1:]
 
 
-def ascii_desc(word, indices):
+def ascii_desc(word, indices, ctx=None):
     n, = indices
-    n = i36(n)
+    n = i36(n, ctx)
     c = chr(ord(word[n]) - 1)
     return word[:n] + c + word[n + 1:]
 
 
-def replace_plus(word, indices):
+def replace_plus(word, indices, ctx=None):
     n, = indices
-    n = i36(n)
+    n = i36(n, ctx)
     c = word[n + 1]
     return word[:n] + c + word[n + 1:]
 
 
-def replace_minus(word, indices):
+def replace_minus(word, indices, ctx=None):
     n, = indices
-    n = i36(n)
+    n = i36(n, ctx)
     c = word[n - 1]
     return word[:n] + c + word[n + 1:]
 
 
-def duplicate_first(word, indices):
+def duplicate_first(word, indices, ctx=None):
     n, = indices
-    n = i36(n)
+    n = i36(n, ctx)
     word = word[:n] + word
     return word
 
 
-def duplicate_last(word, indices):
+def duplicate_last(word, indices, ctx=None):
     n, = indices
-    n = i36(n)
+    n = i36(n, ctx)
     word = word + word[-n:]
     return word
 
 
-def title(word, _):
+def title(word, _, ctx=None):
     word = word.lower()
     spaces = [-1]
     for i, c in enumerate(word):
@@ -212,7 +220,7 @@ def title(word, _):
     return "".join(chr_array)
 
 
-def title_x(word, indices):
+def title_x(word, indices, ctx=None):
     word = word.lower()
     x, = indices
     xs = [-1]
@@ -225,9 +233,9 @@ def title_x(word, indices):
     return "".join(chr_array)
 
 
-def title_n(word, indices):
+def title_n(word, indices, ctx=None):
     n, x = indices
-    n = i36(n)
+    n = i36(n, ctx)
     counter = 0
     idx = len(word)
     for i, c in enumerate(word):
@@ -240,29 +248,29 @@ def title_n(word, indices):
 
 
 function_map['T'] = T
-function_map['r'] = lambda x, i: x[::-1]
-function_map['d'] = lambda x, i: x + x
-function_map['p'] = lambda x, i: x * (i36(i) + 1)
-function_map['f'] = lambda x, i: x + x[::-1]
-function_map['{'] = lambda x, i: x[1:] + x[0]
-function_map['}'] = lambda x, i: x[-1] + x[:-1]
-function_map['$'] = lambda x, i: x + i
-function_map['^'] = lambda x, i: i + x
-function_map['['] = lambda x, i: x[1:]
-function_map[']'] = lambda x, i: x[:-1]
+function_map['r'] = lambda x, i, ctx=None: x[::-1]
+function_map['d'] = lambda x, i, ctx=None: x + x
+function_map['p'] = lambda x, i, ctx=None: x * (i36(i, ctx) + 1)
+function_map['f'] = lambda x, i, ctx=None: x + x[::-1]
+function_map['{'] = lambda x, i, ctx=None: x[1:] + x[0]
+function_map['}'] = lambda x, i, ctx=None: x[-1] + x[:-1]
+function_map['$'] = lambda x, i, ctx=None: x + i
+function_map['^'] = lambda x, i, ctx=None: i + x
+function_map['['] = lambda x, i, ctx=None: x[1:]
+function_map[']'] = lambda x, i, ctx=None: x[:-1]
 function_map['D'] = delete_at_n
-function_map['x'] = lambda x, i: x[i36(i[0]):i36(i[1])]
+function_map['x'] = lambda x, i, ctx=None: x[i36(i[0], ctx):i36(i[1], ctx)]
 function_map['O'] = delete_m_start_at_n
 function_map['i'] = insert_x_at_n
 function_map['o'] = overwrite_with_x_at_n
-function_map["'"] = lambda x, i: x[:i36(i)]
-function_map['s'] = lambda x, i: x.replace(i[0], i[1])
-function_map['@'] = lambda x, i: x.replace(i, '')
-function_map['z'] = lambda x, i: x[0] * i36(i) + x
-function_map['Z'] = lambda x, i: x + x[-1] * i36(i)
-function_map['q'] = lambda x, i: ''.join([a * 2 for a in x])
-function_map['k'] = lambda x, i: x[1] + x[0] + x[2:]
-function_map['K'] = lambda x, i: x[:-2] + x[-1] + x[-2]
+function_map["'"] = lambda x, i, ctx=None: x[:i36(i, ctx)]
+function_map['s'] = lambda x, i, ctx=None: x.replace(i[0], i[1])
+function_map['@'] = lambda x, i, ctx=None: x.replace(i, '')
+function_map['z'] = lambda x, i, ctx=None: x[0] * i36(i, ctx) + x
+function_map['Z'] = lambda x, i, ctx=None: x + x[-1] * i36(i, ctx)
+function_map['q'] = lambda x, i, ctx=None: ''.join([a * 2 for a in x])
+function_map['k'] = lambda x, i, ctx=None: x[1] + x[0] + x[2:]
+function_map['K'] = lambda x, i, ctx=None: x[:-2] + x[-1] + x[-2]
 function_map['*'] = swap_nm
 function_map['L'] = bitwise_left
 function_map['R'] = bitwise_right
@@ -276,30 +284,613 @@ function_map['E'] = title
 function_map['e'] = title_x
 function_map['3'] = title_n
 
-__memorized__ = ['']
-
 
-def extract_memory(string, args):
+def extract_memory(string, args, ctx=None):
     """Insert section of stored string into current string"""
-    pos, length, i = map(i36, args)
+    pos, length, i = (i36(a, ctx) for a in args)
     string = list(string)
-    string.insert(i, __memorized__[0][pos:pos + length])
+    string.insert(i, _memory(ctx)[pos:pos + length])
     return ''.join(string)
 
 
-function_map['X'] = extract_memory
-function_map['4'] = lambda x, i: x + __memorized__[0]
-function_map['6'] = lambda x, i: __memorized__[0] + x
-
-
-def memorize(string, _):
+def memorize(string, _, ctx=None):
     """Store current string in memory"""
-    __memorized__[0] = string
+    if ctx is not None:
+        ctx.memory = string
     return string
 
 
+def _memory(ctx):
+    return ctx.memory if ctx is not None else ''
+
+
+function_map['X'] = extract_memory
+function_map['4'] = lambda x, i, ctx=None: x + _memory(ctx)
+function_map['6'] = lambda x, i, ctx=None: _memory(ctx) + x
 function_map['M'] = memorize
 
+"""
+Rule compiler. Every parsed function is turned into a closure whose arguments
+are already decoded, and the closures of one rule are fused into a single
+callable. Functions which used to raise IndexError on short words check the
+bounds explicitly and return the word unchanged, exactly like the interpreted
+engine did by swallowing the exception. Compiled functions take the word and
+the RuleContext of the application.
+"""
+
+
+def _compile_T(n):
+    return lambda x, ctx: x[:n] + x[n].swapcase() + x[n + 1:] if n < len(x) else x
+
+
+def _compile_p(n):
+    n += 1
+    return lambda x, ctx: x * n
+
+
+def _compile_D(n):
+    return lambda x, ctx: x[:n] + x[n + 1:] if n < len(x) else x
+
+
+def _compile_x(n, m):
+    return lambda x, ctx: x[n:m]
+
+
+def _compile_O(n, m):
+    return lambda x, ctx: x[:n] + x[n + m:] if n + m <= len(x) else x
+
+
+def _compile_i(n, c):
+    return lambda x, ctx: x[:n] + c + x[n:] if n <= len(x) else x
+
+
+def _compile_o(n, c):
+    return lambda x, ctx: x[:n] + c + x[n + 1:] if n < len(x) else x
+
+
+def _compile_truncate(n):
+    return lambda x, ctx: x[:n]
+
+
+def _compile_s(a, b):
+    return lambda x, ctx: x.replace(a, b)
+
+
+def _compile_purge(c):
+    return lambda x, ctx: x.replace(c, '')
+
+
+def _compile_z(n):
+    return lambda x, ctx: x[0] * n + x if x else x
+
+
+def _compile_Z(n):
+    return lambda x, ctx: x + x[-1] * n if x else x
+
+
+def _compile_swap(n, m):
+    if n > m:
+        n, m = m, n
+    return lambda x, ctx: x[:n] + x[m] + x[n + 1:m] + x[n] + x[m + 1:] if m < len(x) else x
+
+
+def _compile_chr(n, op):
+    return lambda x, ctx: x[:n] + chr(op(ord(x[n]))) + x[n + 1:] if n < len(x) else x
+
+
+def _compile_L(n):
+    return _compile_chr(n, lambda c: c << 1)
+
+
+def _compile_R(n):
+    return _compile_chr(n, lambda c: c >> 1)
+
+
+def _compile_incr(n):
+    return _compile_chr(n, lambda c: c + 1)
+
+
+def _compile_desc(n):
+    return _compile_chr(n, lambda c: c - 1)
+
+
+def _compile_plus(n):
+    return lambda x, ctx: x[:n] + x[n + 1] + x[n + 1:] if n + 1 < len(x) else x
+
+
+def _compile_minus(n):
+    return lambda x, ctx: x[:n] + x[n - 1] + x[n + 1:] if x and n <= len(x) else x
+
+
+def _compile_y(n):
+    return lambda x, ctx: x[:n] + x
+
+
+def _compile_Y(n):
+    return lambda x, ctx: x + x[-n:]
+
+
+def _compile_title(sep):
+    def step(x, ctx):
+        x_lower = x.lower()
+        if not x_lower or x_lower[-1] == sep:
+            return x
+        chars = list(x_lower)
+        chars[0] = chars[0].upper()
+        for i, a in enumerate(x_lower):
+            if a == sep:
+                chars[i + 1] = chars[i + 1].upper()
+        return ''.join(chars)
+
+    return step
+
+
+def _compile_title_n(n, c):
+    def step(x, ctx):
+        counter = 0
+        for i, a in enumerate(x):
+            if a == c:
+                if counter == n:
+                    i += 1
+                    return x[:i] + x[i].upper() + x[i + 1:] if i < len(x) else x
+                counter += 1
+        return x
+
+    return step
+
+
+def _compile_X(pos, length, i):
+    end = pos + length
+    return lambda x, ctx: x[:i] + ctx.memory[pos:end] + x[i:]
+
+
+def _memorize(x, ctx):
+    ctx.memory = x
+    return x
+
+
+# key -> (builder, argument kinds), 'n' is a base 36 number and 'c' a character
+compile_map = {
+    'T': (_compile_T, 'n'),
+    'p': (_compile_p, 'n'),
+    'D': (_compile_D, 'n'),
+    'x': (_compile_x, 'nn'),
+    'O': (_compile_O, 'nn'),
+    'i': (_compile_i, 'nc'),
+    'o': (_compile_o, 'nc'),
+    "'": (_compile_truncate, 'n'),
+    's': (_compile_s, 'cc'),
+    '@': (_compile_purge, 'c'),
+    'z': (_compile_z, 'n'),
+    'Z': (_compile_Z, 'n'),
+    '*': (_compile_swap, 'nn'),
+    'L': (_compile_L, 'n'),
+    'R': (_compile_R, 'n'),
+    '+': (_compile_incr, 'n'),
+    '-': (_compile_desc, 'n'),
+    '.': (_compile_plus, 'n'),
+    ',': (_compile_minus, 'n'),
+    'y': (_compile_y, 'n'),
+    'Y': (_compile_Y, 'n'),
+    'e': (_compile_title, 'c'),
+    '3': (_compile_title_n, 'nc'),
+    'X': (_compile_X, 'nnn'),
+}
+
+# functions without arguments
+compile_map_no_args = {
+    ':': lambda x, ctx: x,
+    'l': lambda x, ctx: x.lower(),
+    'u': lambda x, ctx: x.upper(),
+    'c': lambda x, ctx: x.capitalize(),
+    'C': lambda x, ctx: x.capitalize().swapcase(),
+    't': lambda x, ctx: x.swapcase(),
+    'r': lambda x, ctx: x[::-1],
+    'd': lambda x, ctx: x + x,
+    'f': lambda x, ctx: x + x[::-1],
+    '{': lambda x, ctx: x[1:] + x[0] if x else x,
+    '}': lambda x, ctx: x[-1] + x[:-1] if x else x,
+    '[': lambda x, ctx: x[1:],
+    ']': lambda x, ctx: x[:-1],
+    'q': lambda x, ctx: ''.join([a * 2 for a in x]),
+    'k': lambda x, ctx: x[1] + x[0] + x[2:] if len(x) > 1 else x,
+    'K': lambda x, ctx: x[:-2] + x[-1] + x[-2] if len(x) > 1 else x,
+    'E': _compile_title(' '),
+    '4': lambda x, ctx: x + ctx.memory,
+    '6': lambda x, ctx: ctx.memory + x,
+    'M': _memorize,
+}
+
+
+def _reject_no_x(c):
+    def rejected(x, ctx):
+        i = x.find(c)
+        if i < 0:
+            return True
+        ctx.p = i
+        return False
+
+    return rejected
+
+
+def _reject_less_than_n_x(n, c):
+    def rejected(x, ctx):
+        if n == 0:
+            return False
+        i = -1
+        for _ in range(n):
+            i = x.find(c, i + 1)
+            if i < 0:
+                return True
+        ctx.p = i
+        return False
+
+    return rejected
+
+
+# Reject functions compile to predicates returning True if the word is rejected
+reject_compile_map = {
+    '<': (lambda n: lambda x, ctx: len(x) > n, 'n'),
+    '>': (lambda n: lambda x, ctx: len(x) < n, 'n'),
+    '_': (lambda n: lambda x, ctx: len(x) != n, 'n'),
+    '!': (lambda c: lambda x, ctx: c in x, 'c'),
+    '/': (_reject_no_x, 'c'),
+    '(': (lambda c: lambda x, ctx: not x.startswith(c), 'c'),
+    ')': (lambda c: lambda x, ctx: not x.endswith(c), 'c'),
+    '=': (lambda n, c: lambda x, ctx: len(x) <= n or x[n] != c, 'nc'),
+    '%': (_reject_less_than_n_x, 'nc'),
+}
+
+reject_compile_map_no_args = {
+    'Q': lambda x, ctx: x == ctx.memory,
+}
+
+"""
+Builders for engines working on bytes, where indexing gives integers. Case
+functions of bytes only change ASCII letters, and the byte arithmetic of 'L',
+'R', '+' and '-' wraps around like in hashcat.
+"""
+
+
+def _compile_T_bytes(n):
+    return lambda x, ctx: x[:n] + x[n:n + 1].swapcase() + x[n + 1:]
+
+
+def _compile_z_bytes(n):
+    return lambda x, ctx: x[:1] * n + x
+
+
+def _compile_Z_bytes(n):
+    return lambda x, ctx: x + x[-1:] * n
+
+
+def _compile_swap_bytes(n, m):
+    if n > m:
+        n, m = m, n
+    return lambda x, ctx: x[:n] + x[m:m + 1] + x[n + 1:m] + x[n:n + 1] + x[m + 1:] if m < len(x) else x
+
+
+def _compile_byte(n, op):
+    return lambda x, ctx: x[:n] + bytes((op(x[n]) & 0xff,)) + x[n + 1:] if n < len(x) else x
+
+
+def _compile_plus_bytes(n):
+    return lambda x, ctx: x[:n] + x[n + 1:n + 2] + x[n + 1:] if n + 1 < len(x) else x
+
+
+def _compile_minus_bytes(n):
+    # x[n - 1] is the last byte for n == 0, like for strings
+    return lambda x, ctx: x[:n] + x[n - 1:n or None] + x[n + 1:] if x and n <= len(x) else x
+
+
+def _compile_title_bytes(sep):
+    s = sep[0]
+
+    def step(x, ctx):
+        x_lower = x.lower()
+        if not x_lower or x_lower[-1] == s:
+            return x
+        chars = bytearray(x_lower)
+        chars[:1] = chars[:1].upper()
+        for i, a in enumerate(x_lower):
+            if a == s:
+                chars[i + 1:i + 2] = chars[i + 1:i + 2].upper()
+        return bytes(chars)
+
+    return step
+
+
+def _compile_title_n_bytes(n, c):
+    def step(x, ctx):
+        i = -1
+        for _ in range(n + 1):
+            i = x.find(c, i + 1)
+            if i < 0:
+                return x
+        i += 1
+        return x[:i] + x[i:i + 1].upper() + x[i + 1:]
+
+    return step
+
+
+def _compile_purge_bytes(c):
+    return lambda x, ctx: x.replace(c, b'')
+
+
+def _double_bytes(x, ctx):
+    doubled = bytearray(2 * len(x))
+    doubled[::2] = x
+    doubled[1::2] = x
+    return bytes(doubled)
+
+
+bytes_compile_map = {
+    **compile_map,
+    'T': (_compile_T_bytes, 'n'),
+    '@': (_compile_purge_bytes, 'c'),
+    'z': (_compile_z_bytes, 'n'),
+    'Z': (_compile_Z_bytes, 'n'),
+    '*': (_compile_swap_bytes, 'nn'),
+    'L': (lambda n: _compile_byte(n, lambda c: c << 1), 'n'),
+    'R': (lambda n: _compile_byte(n, lambda c: c >> 1), 'n'),
+    '+': (lambda n: _compile_byte(n, lambda c: c + 1), 'n'),
+    '-': (lambda n: _compile_byte(n, lambda c: c - 1), 'n'),
+    '.': (_compile_plus_bytes, 'n'),
+    ',': (_compile_minus_bytes, 'n'),
+    'e': (_compile_title_bytes, 'c'),
+    '3': (_compile_title_n_bytes, 'nc'),
+}
+
+bytes_compile_map_no_args = {
+    **compile_map_no_args,
+    '{': lambda x, ctx: x[1:] + x[:1],
+    '}': lambda x, ctx: x[-1:] + x[:-1],
+    'q': _double_bytes,
+    'k': lambda x, ctx: x[1:2] + x[:1] + x[2:],
+    'K': lambda x, ctx: x[:-2] + x[-1:] + x[-2:-1] if len(x) > 1 else x,
+    'E': _compile_title_bytes(b' '),
+}
+
+bytes_reject_compile_map = {
+    **reject_compile_map,
+    '=': (lambda n, c: lambda x, ctx: x[n:n + 1] != c, 'nc'),
+}
+
+__case_functions__ = frozenset('lucCt')
+__context_functions__ = frozenset('M46X/%Q')
+
+
+def _positional(builder, args):
+    """Resolve the positional argument 'p' (None in args) when applied"""
+
+    def step(x, ctx):
+        return builder(*[ctx.p if a is None else a for a in args])(x, ctx)
+
+    return step
+
+
+def _build(table, key, remain, binary=False):
+    builder, kinds = table[key]
+    args = [(None if a == 'p' else int(a, 36)) if kind == 'n' else (a.encode('latin-1') if binary else a)
+            for a, kind in zip(remain, kinds)]
+    if None in args:
+        return _positional(builder, args)
+    return builder(*args)
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _compile(key, remain, binary=False):
+    if key in '$^':
+        data = remain.encode('latin-1') if binary else remain
+        if key == '$':
+            return lambda x, ctx: x + data
+        return lambda x, ctx: data + x
+    no_args = bytes_compile_map_no_args if binary else compile_map_no_args
+    if key in no_args:
+        return no_args[key]
+    if is_reject(key):
+        rejected = _compile_reject(key, remain, binary)
+        return lambda x, ctx: None if rejected(x, ctx) else x
+    return _build(bytes_compile_map if binary else compile_map, key, remain, binary)
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _compile_reject(key, remain, binary=False):
+    if key in reject_compile_map_no_args:
+        return reject_compile_map_no_args[key]
+    return _build(bytes_reject_compile_map if binary else reject_compile_map, key, remain, binary)
+
+
+def is_reject(key: str) -> bool:
+    return key in reject_compile_map or key in reject_compile_map_no_args
+
+
+def compile_function(function: str, binary: bool = False) -> Callable[[str, RuleContext], str]:
+    """
+    Compile a single parsed function, e.g. 'T3', into a closure. A reject
+    function returns None if it rejects the word and the word otherwise. With
+    binary=True the closure works on bytes, and character arguments are
+    encoded with latin-1, so '$\xe9' appends the byte 0xe9.
+    """
+    return _compile(function[0], function[1:], binary)
+
+
+def uses_context(rule) -> bool:
+    """Whether a parsed rule reads or writes its RuleContext"""
+    for function in rule:
+        key = function[0]
+        if key in __context_functions__:
+            return True
+        kinds = compile_map.get(key, reject_compile_map.get(key, (None, '')))[1]
+        if 'p' in function[1:1 + kinds.count('n')]:
+            return True
+    return False
+
+
+def fuse_rule(rule) -> List[Tuple[str, str]]:
+    """
+    Merge adjacent functions of a parsed rule into (key, arguments) pairs.
+    ':' is dropped, a sequence of case functions ending in 'l' or 'u' keeps only
+    the last one, and runs of '$' or '^' become a single append or prepend whose
+    argument is the whole string, e.g. '$1$2$3' becomes ('$', '123').
+    """
+    fused = []
+    for function in rule:
+        key, remain = function[0], function[1:]
+        if key == ':':
+            continue
+        last_key = fused[-1][0] if fused else ''
+        if key in 'lu':
+            while fused and fused[-1][0] in __case_functions__:
+                fused.pop()
+            fused.append((key, remain))
+        elif key == '$' and last_key == '$':
+            fused[-1] = (key, fused[-1][1] + remain)
+        elif key == '^' and last_key == '^':
+            fused[-1] = (key, remain + fused[-1][1])
+        else:
+            fused.append((key, remain))
+    return fused
+
+
+def _chain(steps):
+    if not steps:
+        return lambda x, ctx: x
+    if len(steps) == 1:
+        return steps[0]
+    if len(steps) == 2:
+        first, second = steps
+        return lambda x, ctx: second(first(x, ctx), ctx)
+    steps = tuple(steps)
+
+    def apply_steps(x, ctx):
+        for step in steps:
+            x = step(x, ctx)
+        return x
+
+    return apply_steps
+
+
+def compile_rule(rule, reset_context: bool = True, binary: bool = False) -> Callable[[str, RuleContext], str]:
+    """
+    Compile a parsed rule into a single callable taking a word and a
+    RuleContext, and returning the candidate, or None as soon as a reject
+    function rejects the word. Rules using the context reset it first, so every
+    application starts with an empty memory. See compile_function for binary.
+    """
+    segments = []
+    steps = []
+    for key, remain in fuse_rule(rule):
+        if is_reject(key):
+            segments.append((_chain(steps), _compile_reject(key, remain, binary)))
+            steps = []
+        else:
+            steps.append(_compile(key, remain, binary))
+    apply_steps = _chain(steps)
+    if segments:
+        segments = tuple(segments)
+        tail = apply_steps
+
+        def apply_steps(x, ctx):
+            for segment, rejected in segments:
+                x = segment(x, ctx)
+                if rejected(x, ctx):
+                    return None
+            return tail(x, ctx)
+
+    if not reset_context or not uses_context(rule):
+        return apply_steps
+
+    def apply_with_context(x, ctx):
+        ctx.reset()
+        return apply_steps(x, ctx)
+
+    return apply_with_context
+
+
+class RuleTrie(object):
+    """
+    Prefix tree over parsed rules, so the functions shared by the start of
+    several rules are applied once per word. Chains of nodes without branches
+    are compiled into a single step, and so is the last chain of a rule with
+    the rejected rules. A node whose subtree uses the RuleContext restores the
+    context it was left in before each child, so a rule sees the same context
+    as when it is applied alone.
+    >>> trie = RuleTrie([['l'], ['l', '$1'], ['l', '$1', '$2'], ['c', '$1']])
+    >>> trie.apply('PassWord')
+    ['password', 'password1', 'password12', 'Password1']
+    """
+
+    def __init__(self, rules, indices=None, rejected=(), binary=False):
+        self.n_rules = len(rules)
+        if indices is None:
+            indices = range(len(rules))
+        self.binary = binary
+        self.rejected = list(rejected)
+        self.rejecter = compile_rule(self.rejected, False, binary) if self.rejected else None
+        root = ({}, [])
+        for idx in dict.fromkeys(indices):
+            node = root
+            for function in rules[idx]:
+                if function == ':':
+                    continue
+                node = node[0].setdefault(function, ({}, []))
+            node[1].append(idx)
+        self.root = self._compile_node([], root)[0]
+
+    def _compile_node(self, functions, node):
+        """Compile node into (step, ends, leaves, branches, restore) and whether it uses the context"""
+        children, ends = node
+        # follow the chain while there is nothing to emit and a single child
+        while not ends and len(children) == 1:
+            (function, node), = children.items()
+            functions.append(function)
+            children, ends = node
+        restore = bool(ends) and uses_context(self.rejected)
+        leaves = []
+        branches = []
+        for function, child in children.items():
+            if not child[0] and len(child[1]) == 1:
+                leaves.append((child[1][0], compile_rule([function] + self.rejected, False, self.binary)))
+                restore = restore or uses_context([function] + self.rejected)
+            else:
+                branch, uses = self._compile_node([function], child)
+                branches.append(branch)
+                restore = restore or uses
+        node = (compile_rule(functions, False, self.binary), tuple(ends), tuple(leaves), tuple(branches), restore)
+        return node, restore or uses_context(functions)
+
+    def apply(self, word: str) -> List[str]:
+        """Candidates of every rule indexed like the rules, None if rejected or not in indices"""
+        results = [None] * self.n_rules
+        self._visit(self.root, word, RuleContext(b'' if self.binary else ''), results)
+        return results
+
+    def _visit(self, node, word, ctx, results):
+        step, ends, leaves, branches, restore = node
+        word = step(word, ctx)
+        if word is None:
+            return
+        if not restore:
+            rejecter = self.rejecter
+            for idx in ends:
+                results[idx] = word if rejecter is None else rejecter(word, ctx)
+            for idx, leaf in leaves:
+                results[idx] = leaf(word, ctx)
+            for branch in branches:
+                self._visit(branch, word, ctx, results)
+            return
+        memory, p = ctx.memory, ctx.p
+        for idx in ends:
+            results[idx] = word if self.rejecter is None else self.rejecter(word, ctx)
+            ctx.memory, ctx.p = memory, p
+        for idx, leaf in leaves:
+            results[idx] = leaf(word, ctx)
+            ctx.memory, ctx.p = memory, p
+        for branch in branches:
+            self._visit(branch, word, ctx, results)
+            ctx.memory, ctx.p = memory, p
+
 
 class RuleEngine(object):
     """
@@ -317,6 +908,13 @@ class RuleEngine(object):
     PASSWORDly
     password y
 
+    With strict=True invalid rules raise a PyRuleParser.RuleSyntaxError
+    telling the line and column of the error instead.
+    >>> RuleEngine(['$1', 'T$1'], strict=True)
+    Traceback (most recent call last):
+    ...
+    PyRuleParser.RuleSyntaxError: line 2, column 2: invalid position '$' for 'T': 'T$1'
+
     Initiate with the rules you want to apply and then call .apply for each
     string you want to apply the rules to.
     >>> engine=RuleEngine([':', '$1', 'ss$'])
@@ -332,43 +930,130 @@ class RuleEngine(object):
     princess
     princess1
     prince$$
+
+    With trie=True the rules are applied through a RuleTrie, which saves the
+    work shared by rules starting with the same functions, e.g. 'l$1' and
+    'l$1$2'. The candidates and their order are the same.
+    >>> engine = RuleEngine(['l', 'l$1', 'l$1$2'], trie=True)
+    >>> [word for word, _ in engine.apply('PASS')]
+    ['pass', 'pass1', 'pass12']
+
+    With binary=True words and candidates are bytes, which saves decoding and
+    encoding them around the engine and gives hashcat's byte semantics: case
+    functions only change ASCII letters and 'L', 'R', '+' and '-' wrap around
+    at 256. Character arguments of the rules are encoded with latin-1.
+    >>> [word for word, _ in RuleEngine(['c$1', '+0'], binary=True).apply(b'\\xe9t\\xe9')]
+    [b'\\xe9t\\xe91', b'\\xeat\\xe9']
     """
 
-    def __init__(self, rules=None, rejected_rules=None):
+    def __init__(self, rules=None, rejected_rules=None, trie=False, binary=False, strict=False):
+        self.use_trie = trie
+        self.strict = strict
+        self.binary = binary
+        self.empty = b'' if binary else ''
         if rules is None:
             rules = [':']
-        self.rules = tuple(map(__functions_regex__.findall, rules))
-        self.indices = range(0, len(self.rules))
         if rejected_rules is None:
             rejected_rules = []
-        self.rejected_rules = tuple(map(__rejected_rules__.findall, rejected_rules))
+        self.rejected_rules = tuple(map(list, parse_rejected_rules(rejected_rules, strict)))
+        self.rejecter = compile_rule([f for r in self.rejected_rules for f in r], False, binary)
+        self.change_rules(rules)
 
-    def reject(self, word: str):
-        for rejected_rule in self.rejected_rules:
-            pass
-        pass
+    def reject(self, word: str) -> bool:
+        """Whether word is rejected by any of the rejected rules"""
+        return self.rejecter(word, RuleContext(self.empty)) is None
 
     def apply(self, string: str) -> Tuple[str, List[str]]:
         """
         Apply saved rules to given string. It returns a generator object, so you
-        can't use list indexes on it. """
+        can't use list indexes on it. Candidates rejected by a reject function
+        of their rule or by the rejected rules are skipped. """
+        rules = self.rules
+        if self.trie is not None:
+            results = self.trie.apply(string)
+            for idx in self.indices:
+                word = results[idx]
+                if word is not None:
+                    yield word, rules[idx]
+            return
+        compiled = self.compiled
+        ctx = RuleContext(self.empty)
         for idx in self.indices:
-            rule = self.rules[idx]
-            word = string
-            for function in rule:
-                try:
-                    key = function[0]
-                    func = function_map[key]
-                    remain = function[1:]
-                    word = func(word, remain)
-                except IndexError:
-                    """Some operation like T8 could raise IndexError because the password could be too short."""
-            yield word, rule
+            word = compiled[idx](string, ctx)
+            if word is not None:
+                yield word, rules[idx]
+
+    def apply_indexed(self, string: str):
+        """
+        Like apply, but yields the index of the rule in self.rules and the
+        candidate, which is cheaper to keep than the rule.
+        >>> list(RuleEngine([':', '$1', '<4']).apply_indexed('pass'))
+        [(0, 'pass'), (1, 'pass1'), (2, 'pass')]
+        """
+        if self.trie is not None:
+            results = self.trie.apply(string)
+            for idx in self.indices:
+                word = results[idx]
+                if word is not None:
+                    yield idx, word
+            return
+        compiled = self.compiled
+        ctx = RuleContext(self.empty)
+        for idx in self.indices:
+            word = compiled[idx](string, ctx)
+            if word is not None:
+                yield idx, word
+
+    def apply_batch(self, words, encoding='latin-1', chunk_size=65536):
+        """
+        Apply saved rules to a whole list of words at once with NumPy array
+        operations, see PyBatchEngine.apply_batch. It yields a list of
+        candidates (one per word) and the rule, for every rule. Engines working
+        on bytes take and yield bytes, and ignore encoding.
+        >>> for i in RuleEngine(['$1', 'u']).apply_batch(['pass', 'word']):
+        ...     print(i)
+        ...
+        (['pass1', 'word1'], ['$1'])
+        (['PASS', 'WORD'], ['u'])
+        """
+        from PyBatchEngine import apply_batch
+        return apply_batch(self, words, None if self.binary else encoding, chunk_size)
+
+    @classmethod
+    def from_tokens(cls, rules, rejected_rules=None, trie=False, binary=False, indices=None):
+        """
+        Engine of rules parsed already, e.g. a PyRuleCache.RuleCache, which
+        skips parsing them. Only the rules in indices, all by default, are
+        compiled, the others when change_indices first selects them.
+        >>> engine = RuleEngine.from_tokens([['$1'], ['u'], ['l', '$2']], indices=[2])
+        >>> list(engine.apply_indexed('PASS'))
+        [(2, 'pass2')]
+        """
+        engine = cls([], rejected_rules, trie, binary)
+        engine.change_tokens(rules, indices)
+        return engine
 
     def change_rules(self, new_rules):
         """Replace current rules with new_rules"""
-        self.rules = tuple(map(__functions_regex__.findall, new_rules))
-        self.indices = range(0, len(self.rules))
+        self.change_tokens(tuple(map(list, parse_rules(new_rules, self.strict))))
+
+    def change_tokens(self, new_rules, indices=None):
+        """Replace current rules with parsed rules, which are compiled when selected by indices"""
+        self.rules = new_rules
+        self.compiled = [None] * len(new_rules)
+        self.change_indices(range(0, len(new_rules)) if indices is None else indices)
 
     def change_indices(self, new_indices):
+        compiled = self.compiled
+        rejected = None
+        for idx in new_indices:
+            if compiled[idx] is None:
+                if rejected is None:
+                    # the rejected rules run after every rule
+                    rejected = [f for r in self.rejected_rules for f in r]
+                compiled[idx] = compile_rule(list(self.rules[idx]) + rejected, binary=self.binary)
         self.indices = new_indices
+        self.trie = None
+        if self.use_trie:
+            rejected = [f for r in self.rejected_rules for f in r]
+            self.trie = RuleTrie(self.rules, new_indices, rejected, self.binary)
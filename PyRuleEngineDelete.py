@@ -1,104 +1,271 @@
 import argparse
+import array
+import contextlib
+import itertools
 import json
+import multiprocessing
 import sys
 from json import JSONDecodeError 
 
-from PyRuleEngine import RuleEngine, function_map, i36
+from PyHitLog import HitLogReader, is_hit_log, read_log
+from PyRuleEngine import RuleContext, RuleEngine, compile_function, i36
 
-del_keys = set("lucC[]DxOo'@MX46")
+def events_D(word, indices, ctx):
+    n = i36(indices[0], ctx)
+    return [(n, word[n])] if n < len(word) else []
 
 
-def count_l(word, indices):
-    msg = []
-    for i, c in enumerate(word):
-        if c.isupper():
-            msg.append(f"{i}\t{c}")
-    return 'l\t' + '\t'.join(msg)
+def events_l(word, _, ctx):
+    return [(i, c) for i, c in enumerate(word) if c.isupper()]
 
 
-def count_u(word, indices):
-    msg = []
-    for i, c in enumerate(word):
-        if c.islower():
-            msg.append(f"{i}\t{c}")
-    return 'u\t' + '\t'.join(msg)
+def events_u(word, _, ctx):
+    return [(i, c) for i, c in enumerate(word) if c.islower()]
 
 
-def count_D(word, indices):
-    n, = indices
-    n = i36(n)
-    if n >= len(word):
-        return ""
-    return f"D\t{n}\t{word[n]}\n"
+# key -> function returning the (position, character) pairs the function removes or changes
+event_func_map = {
+    'D': events_D,
+    'l': events_l,
+    'u': events_u,
+}
 
 
-count_func_map = {
-    'D': count_D,
-}
+def check_keys(keys):
+    """Raise a ValueError if a function of keys can't be counted"""
+    unsupported = ''.join(sorted(set(keys) - set(event_func_map)))
+    if unsupported:
+        raise ValueError(f"can't count {unsupported!r}, only {''.join(event_func_map)!r}")
+
+
+class DeleteCounter(object):
+    """
+    How often every function removed or changed every character at every
+    position: one array('Q') of 256 counters per function and position, for
+    the characters below 256, and a dict for the others. Counters of several
+    processes are added up with merge.
+    >>> counter = DeleteCounter()
+    >>> for key, pos, char in [('D', 1, 'a'), ('D', 1, 'a'), ('D', 0, 'b'), ('l', 2, 'P')]:
+    ...     counter.add(key, pos, char)
+    >>> counter.to_dict()
+    {'D': {'0': {'b': 1}, '1': {'a': 2}}, 'l': {'2': {'P': 1}}}
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.other = {}
+
+    def _row(self, key, pos):
+        rows = self.rows.setdefault(key, [])
+        while len(rows) <= pos:
+            rows.append(array.array('Q', bytes(8 * 256)))
+        return rows[pos]
+
+    def add(self, key: str, pos: int, char: str, n: int = 1):
+        code = ord(char)
+        if code < 256:
+            self._row(key, pos)[code] += n
+        else:
+            self.other[key, pos, char] = self.other.get((key, pos, char), 0) + n
+
+    def merge(self, other: 'DeleteCounter'):
+        for key, rows in other.rows.items():
+            for pos, row in enumerate(rows):
+                if any(row):
+                    mine = self._row(key, pos)
+                    for code, n in enumerate(row):
+                        if n:
+                            mine[code] += n
+        for (key, pos, char), n in other.other.items():
+            self.add(key, pos, char, n)
+
+    def to_dict(self):
+        """The counts like reversion.json: {function: {position: {character: count}}}"""
+        dist = {}
+        for key, rows in self.rows.items():
+            for pos, row in enumerate(rows):
+                for code, n in enumerate(row):
+                    if n:
+                        dist.setdefault(key, {}).setdefault(str(pos), {})[chr(code)] = n
+        for (key, pos, char), n in self.other.items():
+            dist.setdefault(key, {}).setdefault(str(pos), {})[char] = n
+        return {key: dict(sorted(dist[key].items(), key=lambda item: int(item[0]))) for key in sorted(dist)}
+
+    @classmethod
+    def from_dict(cls, dist) -> 'DeleteCounter':
+        """Counter of a distribution of to_dict, e.g. a partial result saved as JSON"""
+        counter = cls()
+        for key, positions in dist.items():
+            for pos, chars in positions.items():
+                for char, n in chars.items():
+                    counter.add(key, int(pos), char, n)
+        return counter
 
 
 class RuleEngineDelete(RuleEngine):
-    def __init__(self, rules=None, rejected_rules=None):
+    """
+    keys are the functions whose events count counts, count_delete only
+    writes those of 'D'.
+    """
+
+    def __init__(self, rules=None, rejected_rules=None, keys=('D',)):
         super().__init__(rules, rejected_rules)
+        self.keys = frozenset(keys)
         self.not_ok = set()
+        self.steps = []
         for rule_id, rule in enumerate(self.rules):
-            has_D = any(function[0] in count_func_map for function in rule)
+            has_D = any(function[0] == 'D' or function[0] in self.keys for function in rule)
             if not has_D:
                 self.not_ok.add(rule_id)
+            self.steps.append(tuple((function[0], function[1:], compile_function(function)) for function in rule))
 
     def count_delete(self, string: str, indices, f_out):
+        """Write a line for CountDelete.py for every deletion of 'D' by the rules of indices"""
+        ctx = RuleContext()
         for idx in indices:
             if idx in self.not_ok:
                 continue
-            rule = self.rules[idx]
+            ctx.reset()
             word = string
-            
-            for function in rule:
-                try:
-                    key = function[0]
-                    remain = function[1:]
-                    if key in count_func_map:
-                        fk = count_func_map[key]
-                        res = fk(word, remain)
-                        f_out.write(res)
-                    func = function_map[key]
-                    word = func(word, remain)
-                except IndexError:
-                    """"""
-        pass
+            for key, remain, step in self.steps[idx]:
+                if key == 'D':
+                    for pos, char in events_D(word, remain, ctx):
+                        f_out.write(f"D\t{pos}\t{char}\n")
+                word = step(word, ctx)
+                if word is None:
+                    break
 
-    pass
+    def count(self, string: str, indices, counter: DeleteCounter):
+        """Add the events of the rules in indices applied to string to counter"""
+        ctx = RuleContext()
+        keys = self.keys
+        add = counter.add
+        for idx in indices:
+            if idx in self.not_ok:
+                continue
+            ctx.reset()
+            word = string
+            for key, remain, step in self.steps[idx]:
+                if key in keys:
+                    for pos, char in event_func_map[key](word, remain, ctx):
+                        add(key, pos, char)
+                word = step(word, ctx)
+                if word is None:
+                    break
+
+
+# engine and hit log of the worker
+__worker__ = [None, None]
+
+
+def _init_worker(rules, keys, log_file=None):
+    __worker__[0] = RuleEngineDelete(rules, keys=keys)
+    __worker__[1] = HitLogReader(log_file) if log_file is not None else None
+
+
+def _count_lines(lines):
+    """
+    Counter of a batch of log lines, the number of lines counted and whether a
+    line which isn't JSON ended it
+    """
+    counter = DeleteCounter()
+    engine = __worker__[0]
+    for n, line in enumerate(lines):
+        try:
+            word, rule_ids = json.loads(line)
+        except JSONDecodeError:
+            return counter, n, True
+        engine.count(word, rule_ids, counter)
+    return counter, len(lines), False
+
+
+def _count_records(records):
+    """Counter of a batch of (word, rule ids) records, like _count_lines"""
+    counter = DeleteCounter()
+    engine = __worker__[0]
+    for word, rule_ids in records:
+        engine.count(word, rule_ids, counter)
+    return counter, len(records), False
+
+
+def _count_chunk(i):
+    """Counter of chunk i of the hit log of the worker"""
+    return _count_records(__worker__[1].read_chunk(i))
+
+
+def count_log(log_file: str, keys=('D',), processes: int = 1, batch_size: int = 10000) -> DeleteCounter:
+    """
+    Count the events of a hit log in processes, a binary log of PyHitLog or
+    a JSON lines log. The chunks of an indexed binary log are read by the
+    processes themselves, other logs batch_size records at a time. Like
+    before, a line which isn't JSON, e.g. the last one of a log still being
+    written, ends a JSON log.
+    """
+    check_keys(keys)
+    total = DeleteCounter()
+    with contextlib.ExitStack() as stack:
+        if is_hit_log(log_file):
+            log = HitLogReader(log_file)
+            rules = log.rules
+            if log.chunks is not None:
+                worker_log, func, tasks = log_file, _count_chunk, range(len(log.chunks))
+            else:
+                worker_log, func = None, _count_records
+                records = iter(log)
+                tasks = iter(lambda: list(itertools.islice(records, batch_size)), [])
+        else:
+            f_log = stack.enter_context(open(log_file, 'r'))
+            rules = json.loads(f_log.readline())['rules']
+            worker_log, func = None, _count_lines
+            tasks = iter(lambda: list(itertools.islice(f_log, batch_size)), [])
+        if processes > 1:
+            pool = stack.enter_context(multiprocessing.Pool(processes, _init_worker, (rules, tuple(keys), worker_log)))
+            results = pool.imap(func, tasks)
+        else:
+            _init_worker(rules, tuple(keys), worker_log)
+            results = map(func, tasks)
+        done = 0
+        for counter, n, ended in results:
+            total.merge(counter)
+            done += n
+            print(f"{done}", end='\r', flush=True, file=sys.stderr)
+            if ended:
+                break
+    return total
 
 
 def wrapper():
     cli = argparse.ArgumentParser('Check delete')
-    cli.add_argument('-l', '--log', dest='log', required=True, help='read log file')
+    cli.add_argument('-l', '--log', dest='log', required=True, help='read log file, binary or JSON lines')
     cli.add_argument('-s', '--save', dest='save', help='save result')
+    cli.add_argument('-k', '--keys', dest='keys', default='D', help='functions to count, e.g. Dlu')
+    cli.add_argument('-j', '--processes', dest='processes', type=int, default=1, help='number of processes')
+    cli.add_argument('--tsv', dest='tsv', action='store_true',
+                     help="write every deletion of 'D' as a line for CountDelete.py instead of the counts")
     args = cli.parse_args()
+    try:
+        check_keys(args.keys)
+    except ValueError as e:
+        cli.error(str(e))
     log_file, save_file = args.log, args.save
     if save_file is not None:
-        f_out = open(save_file, 'w')
+        f_out = open(save_file, 'w', encoding='utf-8')
     else:
         f_out = sys.stdout
-    with open(log_file, 'r') as f_log:
-        meta_line = f_log.readline().strip('\r\n')
-        meta = json.loads(meta_line)
-
-        rules = meta['rules']
-        engine = RuleEngineDelete(rules=rules, rejected_rules=None)
-        line_cnt = 1
-        for line in f_log:
-            line = line.strip('\r\n')
-            line_cnt += 1
-            word, rule_ids = json.loads(line)
-            engine.count_delete(word, rule_ids, f_out)
-            if line_cnt % 10000 == 0:
-                print(f"{line_cnt}", end='\r', flush=True, file=sys.stderr)
-            pass
-        pass
+    if not args.tsv:
+        counter = count_log(log_file, args.keys, args.processes)
+        f_out.write(json.dumps(counter.to_dict()))
+        f_out.flush()
+        f_out.close()
+        return
+    rules, records = read_log(log_file)
+    engine = RuleEngineDelete(rules=rules, rejected_rules=None)
+    for line_cnt, (word, rule_ids) in enumerate(records, 2):
+        engine.count_delete(word, rule_ids, f_out)
+        if line_cnt % 10000 == 0:
+            print(f"{line_cnt}", end='\r', flush=True, file=sys.stderr)
     f_out.flush()
     f_out.close()
-    pass
 
 
 if __name__ == '__main__':
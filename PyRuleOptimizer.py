@@ -0,0 +1,201 @@
+"""
+Optimize a rule set: rewrite every rule to a canonical form without no-op
+functions, then drop rules whose canonical form was already seen and,
+optionally, rules which produce the same candidates as an earlier rule on a
+probe word list.
+
+The rewrites assume hashcat semantics, where case functions only change ASCII
+letters, so they are exact for ASCII words.
+"""
+import argparse
+import string
+import sys
+from typing import Dict, List, Sequence, Tuple
+
+from PyHashcat import read_rules, read_words
+from PyRuleEngine import RuleContext, compile_rule
+from PyRuleParser import __signatures__, parse_rule
+
+# functions which only change the case of letters
+__case_only__ = frozenset('lucCtTEe3')
+# functions whose result only depends on the word up to case
+__case_normalizing__ = frozenset('lucC')
+# pairs of adjacent functions which cancel each other, i.e. f(g(x)) == x
+__cancelling__ = frozenset([('r', 'r'), ('t', 't'), ('{', '}'), ('}', '{'), ('k', 'k'), ('K', 'K')])
+# functions f with f(f(x)) == f(x)
+__idempotent__ = frozenset('lucCE')
+
+PROBE_WORDS = [
+    '', 'a', 'Z', 'ab', 'abc', 'aaaa', 'abcabc', 'password', 'Password1', 'p@ssW0rd', 'PASSWORD',
+    'passWORD123', 'hello world', 'Hello World ', 'a b-c_d', 'qwerty123!', 'iloveyou', 'Summer2020',
+    '123456', '000', 'zZ9', 'monkey', 'dragon', 'letmein', 'xx yy zz', 'mississippi', '$pecial#',
+    '1q2w3e4r', 'abcdefghijklmnopqrstuvwxyz0123456789', string.ascii_uppercase, string.punctuation,
+    'Pass Word!?', '~/.,;:[]{}()<>',
+]
+
+
+def _number(a):
+    """Decoded base 36 argument, None for the positional argument 'p'"""
+    return None if a == 'p' else int(a, 36)
+
+
+def is_noop(function: str) -> bool:
+    """Whether a single function never changes a word"""
+    key, remain = function[0], function[1:]
+    if key == ':':
+        return True
+    if key in 'pzZy':
+        return _number(remain[0]) == 0
+    if key == 'O':
+        return _number(remain[1]) == 0
+    if key == 's':
+        return remain[0] == remain[1]
+    return False
+
+
+def _cancels(first: str, second: str) -> bool:
+    if (first, second) in __cancelling__:
+        return True
+    if first[0] == 'T' and first == second and first[1] != 'p':
+        return True
+    # append then truncate right, prepend then truncate left
+    return (first[0], second) in (('$', ']'), ('^', '['))
+
+
+def canonicalize(rule: Sequence[str]) -> Tuple[List[str], int]:
+    """
+    Rewrite a parsed rule into a canonical form. Returns the new list of
+    functions and the number of functions removed.
+    """
+    functions = [f for f in rule if not is_noop(f)]
+    changed = True
+    while changed:
+        changed = False
+        out = []
+        for function in functions:
+            if out:
+                last = out[-1]
+                if _cancels(last, function):
+                    out.pop()
+                    changed = True
+                    continue
+                if last == function and function in __idempotent__:
+                    changed = True
+                    continue
+                if function[0] in __case_normalizing__ and last[0] in __case_only__:
+                    out.pop()
+                    out.append(function)
+                    changed = True
+                    continue
+            out.append(function)
+        functions = out
+    return functions, len(rule) - len(functions)
+
+
+def rule_to_string(rule: Sequence[str]) -> str:
+    return ''.join(rule) if rule else ':'
+
+
+def signature(rule: Sequence[str], words: Sequence[str]) -> tuple:
+    """Candidates of a parsed rule for every word, None where it is rejected"""
+    compiled = compile_rule(rule)
+    ctx = RuleContext()
+    results = []
+    for word in words:
+        try:
+            results.append(compiled(word, ctx))
+        except ValueError:
+            # e.g. '-' on a character with code point 0
+            results.append(ValueError)
+    return tuple(results)
+
+
+def argument_words(rules: Sequence[Sequence[str]]) -> List[str]:
+    """Probe words made of the character arguments of parsed rules, so that e.g. 'sXY' and 'sQR' differ"""
+    chars = {}
+    for rule in rules:
+        for function in rule:
+            for kind, arg in zip(__signatures__.get(function[0], ''), function[1:]):
+                if kind == 'c':
+                    chars[arg] = None
+    words = []
+    for c in chars:
+        words += [c, c * 3, 'a' + c + 'b', c + 'Password1', 'Password1' + c]
+    return words
+
+
+def _is_degenerate(sig: tuple, words: Sequence[str]) -> bool:
+    """Whether a signature rejects every word or leaves every word unchanged, which proves nothing"""
+    return all(c is None for c in sig) or all(c == w for c, w in zip(sig, words))
+
+
+def optimize_rules(rules: Sequence[str], probe_words: Sequence[str] = None) -> Tuple[List[str], Dict[str, int]]:
+    """
+    Optimize a list of rule strings. Returns the kept rules, in canonical form
+    and in their original order, and counts of what was removed. If
+    probe_words is given, rules with the same candidates for all probe words
+    as an earlier rule are dropped as equivalent. The probe words are extended
+    with words of the character arguments of the rules, and rules rejecting
+    every probe word or leaving every probe word unchanged are never dropped.
+    """
+    stats = {'rules': len(rules), 'noop_functions': 0, 'duplicates': 0, 'equivalent': 0, 'kept': 0}
+    seen = set()
+    kept = []
+    for rule in rules:
+        functions, removed = canonicalize(parse_rule(rule))
+        stats['noop_functions'] += removed
+        canonical = rule_to_string(functions)
+        if canonical in seen:
+            stats['duplicates'] += 1
+            continue
+        seen.add(canonical)
+        kept.append((canonical, functions))
+    if probe_words is not None:
+        probe_words = list(probe_words) + argument_words([functions for _, functions in kept])
+        signatures = set()
+        unique = []
+        for canonical, functions in kept:
+            sig = signature(functions, probe_words)
+            if _is_degenerate(sig, probe_words):
+                unique.append((canonical, functions))
+                continue
+            if sig in signatures:
+                stats['equivalent'] += 1
+                continue
+            signatures.add(sig)
+            unique.append((canonical, functions))
+        kept = unique
+    stats['kept'] = len(kept)
+    return [canonical for canonical, _ in kept], stats
+
+
+def wrapper():
+    cli = argparse.ArgumentParser('Optimize rule set')
+    cli.add_argument('-r', '--rules', dest='rules', required=True, help='rule file')
+    cli.add_argument('-s', '--save', dest='save', help='save optimized rules')
+    cli.add_argument('-p', '--probe', dest='probe', help='word list to check equivalence of rules')
+    cli.add_argument('--builtin-probe', dest='builtin_probe', action='store_true',
+                     help='check equivalence of rules on a built-in probe word list')
+    args = cli.parse_args()
+    if args.save is not None:
+        f_out = open(args.save, 'w')
+    else:
+        f_out = sys.stdout
+    probe_words = None
+    if args.probe is not None:
+        probe_words = [word for _, word in read_words(args.probe)]
+    elif args.builtin_probe:
+        probe_words = PROBE_WORDS
+    rules, stats = optimize_rules(read_rules(args.rules), probe_words)
+    for rule in rules:
+        f_out.write(f"{rule}\n")
+    f_out.flush()
+    f_out.close()
+    removed = stats['rules'] - stats['kept']
+    print(f"rules: {stats['rules']}, kept: {stats['kept']}, removed: {removed} "
+          f"(duplicates: {stats['duplicates']}, equivalent: {stats['equivalent']}), "
+          f"no-op functions: {stats['noop_functions']}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    wrapper()
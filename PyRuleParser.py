@@ -0,0 +1,187 @@
+"""
+Tokenizer of hashcat rules shared by the engines. A rule is read in one pass,
+function by function: the first character is the key of the function, which
+tells how many arguments follow and of which kind, a position ('n', base 36
+digits, or 'p' for the position of the last '%' or '/') or any character
+('c'). Every function becomes a token, its key followed by its arguments,
+e.g. 'T3' or 'sa@'.
+
+Lenient parsing skips what isn't a function, as hashcat skips spaces between
+functions. Strict parsing raises a RuleSyntaxError with the line and column
+of the first error instead. Parsed rules are cached by their string, so the
+duplicate lines of large rule files are parsed once.
+"""
+import argparse
+import functools
+import string
+import sys
+from typing import Iterable, List, Optional, Tuple
+
+__positions__ = frozenset(string.digits + string.ascii_letters)
+
+# key -> kinds of the arguments of every function
+__signatures__ = {
+    # for PasswordPro and John the Ripper
+    ':': '', 'l': '', 'u': '', 'c': '', 'C': '', 't': '', 'T': 'n', 'r': '', 'd': '', 'p': 'n', 'f': '',
+    '{': '', '}': '', '$': 'c', '^': 'c', '[': '', ']': '', 'D': 'n', 'x': 'nn', 'O': 'nn', 'i': 'nc',
+    'o': 'nc', "'": 'n', 's': 'cc', '@': 'c', 'z': 'n', 'Z': 'n', 'q': '',
+    # memory
+    'X': 'nnn', '4': '', '6': '', 'M': '',
+    # only for hashcat
+    'k': '', 'K': '', '*': 'nn', 'L': 'n', 'R': 'n', '+': 'n', '-': 'n', '.': 'n', ',': 'n', 'y': 'n',
+    'Y': 'n', 'E': '', 'e': 'c', '3': 'nc',
+    # reject functions
+    '<': 'n', '>': 'n', '_': 'n', '!': 'c', '/': 'c', '(': 'c', ')': 'c', '=': 'nc', '%': 'nc', 'Q': '',
+}
+__reject_keys__ = frozenset('<>_!/()=%Q')
+
+__kind_names__ = {'n': 'position', 'c': 'character'}
+
+
+class RuleSyntaxError(ValueError):
+    """A rule which can't be parsed, column is 1-based and line None if unknown"""
+
+    def __init__(self, rule: str, column: int, message: str, line: Optional[int] = None):
+        self.rule = rule
+        self.column = column
+        self.message = message
+        self.line = line
+        super().__init__(rule, column, message, line)
+
+    def __str__(self):
+        where = f"line {self.line}, column {self.column}" if self.line is not None else f"column {self.column}"
+        return f"{where}: {self.message}: {self.rule!r}"
+
+
+# key -> number of arguments and offsets of the position arguments
+__arities__ = {key: (len(kinds), tuple(j for j, kind in enumerate(kinds) if kind == 'n'))
+               for key, kinds in __signatures__.items()}
+
+
+def _argument_error(rule: str, i: int) -> RuleSyntaxError:
+    key = rule[i]
+    for j, kind in enumerate(__signatures__[key]):
+        if i + 1 + j == len(rule):
+            return RuleSyntaxError(rule, i + 2 + j, f"missing {__kind_names__[kind]} argument of {key!r}")
+        arg = rule[i + 1 + j]
+        if arg not in __positions__ if kind == 'n' else arg == '\n':
+            return RuleSyntaxError(rule, i + 2 + j, f"invalid {__kind_names__[kind]} {arg!r} for {key!r}")
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _tokenize(rule: str, strict: bool) -> Tuple[str, ...]:
+    tokens = []
+    append = tokens.append
+    arities = __arities__
+    positions = __positions__
+    i = 0
+    n = len(rule)
+    while i < n:
+        key = rule[i]
+        arity = arities.get(key)
+        if arity is None:
+            if strict and key != ' ':
+                raise RuleSyntaxError(rule, i + 1, f"unknown function {key!r}")
+            i += 1
+            continue
+        length, checks = arity
+        if not length:
+            append(key)
+            i += 1
+            continue
+        end = i + 1 + length
+        token = rule[i:end]
+        valid = len(token) == length + 1 and '\n' not in token
+        for j in checks:
+            if valid and token[j + 1] not in positions:
+                valid = False
+        if not valid:
+            if strict:
+                raise _argument_error(rule, i)
+            i += 1
+            continue
+        append(token)
+        i = end
+    return tuple(tokens)
+
+
+def parse_rule(rule: str, strict: bool = False, line: Optional[int] = None) -> Tuple[str, ...]:
+    """
+    Tokens of a rule. line is only used in the errors of strict parsing.
+    >>> parse_rule('sa@ T3$1 >8')
+    ('sa@', 'T3', '$1', '>8')
+    >>> parse_rule('T$1')
+    ('$1',)
+    >>> parse_rule('T$1', strict=True, line=4)
+    Traceback (most recent call last):
+    ...
+    PyRuleParser.RuleSyntaxError: line 4, column 2: invalid position '$' for 'T': 'T$1'
+    """
+    try:
+        return _tokenize(rule, strict)
+    except RuleSyntaxError as e:
+        e.line = line
+        raise
+
+
+def parse_rules(rules: Iterable[str], strict: bool = False, first_line: int = 1) -> Tuple[Tuple[str, ...], ...]:
+    """
+    Tokens of every rule, equal rules share the same tuple. Errors count the
+    lines from first_line.
+    """
+    parsed = {}
+    result = []
+    for line, rule in enumerate(rules, first_line):
+        tokens = parsed.get(rule)
+        if tokens is None:
+            tokens = parsed[rule] = parse_rule(rule, strict, line)
+        result.append(tokens)
+    return tuple(result)
+
+
+def parse_rejected_rules(rules: Iterable[str], strict: bool = False) -> Tuple[Tuple[str, ...], ...]:
+    """Tokens of rules made of reject functions only, other functions are skipped or raise"""
+    result = []
+    for line, rule in enumerate(rules, 1):
+        tokens = parse_rule(rule, strict, line)
+        if strict:
+            column = 0
+            for token in tokens:
+                column = rule.index(token, column)
+                if token[0] not in __reject_keys__:
+                    raise RuleSyntaxError(rule, column + 1, f"{token[0]!r} is not a reject function", line)
+                column += len(token)
+        result.append(tuple(token for token in tokens if token[0] in __reject_keys__))
+    return tuple(result)
+
+
+def check_rule_file(rule_path: str) -> List[RuleSyntaxError]:
+    """Errors of every rule of a rule file, with the lines of the file"""
+    errors = []
+    with open(rule_path, 'r') as f_rule:
+        for line, rule in enumerate(f_rule, 1):
+            rule = rule.strip('\r\n')
+            if not rule or rule[0] == '#':
+                continue
+            try:
+                parse_rule(rule, True, line)
+            except RuleSyntaxError as e:
+                errors.append(e)
+    return errors
+
+
+def wrapper():
+    cli = argparse.ArgumentParser('Check the syntax of rule files')
+    cli.add_argument('rules', nargs='+', help='rule files')
+    args = cli.parse_args()
+    n_errors = 0
+    for rule_path in args.rules:
+        for error in check_rule_file(rule_path):
+            print(f"{rule_path}:{error.line}:{error.column}: {error.message}: {error.rule}")
+            n_errors += 1
+    print(f"errors: {n_errors}", file=sys.stderr)
+    sys.exit(1 if n_errors else 0)
+
+
+if __name__ == '__main__':
+    wrapper()
@@ -0,0 +1,100 @@
+"""
+Effectiveness of every rule of a rule set on a word list and a set of target
+passwords: how many candidates a rule generated, how many of them are
+targets (hits) and how many targets it found first (unique hits). Counters
+are arrays indexed by rule id, and found targets are marked in a bytearray
+indexed by target id.
+"""
+import argparse
+import array
+import sys
+from typing import Iterable, List, Sequence, TextIO, Tuple
+
+from PyHashcat import TargetStore, read_rules, read_words
+from PyRuleEngine import RuleEngine
+
+__sort_keys__ = ('hits', 'unique', 'candidates')
+
+
+class RuleStats(object):
+    """
+    >>> stats = RuleStats([':', '$1', 'u', 'c$1'], ['password1', 'Password1', 'ABC'])
+    >>> stats.feed_all(['password', 'abc'])
+    >>> stats.sorted_rules()
+    [('$1', 1, 1, 2), ('u', 1, 1, 2), ('c$1', 1, 1, 2), (':', 0, 0, 2)]
+
+    Targets are either the passwords, e.g. the dict of PyHashcat.read_target,
+    and are then looked up in a dict of target ids, or a TargetStore, which
+    takes less memory but is slower to look up.
+    """
+
+    def __init__(self, rules: Sequence[str], targets, rejected_rules: Sequence[str] = None, binary: bool = False):
+        if isinstance(targets, TargetStore):
+            self.find = targets.find
+        else:
+            ids = {target: i for i, target in enumerate(dict.fromkeys(targets))}
+            self.find = lambda candidate, get=ids.get: get(candidate, -1)
+            targets = ids
+        self.rules = list(rules)
+        self.engine = RuleEngine(self.rules, rejected_rules, binary=binary)
+        zeros = bytes(8 * len(self.rules))
+        self.candidates = array.array('Q', zeros)
+        self.hits = array.array('Q', zeros)
+        self.unique = array.array('Q', zeros)
+        self.found = bytearray(len(targets))
+
+    def feed(self, word):
+        """Apply every rule to word and count"""
+        find = self.find
+        candidates, hits, unique, found = self.candidates, self.hits, self.unique, self.found
+        for idx, candidate in self.engine.apply_indexed(word):
+            candidates[idx] += 1
+            i = find(candidate)
+            if i >= 0:
+                hits[idx] += 1
+                if not found[i]:
+                    found[i] = 1
+                    unique[idx] += 1
+
+    def feed_all(self, words: Iterable):
+        for word in words:
+            self.feed(word)
+
+    def sorted_rules(self, key: str = 'hits') -> List[Tuple[str, int, int, int]]:
+        """
+        (rule, hits, unique hits, candidates) of every rule, most effective
+        first according to key, rules with equal counts in their original order.
+        """
+        if key not in __sort_keys__:
+            raise ValueError(f"unknown sort key {key}, choose from {', '.join(__sort_keys__)}")
+        counter = getattr(self, key)
+        order = sorted(range(len(self.rules)), key=lambda idx: -counter[idx])
+        return [(self.rules[idx], self.hits[idx], self.unique[idx], self.candidates[idx]) for idx in order]
+
+    def dump(self, f_out: TextIO, key: str = 'hits'):
+        """Write hits, unique hits, candidates and rule, tab separated, sorted by key"""
+        for rule, hits, unique, candidates in self.sorted_rules(key):
+            f_out.write(f"{hits}\t{unique}\t{candidates}\t{rule}\n")
+
+
+def wrapper():
+    cli = argparse.ArgumentParser('Count hits of every rule')
+    cli.add_argument('-w', '--words', dest='words', required=True, help='word list')
+    cli.add_argument('-r', '--rules', dest='rules', required=True, help='rule file')
+    cli.add_argument('-t', '--target', dest='target', required=True, help='target passwords')
+    cli.add_argument('-s', '--save', dest='save', help='save statistics')
+    cli.add_argument('-k', '--sort', dest='sort', choices=__sort_keys__, default='hits', help='sort rules by')
+    args = cli.parse_args()
+    if args.save is not None:
+        f_out = open(args.save, 'w')
+    else:
+        f_out = sys.stdout
+    stats = RuleStats(read_rules(args.rules), TargetStore.from_file(args.target))
+    stats.feed_all(word for _, word in read_words(args.words))
+    stats.dump(f_out, args.sort)
+    f_out.flush()
+    f_out.close()
+
+
+if __name__ == '__main__':
+    wrapper()
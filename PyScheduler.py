@@ -0,0 +1,142 @@
+"""
+Apply the most productive rules first. The scheduler applies every rule to a
+sample of the words, ranks the rules by their rate of new hits (hits on
+targets not found before, per candidate), and applies the rules in that
+order to the rest of the words, chunk by chunk, rule by rule. The ranking
+is updated with the hits of every chunk, so the rules which keep finding
+new targets move up while the run goes on.
+"""
+import argparse
+import array
+import collections
+import itertools
+import sys
+import time
+from typing import Callable, Generator, Iterable, List, Sequence, Tuple
+
+from PyCrack import DigestTable, __digest_sizes__, hash_function
+from PyHashcat import TargetStore, read_rules, read_words
+from PyRuleEngine import RuleContext, RuleEngine
+
+
+class AdaptiveScheduler(object):
+    """
+    is_hit tells whether a candidate is a target, e.g. TargetStore.__contains__
+    for passwords or a lookup of its digest for hashes. A target is only
+    counted, and reported, the first time it is hit.
+
+    With deterministic=True the ranking is updated after every chunk, so a run
+    on the same input always applies the rules in the same order, and equal
+    rates are ranked by rule id. Otherwise the ranking is updated whenever
+    interval seconds have passed, also in the middle of a chunk.
+    >>> scheduler = AdaptiveScheduler([':', '$1', '$2'], {'a2', 'b2', 'c1', 'd2'}.__contains__,
+    ...                               sample_size=1, chunk_size=2)
+    >>> [candidate for candidate, _, _ in scheduler.run(['a', 'b', 'c', 'd'])]
+    ['a2', 'b2', 'c1', 'd2']
+    >>> scheduler.order
+    [2, 1, 0]
+    """
+
+    def __init__(self, rules: Sequence[str], is_hit: Callable[[str], bool], rejected_rules: Sequence[str] = None,
+                 sample_size: int = 1000, chunk_size: int = 10000, deterministic: bool = True,
+                 interval: float = 10.0, binary: bool = False):
+        self.engine = RuleEngine(rules, rejected_rules, binary=binary)
+        self.is_hit = is_hit
+        self.sample_size = sample_size
+        self.chunk_size = chunk_size
+        self.deterministic = deterministic
+        self.interval = interval
+        zeros = bytes(8 * len(self.engine.rules))
+        self.candidates = array.array('Q', zeros)
+        self.hits = array.array('Q', zeros)
+        self.found = set()
+        self.order = list(range(len(self.engine.rules)))
+
+    def rate(self, idx: int) -> float:
+        """New hits per candidate of rule idx"""
+        return self.hits[idx] / self.candidates[idx] if self.candidates[idx] else 0.0
+
+    def rank(self, indices: Iterable[int]) -> List[int]:
+        """Sort rule ids by decreasing rate, equal rates by rule id"""
+        return sorted(indices, key=lambda idx: (-self.rate(idx), idx))
+
+    def _count(self, idx: int, candidate) -> bool:
+        self.candidates[idx] += 1
+        if candidate in self.found or not self.is_hit(candidate):
+            return False
+        self.found.add(candidate)
+        self.hits[idx] += 1
+        return True
+
+    def run(self, words: Iterable) -> Generator[Tuple[str, str, List[str]], None, None]:
+        """Yield (candidate, word, rule) for every new hit"""
+        engine = self.engine
+        rules = engine.rules
+        words = iter(words)
+        # every rule on the sample
+        for word in itertools.islice(words, self.sample_size):
+            for idx, candidate in engine.apply_indexed(word):
+                if self._count(idx, candidate):
+                    yield candidate, word, rules[idx]
+        self.order = self.rank(self.order)
+        engine.change_indices(self.order)
+        last = time.monotonic()
+        ctx = RuleContext(engine.empty)
+        while True:
+            chunk = list(itertools.islice(words, self.chunk_size))
+            if not chunk:
+                break
+            remaining = collections.deque(self.order)
+            while remaining:
+                idx = remaining.popleft()
+                compiled = engine.compiled[idx]
+                for word in chunk:
+                    candidate = compiled(word, ctx)
+                    if candidate is not None and self._count(idx, candidate):
+                        yield candidate, word, rules[idx]
+                if not self.deterministic and time.monotonic() - last >= self.interval:
+                    remaining = collections.deque(self.rank(remaining))
+                    last = time.monotonic()
+            self.order = self.rank(self.order)
+            engine.change_indices(self.order)
+
+
+def wrapper():
+    cli = argparse.ArgumentParser('Crack with the most productive rules first')
+    cli.add_argument('-w', '--words', dest='words', required=True, help='word list')
+    cli.add_argument('-r', '--rules', dest='rules', required=True, help='rule file')
+    cli.add_argument('-t', '--target', dest='target', required=True, help='target hashes or passwords')
+    cli.add_argument('-m', '--mode', dest='mode', choices=list(__digest_sizes__) + ['plain'], default='plain',
+                     help='hash algorithm of the targets, or plain for passwords')
+    cli.add_argument('-s', '--save', dest='save', help='save hits')
+    cli.add_argument('-o', '--order', dest='order', help='save the rules in their final order')
+    cli.add_argument('--sample', dest='sample', type=int, default=1000, help='words to rank the rules on')
+    cli.add_argument('--chunk-size', dest='chunk_size', type=int, default=10000)
+    cli.add_argument('--interval', dest='interval', type=float, default=None,
+                     help='update the ranking every interval seconds instead of after every chunk')
+    args = cli.parse_args()
+    if args.save is not None:
+        f_out = open(args.save, 'w')
+    else:
+        f_out = sys.stdout
+    if args.mode == 'plain':
+        is_hit = TargetStore.from_file(args.target).__contains__
+    else:
+        table = DigestTable.from_file(args.target, args.mode)
+        digest = hash_function(args.mode)
+        is_hit = lambda candidate: digest(candidate.encode('utf-8', 'surrogateescape')) in table
+    rules = read_rules(args.rules)
+    scheduler = AdaptiveScheduler(rules, is_hit, sample_size=args.sample, chunk_size=args.chunk_size,
+                                  deterministic=args.interval is None, interval=args.interval or 0.0)
+    for candidate, word, rule in scheduler.run(word for _, word in read_words(args.words)):
+        f_out.write(f"{candidate}\t{word}\t{''.join(rule)}\n")
+    f_out.flush()
+    f_out.close()
+    if args.order is not None:
+        with open(args.order, 'w') as f_order:
+            for idx in scheduler.order:
+                f_order.write(f"{rules[idx]}\n")
+
+
+if __name__ == '__main__':
+    wrapper()
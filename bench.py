@@ -1,26 +1,268 @@
+"""
+Benchmarks of the rule engines. Every benchmark applies rules to a word list
+generated with a fixed seed and reports the number of candidates, the best
+time of a few repeats, the throughput in candidates per second and the peak
+resident memory. Every benchmark runs in a fresh process, so its peak memory
+doesn't include the benchmarks before it. Results can be saved as JSON and compared
+with a saved baseline, in which case a benchmark whose throughput dropped by
+more than the tolerance is reported as a regression and the exit status is 1.
+
+    python bench.py -s baseline.json
+    python bench.py -b baseline.json -f 'function/*'
+    python bench.py -r best64.rule -f 'ruleset/best64/*'
+"""
+import argparse
+import fnmatch
+import functools
+import json
+import multiprocessing
+import os
+import platform
 import random
 import string
+import subprocess
+import sys
 import time
+from typing import Callable, Dict, List, Sequence
 
+import PyParallel
+import PyReversionEngine
 import PyRuleEngine
+from PyHashcat import read_rules
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# one rule using every function, keyed by the function
+FUNCTION_SAMPLES = {
+    ':': ':', 'l': 'l', 'u': 'u', 'c': 'c', 'C': 'C', 't': 't', 'T': 'T3', 'r': 'r', 'd': 'd', 'p': 'p2',
+    'f': 'f', '{': '{', '}': '}', '$': '$1', '^': '^1', '[': '[', ']': ']', 'D': 'D3', 'x': 'x04',
+    'O': 'O12', 'i': 'i4!', 'o': 'o3$', "'": "'6", 's': 'ss$', '@': '@s', 'z': 'z2', 'Z': 'Z2', 'q': 'q',
+    'X': 'lMX428', '4': 'uMl4', '6': 'rMr6', 'M': 'uMl', 'k': 'k', 'K': 'K', '*': '*13', 'L': 'L2',
+    'R': 'R2', '+': '+2', '-': '-2', '.': '.2', ',': ',3', 'y': 'y2', 'Y': 'Y2', 'E': 'E', 'e': 'e-',
+    '3': '30-',
+    # reject functions
+    '<': '<9', '>': '>5', '_': '_8', '!': '!a', '/': '/a', '(': '(p', ')': ')d', '=': '=1a', '%': '%2a',
+    'Q': 'MlQ',
+}
+
+# frequently used rules, in the spirit of hashcat's best64
+COMMON_RULES = [
+    ':', 'r', 'u', 'T0', '$0', '$1', '$2', '$3', '$4', '$5', '$6', '$7', '$8', '$9', '$0$0', '$0$1', '$0$2',
+    '$1$1', '$1$2', '$1$3', '$2$1', '$2$2', '$2$3', '$6$9', '$7$7', '$8$8', '$9$9', '$1$2$3', '$e', '$s',
+    ']$a', ']]$s', ']]$a', ']]$e$r', ']]]$e', 'c', 'l', '^1', 'c$1', 'c$1$2$3', 'u$1', 'sa@', 'se3', 'si1',
+    'so0', 'ss$', 'd', 'f', '{', '}', '[', ']', "'5", "'6", 'D2', 'D3', 'D4', 'i1!', 'o0d', 'z2', 'Z2',
+    'x06', 'O12', 'k', 'K',
+]
+
+SYLLABLES = ['pa', 'ss', 'wo', 'rd', 'dra', 'gon', 'mon', 'key', 'sun', 'shi', 'ne', 'lo', 've', 'pri',
+             'ncess', 'foot', 'ball', 'star', 'qwe', 'rty', 'ma', 'ster', 'hel', 'lo', 'ti', 'ger', 'an',
+             'na', 'ch', 'ar', 'lie', 'ro', 'se', 'bas', 'ket', 'jor', 'dan', 'al', 'ex']
+
+
+def word_list(distribution: str, n: int, seed: int) -> List[str]:
+    """
+    Generate n words with a fixed seed. 'short' words are 1 to 6 lowercase
+    letters, 'common' words look like real passwords (syllables with some
+    capitals, digits and symbols) and 'long' words are 16 to 40 printable
+    characters.
+    """
+    rng = random.Random(f'{seed}-{distribution}')
+    if distribution == 'short':
+        return [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(1, 6))) for _ in range(n)]
+    if distribution == 'long':
+        chars = string.ascii_letters + string.digits + string.punctuation + ' '
+        return [''.join(rng.choices(chars, k=rng.randint(16, 40))) for _ in range(n)]
+    words = []
+    for _ in range(n):
+        word = ''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4)))
+        if rng.random() < 0.3:
+            word = word.capitalize()
+        if rng.random() < 0.6:
+            word += ''.join(rng.choices(string.digits, k=rng.choice([1, 2, 2, 4])))
+        if rng.random() < 0.1:
+            word += rng.choice('!@#$.*')
+        words.append(word)
+    return words
+
+
+def combination_rules(n: int, seed: int) -> List[str]:
+    """n rules chaining 2 to 5 random functions"""
+    rng = random.Random(f'{seed}-combinations')
+    samples = sorted(FUNCTION_SAMPLES.values())
+    return [''.join(rng.choices(samples, k=rng.randint(2, 5))) for _ in range(n)]
+
+
+def peak_rss() -> int:
+    """Peak resident memory in kilobytes of the process or of its largest child"""
+    if resource is None:
+        return 0
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in bytes on macOS
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def count_apply(engine, words: Sequence[str]) -> int:
+    n = 0
+    for word in words:
+        for _ in engine.apply(word):
+            n += 1
+    return n
+
+
+def count_batch(engine, words: Sequence[str]) -> int:
+    n = 0
+    for candidates, _ in engine.apply_batch(words):
+        n += len(candidates) - candidates.count(None)
+    return n
+
+
+def count_parallel(rules: Sequence[str], words: Sequence[str], processes: int) -> int:
+    return sum(len(chunk) for chunk in PyParallel.generate(words, rules, processes, chunk_size=2000))
+
+
+def measure(run: Callable[[], int], repeat: int) -> Dict[str, float]:
+    """Run a benchmark repeat times and keep the best time"""
+    best = None
+    candidates = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        candidates = run()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return {
+        'candidates': candidates,
+        'seconds': round(best, 6),
+        'candidates_per_second': round(candidates / best) if best else 0,
+        'peak_rss_kb': peak_rss(),
+    }
+
+
+def measure_isolated(name: str, argv: List[str]) -> Dict[str, float]:
+    """Measure one benchmark in a new process started with the options argv"""
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), '--isolated', name] + argv,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout)
+
+
+def benchmarks(n_words: int, seed: int, processes: int, rule_files: Sequence[str] = ()):
+    """
+    Yield (name, setup) for every benchmark, setup() builds the engine and the
+    words of the benchmark and returns its run function. Nothing is built until
+    setup() is called. rule_files are benchmarked like the built-in rule sets.
+    """
+    words = functools.lru_cache(maxsize=None)(lambda distribution: word_list(distribution, n_words, seed))
+    distributions = ['short', 'common', 'long']
+    reject_keys = list(PyRuleEngine.reject_compile_map) + list(PyRuleEngine.reject_compile_map_no_args)
+    for key in list(PyRuleEngine.function_map) + reject_keys:
+        yield f'function/{key}', lambda key=key: functools.partial(
+            count_apply, PyRuleEngine.RuleEngine([FUNCTION_SAMPLES[key]]), words('common'))
+    for key in PyReversionEngine.function_map:
+        yield f'reversion/{key}', lambda key=key: functools.partial(
+            count_apply, PyReversionEngine.ReversionEngine([FUNCTION_SAMPLES[key]]), words('common'))
+    rule_sets = {'common': COMMON_RULES, 'combinations': combination_rules(len(COMMON_RULES), seed)}
+    for rule_path in rule_files:
+        rule_sets[os.path.splitext(os.path.basename(rule_path))[0]] = read_rules(rule_path)
+    for name, rules in rule_sets.items():
+        for distribution in distributions:
+            yield f'ruleset/{name}/{distribution}', lambda rules=rules, d=distribution: functools.partial(
+                count_apply, PyRuleEngine.RuleEngine(rules), words(d))
+    for name, rules in rule_sets.items():
+        yield f'trie/{name}/common', lambda rules=rules: functools.partial(
+            count_apply, PyRuleEngine.RuleEngine(rules, trie=True), words('common'))
+    yield 'binary/common/common', lambda: functools.partial(
+        count_apply, PyRuleEngine.RuleEngine(COMMON_RULES, binary=True), [word.encode() for word in words('common')])
+    yield 'ruleset/common-rejected/common', lambda: functools.partial(
+        count_apply, PyRuleEngine.RuleEngine(COMMON_RULES, ['<9', '>5']), words('common'))
+    if numpy is not None:
+        for name, rules in rule_sets.items():
+            yield f'batch/{name}/common', lambda rules=rules: functools.partial(
+                count_batch, PyRuleEngine.RuleEngine(rules), words('common'))
+    n = 1
+    while n <= processes:
+        yield f'parallel/common/{n}', lambda n=n: functools.partial(count_parallel, COMMON_RULES, words('common'), n)
+        n *= 2
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Print the throughput relative to baseline and return the regressed benchmarks"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline or not baseline[name]['candidates_per_second']:
+            continue
+        ratio = result['candidates_per_second'] / baseline[name]['candidates_per_second']
+        regressed = ratio < 1 - tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<36}{ratio:>8.2f}x{'  REGRESSION' if regressed else ''}")
+    return regressions
 
 
-def main():
-    input_list = [''.join(random.choice(string.printable) for _ in range(10))
-                  for _ in range(1000000)]
-    engines = []
-    for rule in [':', 'l', 'u', 'c', 'C', 't', 'T3', 'r', 'd', 'p2', 'f',
-                 '{', '}', '$1', '^1', '[', ']', 'D3', 'x04', 'O12', 'i4!',
-                 'o3$', "'6", 'ss$', '@s', 'z2', 'Z2', 'q', 'lMX428', 'uMl4',
-                 'rMr6', 'lMuX084']:
-        engines.append((rule, PyRuleEngine.RuleEngine([rule])))
-    for rule, engine in engines:
-        start = time.time()
-        for base in input_list:
-            list(engine.apply(base))
-        print('%s%s%s' % (rule, ' ' * (10 - len(rule)),
-                          round(time.time() - start, 4)))
+def wrapper():
+    cli = argparse.ArgumentParser('Benchmark the rule engines')
+    cli.add_argument('-n', '--words', dest='words', type=int, default=20000, help='number of words per word list')
+    cli.add_argument('--seed', dest='seed', type=int, default=0, help='seed of the generated word lists')
+    cli.add_argument('--repeat', dest='repeat', type=int, default=3, help='repeats of every benchmark')
+    cli.add_argument('-j', '--processes', dest='processes', type=int, default=min(4, multiprocessing.cpu_count()),
+                     help='maximum number of processes of the parallel benchmarks')
+    cli.add_argument('-r', '--rules', dest='rules', action='append', default=[],
+                     help='rule file to benchmark as a rule set named after the file, e.g. best64.rule')
+    cli.add_argument('-f', '--filter', dest='filter', action='append',
+                     help='only run benchmarks matching this pattern, e.g. "function/*"')
+    cli.add_argument('-s', '--save', dest='save', help='save results as JSON')
+    cli.add_argument('-b', '--baseline', dest='baseline', help='JSON results to compare with')
+    cli.add_argument('-t', '--tolerance', dest='tolerance', type=float, default=0.1,
+                     help='allowed relative drop of throughput')
+    cli.add_argument('--isolated', dest='isolated', help=argparse.SUPPRESS)
+    args = cli.parse_args()
+    if args.isolated is not None:
+        setup = dict(benchmarks(args.words, args.seed, args.processes, args.rules))[args.isolated]
+        run = setup()
+        print(json.dumps(measure(run, args.repeat)))
+        return
+    argv = ['-n', str(args.words), '--seed', str(args.seed), '--repeat', str(args.repeat), '-j', str(args.processes)]
+    for rule_path in args.rules:
+        argv += ['-r', os.path.abspath(rule_path)]
+    results = {}
+    for name, _ in benchmarks(args.words, args.seed, args.processes, args.rules):
+        if args.filter and not any(fnmatch.fnmatchcase(name, pattern) for pattern in args.filter):
+            continue
+        result = measure_isolated(name, argv)
+        results[name] = result
+        print(f"{name:<36}{result['candidates_per_second']:>12} c/s{result['seconds']:>10.4f} s"
+              f"{result['peak_rss_kb']:>10} KB")
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'numpy': numpy.__version__ if numpy is not None else None,
+            'words': args.words,
+            'seed': args.seed,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.save is not None:
+        with open(args.save, 'w') as f_out:
+            json.dump(report, f_out, indent=2)
+    if args.baseline is not None:
+        with open(args.baseline) as f_in:
+            baseline = json.load(f_in)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions: {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
 
 
 if __name__ == '__main__':
-    main()
+    wrapper()
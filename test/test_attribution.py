@@ -0,0 +1,44 @@
+import random
+import unittest
+
+from PyAttribution import Attribution
+from PyRuleEngine import RuleEngine
+
+RULES = [':', '$1', '$1$2$3', '^a', 'r', 'd', 'f', '{', '}', 'sa@', 'T0', 'i3x', 'z2', 'Z1', 't', 'l', 'D2',
+         'u$1', 'c', 'C', '[', ']', "'3", 'o0a', '@b']
+
+
+class AttributionTest(unittest.TestCase):
+    def test_forward(self):
+        rng = random.Random(3)
+        words = {''.join(rng.choice('abcAB@1') for _ in range(rng.randrange(1, 7))) for _ in range(300)}
+        engine = RuleEngine(RULES)
+        hits = {(candidate, word, idx) for word in words for idx, candidate in engine.apply_indexed(word)}
+        targets = {candidate for candidate, word, _ in hits if word < 'b'}
+        found = set(Attribution(RULES, words).attribute(targets))
+        # every attribution is a real one
+        self.assertLessEqual(found, hits)
+        expected = {hit for hit in hits if hit[0] in targets}
+        # rules losing at most the case find what the forward run finds
+        reversible = {RULES.index(r) for r in [':', '$1', '$1$2$3', '^a', 'r', 'f', '{', '}', 'T0', 't', 'l',
+                                               'u$1', 'c', 'C']}
+        self.assertLessEqual({hit for hit in expected if hit[2] in reversible}, found)
+
+    def test_lossy(self):
+        rules = [']', '[', 'D2', "'3", 'o0a', 'O11', 'lD2']
+        words = ['dragon1', 'mike', 'sunny', 'rose', 'mark', 'monkey', 'SUnny']
+        engine = RuleEngine(rules)
+        targets = {candidate for word in words for _, candidate in engine.apply_indexed(word)}
+        found = {(word, rules[idx]) for _, word, idx in Attribution(rules, words).attribute(targets)}
+        for pair in zip(words, rules):
+            self.assertIn(pair, found)
+
+    def test_rule_hits(self):
+        attribution = Attribution([':', '$1', 'r'], ['pass', 'word'])
+        hits = attribution.rule_hits({'pass1': 2, 'drow': 1, 'pass': 1, 'other': 5})
+        self.assertEqual(hits, {':': 1, '$1': 2, 'r': 1})
+        self.assertEqual(attribution.stats['confirmed'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+
+from PyRuleEngine import RuleEngine
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+WORDS = ['', 'a', 'ab', 'p@ssW0rd', 'p@ssW0rd w0rld', 'pass-word', 'mycomputer', '4210021837']
+RULES = [
+    ':', 'l', 'u', 'c', 'C', 't', 'T3', 'r', 'd', 'p2', 'f', '{', '}', '$1$2', '^1^2', '[', ']',
+    'D3', 'x04', 'O12', 'i4!', 'o3$', "'6", 'ss$', '@s', 'z2', 'Z2', 'q', 'lMX428', 'uMl4', 'rMr6',
+    'lMuX084', 'k', 'K', '*34', '*33', 'R2', '+2', '-1', '.1', ',1', ',0', 'y2', 'Y2', 'Y0', 'E',
+    'e-', '30-', 'swfO94', 'O46z2', 'i8iD6', 'Tp', '>5$1', '<5', '_4', '!a', '/s', '(p', ')d', '=1@',
+    '%2s', 'MQ', 'M$1Q', '/sDp',
+]
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class BatchTest(unittest.TestCase):
+    def test_same_as_apply(self):
+        engine = RuleEngine(RULES)
+        batch = list(engine.apply_batch(WORDS))
+        self.assertEqual(len(batch), len(RULES))
+        for idx, (candidates, rule) in enumerate(batch):
+            engine.change_indices([idx])
+            expected = [next(engine.apply(word), (None,))[0] for word in WORDS]
+            self.assertEqual(candidates, expected, RULES[idx])
+
+    def test_chunks(self):
+        engine = RuleEngine(['$1', 'u'])
+        batch = list(engine.apply_batch(['a', 'b', 'c'], chunk_size=2))
+        self.assertEqual([c for c, _ in batch], [['a1', 'b1'], ['A', 'B'], ['c1'], ['C']])
+
+    def test_not_latin1(self):
+        rules = RULES + ['$€', '^€', 'sa€', 'i2€', '@€']
+        words = WORDS + ['€uro', 'a€b', 'ab€']
+        engine = RuleEngine(rules)
+        for idx, (candidates, rule) in enumerate(engine.apply_batch(words)):
+            engine.change_indices([idx])
+            expected = [next(engine.apply(word), (None,))[0] for word in words]
+            self.assertEqual(candidates, expected, rules[idx])
+            engine.change_indices(range(len(rules)))
+
+    def test_binary(self):
+        engine = RuleEngine(RULES, binary=True)
+        words = [word.encode('latin-1') for word in WORDS] + [b'\xe9t\xe9', b'\xff\x00']
+        for idx, (candidates, rule) in enumerate(engine.apply_batch(words)):
+            engine.change_indices([idx])
+            expected = [next(engine.apply(word), (None,))[0] for word in words]
+            self.assertEqual(candidates, expected, RULES[idx])
+            engine.change_indices(range(len(RULES)))
+
+
+if __name__ == '__main__':
+    unittest.main()
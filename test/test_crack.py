@@ -0,0 +1,80 @@
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from PyCrack import DigestTable, _md4, count_hits, crack, hash_function
+from PyHashcat import TargetStore
+from PyHitLog import HitLogReader
+from PyRuleEngine import RuleEngine
+
+
+class CrackTest(unittest.TestCase):
+    def test_md4(self):
+        self.assertEqual(_md4(b'').hex(), '31d6cfe0d16ae931b73c59d7e0c089c0')
+        self.assertEqual(_md4(b'abc').hex(), 'a448017aaf21d8525fc10ae87aa6729d')
+        self.assertEqual(_md4(b'1234567890' * 8).hex(), 'e33b4ddc9c38f2199c3e7b164fcc0536')
+        self.assertEqual(hash_function('ntlm')(b'password').hex(), '8846f7eaee8fb117ad06bdd830b7586c')
+
+    def test_table(self):
+        digests = [hashlib.sha1(str(i).encode()).digest() for i in range(1000)]
+        table = DigestTable(digests + digests[:10], 20)
+        self.assertEqual(len(table), 1000)
+        for d in digests:
+            self.assertIn(d, table)
+        self.assertNotIn(hashlib.sha1(b'x').digest(), table)
+        # same first 8 bytes
+        self.assertNotIn(digests[0][:8] + bytes(12), table)
+
+    def test_from_file(self):
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f_out:
+            f_out.write(f"{hashlib.md5(b'password1').hexdigest()}\n{hashlib.md5(b'abc').hexdigest().upper()}:abc\n"
+                        f"nothex\n{hashlib.sha1(b'abc').hexdigest()}\n")
+        table = DigestTable.from_file(path, 'md5')
+        os.remove(path)
+        self.assertEqual(len(table), 2)
+        self.assertIn(hashlib.md5(b'abc').digest(), table)
+
+    def test_crack(self):
+        engine = RuleEngine([':', '$1', 'u', 'c$1'])
+        for algorithm in ['md5', 'sha1', 'sha256', 'ntlm']:
+            digest = hash_function(algorithm)
+            table = DigestTable([digest(b'password1'), digest(b'ABC'), digest(b'Password1')],
+                                len(digest(b'')))
+            hits = list(crack(engine, ['password', 'abc', 'password'], table, algorithm, batch_size=3))
+            self.assertEqual([(c, w, ''.join(r)) for c, w, r, _ in hits],
+                             [('password1', 'password', '$1'), ('Password1', 'password', 'c$1'), ('ABC', 'abc', 'u')])
+            self.assertEqual(hits[0][3], digest(b'password1').hex())
+        binary = RuleEngine([':', '$1'], binary=True)
+        table = DigestTable([hashlib.md5(b'\xe91').digest()], 16)
+        self.assertEqual([c for c, _, _, _ in crack(binary, [b'\xe9'], table, 'md5')], [b'\xe91'])
+
+    def test_count_hits(self):
+        engine = RuleEngine([':', '$1', 'u', '$2'])
+        targets = TargetStore([b'password1', b'password1', b'abc', b'ABC'])
+        hits = count_hits(engine, ['password', 'abc'], targets)
+        self.assertEqual(list(hits), [1, 2, 1, 0])
+
+    def test_wrapper_plain(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = {name: os.path.join(tmp, name) for name in ('words', 'rules', 'target', 'hits', 'hit.log')}
+            for name, lines in (('words', ['password', 'abc']), ('rules', [':', '$1', 'u']),
+                                ('target', ['password1', 'abc', 'ABC'])):
+                with open(paths[name], 'w') as f:
+                    f.write('\n'.join(lines) + '\n')
+            cli = [sys.executable, os.path.join(root, 'PyCrack.py'), '-m', 'plain', '-w', paths['words'],
+                   '-r', paths['rules'], '-t', paths['target'], '-s', paths['hits']]
+            subprocess.run(cli, cwd=root, capture_output=True, check=True)
+            subprocess.run(cli + ['-H', paths['hit.log']], cwd=root, capture_output=True, check=True)
+            with open(paths['hits']) as f:
+                self.assertEqual(f.read(), ':\t1\n$1\t1\nu\t1\n')
+            log = HitLogReader(paths['hit.log'])
+            self.assertEqual((log.rules, list(log)), ([':', '$1', 'u'], [('password', [1]), ('abc', [0, 2])]))
+
+
+if __name__ == '__main__':
+    unittest.main()
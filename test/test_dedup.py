@@ -0,0 +1,42 @@
+import io
+import unittest
+
+from PyDedupWriter import BloomFilter, DedupWriter
+from PyRuleEngine import RuleEngine
+
+
+class DedupTest(unittest.TestCase):
+    def test_bloom(self):
+        bloom = BloomFilter(1000, 0.01)
+        self.assertFalse(bloom.add(b'password'))
+        self.assertTrue(bloom.add(b'password'))
+        self.assertIn(b'password', bloom)
+        f = io.BytesIO()
+        bloom.save(f)
+        f.seek(0)
+        loaded = BloomFilter.load(f)
+        self.assertIn(b'password', loaded)
+        self.assertEqual(loaded.bits, bloom.bits)
+        false_positives = sum(str(i).encode() in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_writer(self):
+        f_out = io.BytesIO()
+        writer = DedupWriter(f_out, capacity=100, buffer_size=8)
+        engine = RuleEngine([':', 'l', 'c', 'u', '$1'])
+        for word in ['password', 'Password', 'PASSWORD', 'abc']:
+            writer.feed(engine.apply(word))
+        writer.flush()
+        written = f_out.getvalue().split(b'\n')
+        self.assertEqual(written[-1], b'')
+        self.assertEqual(len(written[:-1]), len(set(written[:-1])))
+        self.assertEqual(written[:-1], [b'password', b'Password', b'PASSWORD', b'password1', b'Password1',
+                                        b'PASSWORD1', b'abc', b'Abc', b'ABC', b'abc1'])
+        stats = writer.stats()
+        self.assertEqual(stats['candidates'], 20)
+        self.assertEqual(stats['written'], 10)
+        self.assertEqual(stats['word_duplicates'] + stats['global_duplicates'], 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
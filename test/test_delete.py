@@ -0,0 +1,127 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from CountDelete import read_log, split_log
+from PyRuleEngineDelete import DeleteCounter, RuleEngineDelete, _count_lines, _init_worker, count_log
+
+RULES = ['D0', 'D2$1', 'lD1', 'u', ':', 'D9']
+WORDS = ['password', 'Monkey', 'abc', 'DRAGON\xe9ć', 'x']
+
+
+class DeleteCounterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.tmp.name, 'hits.log')
+        with open(self.log_path, 'w') as f_log:
+            f_log.write(json.dumps({'rules': RULES}) + '\n')
+            for i, word in enumerate(WORDS * 7):
+                f_log.write(json.dumps([word, list(range(i % len(RULES), len(RULES)))]) + '\n')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_same_as_tsv(self):
+        engine = RuleEngineDelete(RULES)
+        tsv = io.StringIO()
+        with open(self.log_path) as f_log:
+            f_log.readline()
+            for line in f_log:
+                word, rule_ids = json.loads(line)
+                engine.count_delete(word, rule_ids, tsv)
+        tsv_path = os.path.join(self.tmp.name, 'delete.tsv')
+        with open(tsv_path, 'w') as f_tsv:
+            f_tsv.write(tsv.getvalue())
+        self.assertEqual(count_log(self.log_path).to_dict(), json.loads(read_log(tsv_path)))
+
+    def test_keys(self):
+        counter = DeleteCounter()
+        RuleEngineDelete(['lD1', 'u'], keys='Dlu').count('MoNkć', [0, 1], counter)
+        self.assertEqual(counter.to_dict(), {'D': {'1': {'o': 1}}, 'l': {'0': {'M': 1}, '2': {'N': 1}},
+                                             'u': {'1': {'o': 1}, '3': {'k': 1}, '4': {'ć': 1}}})
+
+    def test_merge(self):
+        full = count_log(self.log_path, 'Dlu')
+        parallel = count_log(self.log_path, 'Dlu', processes=2, batch_size=4)
+        self.assertEqual(parallel.to_dict(), full.to_dict())
+        merged = DeleteCounter.from_dict(full.to_dict())
+        merged.merge(full)
+        doubled = {key: {pos: {c: 2 * n for c, n in chars.items()} for pos, chars in positions.items()}
+                   for key, positions in full.to_dict().items()}
+        self.assertEqual(merged.to_dict(), doubled)
+
+    def test_truncated_log(self):
+        with open(self.log_path) as f_log:
+            lines = f_log.readlines()
+        with open(self.log_path, 'w') as f_log:
+            f_log.writelines(lines[:11])
+            f_log.write(lines[11][:5])
+            f_log.writelines(lines[12:])
+        truncated = os.path.join(self.tmp.name, 'head.log')
+        with open(truncated, 'w') as f_log:
+            f_log.writelines(lines[:11])
+        self.assertEqual(count_log(self.log_path, processes=2, batch_size=3).to_dict(),
+                         count_log(truncated).to_dict())
+
+    def test_unsupported_keys(self):
+        with self.assertRaises(ValueError):
+            count_log(self.log_path, 'Dx', processes=2)
+
+    def test_batch_sizes(self):
+        _init_worker(RULES, ('D',))
+        with open(self.log_path) as f_log:
+            lines = f_log.readlines()[1:]
+        self.assertEqual(_count_lines(lines[:5])[1:], (5, False))
+        self.assertEqual(_count_lines(lines[:3] + ['["unfinished", ['] + lines[3:5])[1:], (3, True))
+
+
+class CountDeleteTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.tmp.name, 'delete.tsv')
+        lines = [f"{'Dlu'[i % 3]}\t{i % 5}\t{'abć'[i % 7 % 3]}\n" for i in range(100)]
+        with open(self.log_path, 'w', encoding='utf-8') as f_log:
+            f_log.writelines(lines)
+            f_log.write('D\t0\ta')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_split_log(self):
+        size = os.path.getsize(self.log_path)
+        ranges = split_log(self.log_path, 50)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], size)
+        with open(self.log_path, 'rb') as f_log:
+            data = f_log.read()
+        for (_, stop), (start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(stop, start)
+            self.assertEqual(data[stop - 1:stop], b'\n')
+        self.assertEqual(split_log(self.log_path, 1 << 20), [(0, size)])
+
+    def test_chunks(self):
+        expected = {}
+        with open(self.log_path, encoding='utf-8') as f_log:
+            for line in f_log:
+                key, pos, char = line.strip('\n').split('\t')
+                chars = expected.setdefault(key, {}).setdefault(pos, {})
+                chars[char] = chars.get(char, 0) + 1
+        full = read_log(self.log_path)
+        self.assertEqual(full, json.dumps(expected))
+        self.assertEqual(read_log(self.log_path, chunk_size=7), full)
+        self.assertEqual(read_log(self.log_path, processes=2, chunk_size=50), full)
+
+    def test_crlf(self):
+        full = read_log(self.log_path)
+        with open(self.log_path, 'rb') as f_log:
+            data = f_log.read()
+        with open(self.log_path, 'wb') as f_log:
+            f_log.write(data.replace(b'\n', b'\r\n'))
+        self.assertEqual(read_log(self.log_path), full)
+        self.assertEqual(read_log(self.log_path, chunk_size=7), full)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from PyDistributed import _connect, claim, create_queue, merge, plan_chunks, run_chunk, status, work, work_local
+from PyRuleEngine import RuleEngine
+
+RULES = [':', 'u', 'c$1', '$1$2', 'r', '>6d', 'sa@', '<5']
+
+
+class DistributedTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.words = os.path.join(self.directory, 'words.txt')
+        self.words_list = ['password', 'abc', 'monkey', 'dragon', 'x', 'sunshine', 'qwerty', 'admin', 'letmein']
+        with open(self.words, 'w') as f_out:
+            f_out.write('\n'.join(self.words_list * 3))
+        self.queue = os.path.join(self.directory, 'queue.db')
+        self.out_dir = os.path.join(self.directory, 'out')
+        os.makedirs(self.out_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def expected(self):
+        engine = RuleEngine(RULES)
+        return [c for word in self.words_list * 3 for c, _ in engine.apply(word)]
+
+    def test_plan(self):
+        chunks = plan_chunks(RULES, self.words, 3, 2)
+        self.assertEqual(chunks, plan_chunks(RULES, self.words, 3, 2))
+        self.assertEqual(len(chunks), 6)
+        self.assertEqual([(c['word_start'], c['word_stop']) for c in chunks[::2]], [(1, 10), (10, 19), (19, 28)])
+        self.assertEqual(chunks[0]['rule_start'], 0)
+        self.assertEqual(chunks[1]['rule_stop'], len(RULES))
+        self.assertEqual(chunks[0]['rule_stop'], chunks[1]['rule_start'])
+
+    def test_plan_calibration(self):
+        calibration = {':': 1e-7, 'u': 1e-7, 'c': 1e-7, '$': 1e-7, 'r': 1e-7, '>': 1e-7, 'd': 1e-7, 's': 1e-7,
+                       '<': 1e-4}
+        chunks = plan_chunks(RULES, self.words, 1, 2, calibration=calibration)
+        self.assertEqual(chunks, plan_chunks(RULES, self.words, 1, 2, calibration=calibration))
+        self.assertEqual([(c['rule_start'], c['rule_stop']) for c in chunks], [(0, 7), (7, 8)])
+        self.assertAlmostEqual(sum(c['cost'] for c in chunks), 27 * (10 * 1e-7 + 1e-4))
+
+    def test_single_worker(self):
+        create_queue(self.queue, self.words, RULES, plan_chunks(RULES, self.words, 3, 1))
+        with self.assertRaises(ValueError):
+            create_queue(self.queue, self.words, RULES, plan_chunks(RULES, self.words, 3, 1))
+        self.assertEqual(work(self.queue, self.out_dir), 3)
+        self.assertEqual(status(self.queue), {'done': 3})
+        f_out = io.BytesIO()
+        stats = merge(self.queue, self.out_dir, f_out)
+        self.assertEqual(f_out.getvalue().decode().split('\n')[:-1], self.expected())
+        self.assertEqual(stats['candidates'], len(self.expected()))
+        self.assertEqual(stats['rules'][0], 27)
+
+    def test_processes(self):
+        create_queue(self.queue, self.words, RULES, plan_chunks(RULES, self.words, 4, 3))
+        self.assertEqual(work_local(self.queue, self.out_dir, processes=3), 12)
+        f_out = io.BytesIO()
+        merge(self.queue, self.out_dir, f_out)
+        self.assertEqual(sorted(f_out.getvalue().decode().split('\n')[:-1]), sorted(self.expected()))
+
+    def test_reclaim(self):
+        create_queue(self.queue, self.words, RULES, plan_chunks(RULES, self.words, 2, 1))
+        db = _connect(self.queue)
+        self.assertEqual(claim(db, 'dead')['id'], 0)
+        self.assertEqual(claim(db, 'other')['id'], 1)
+        self.assertIsNone(claim(db, 'other'))
+        db.close()
+        with self.assertRaises(ValueError):
+            merge(self.queue, self.out_dir, io.BytesIO())
+        # both chunks are running, but claimed long enough ago
+        self.assertEqual(work(self.queue, self.out_dir, 'new', timeout=0), 2)
+        f_out = io.BytesIO()
+        merge(self.queue, self.out_dir, f_out)
+        self.assertEqual(f_out.getvalue().decode().split('\n')[:-1], self.expected())
+
+    def test_reclaim_running(self):
+        create_queue(self.queue, self.words, RULES, plan_chunks(RULES, self.words, 2, 1))
+        db = _connect(self.queue)
+        chunk = claim(db, 'slow')
+        db.close()
+        started = threading.Event()
+        resume = threading.Event()
+
+        class SlowEngine(RuleEngine):
+            def apply_indexed(self, string):
+                started.set()
+                resume.wait(10)
+                return super().apply_indexed(string)
+
+        errors = []
+
+        def run_slow():
+            try:
+                run_chunk(SlowEngine(RULES), self.words, chunk, self.out_dir)
+            except Exception as e:
+                errors.append(e)
+
+        # the first worker is still writing the chunk when another one claims it again
+        slow = threading.Thread(target=run_slow)
+        slow.start()
+        self.assertTrue(started.wait(10))
+        self.assertEqual(work(self.queue, self.out_dir, 'new', timeout=0), 2)
+        resume.set()
+        slow.join()
+        self.assertEqual(errors, [])
+        f_out = io.BytesIO()
+        merge(self.queue, self.out_dir, f_out)
+        self.assertEqual(f_out.getvalue().decode().split('\n')[:-1], self.expected())
+        self.assertEqual(sorted(os.listdir(self.out_dir)), ['chunk-000000.txt', 'chunk-000001.txt'])
+
+
+if __name__ == '__main__':
+    unittest.main()
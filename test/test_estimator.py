@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+
+from PyEstimator import estimate, sample_words, split_rules, split_words
+from PyRuleEngine import RuleEngine
+
+
+class EstimatorTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        self.words = [('w' * (i % 12)) + str(i) for i in range(5000)]
+        with os.fdopen(fd, 'w') as f_out:
+            f_out.write('\n'.join(self.words))
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_sample(self):
+        n, sample = sample_words(self.path, 500, seed=1)
+        self.assertEqual(n, 5000)
+        self.assertEqual(len(sample), 500)
+        self.assertTrue(set(sample) <= set(self.words))
+        self.assertEqual(sample_words(self.path, 500, seed=1), (n, sample))
+        self.assertEqual(sample_words(self.path, 10000), (5000, self.words))
+
+    def test_estimate(self):
+        rules = [':', '$1', 'd', '<8', '>9$1', '/w']
+        n, sample = sample_words(self.path, 1000)
+        result = estimate(rules, n, sample)
+        engine = RuleEngine(rules)
+        real = [0] * len(rules)
+        for word in self.words:
+            for idx, _ in engine.apply_indexed(word):
+                real[idx] += 1
+        for r, count in zip(result['rules'], real):
+            if r['exact']:
+                self.assertEqual(r['candidates'], count)
+            else:
+                self.assertAlmostEqual(r['candidates'] / count, 1, delta=0.1)
+        self.assertEqual([r['exact'] for r in result['rules']], [True, True, True, False, False, False])
+        self.assertEqual(result['candidates'], sum(r['candidates'] for r in result['rules']))
+        # the whole list as sample gives exact counts
+        result = estimate(rules, len(self.words), self.words, max_length=9)
+        self.assertTrue(all(r['exact'] for r in result['rules']))
+        self.assertEqual(result['rules'][0]['candidates'], sum(len(w) <= 9 for w in self.words))
+        self.assertGreater(result['duplicate_ratio'], 0)
+
+    def test_calibration(self):
+        result = estimate([':', '$1$2', 'u'], 100, ['a', 'b'], calibration={':': 1e-6, '$': 2e-6})
+        for r, seconds in zip(result['rules'], [1e-4, 4e-4, 2e-4]):
+            self.assertAlmostEqual(r['seconds'], seconds)
+
+    def test_split(self):
+        self.assertEqual(split_rules([1, 1, 1, 1, 4], 2), [(0, 4), (4, 5)])
+        self.assertEqual(split_rules([5, 0, 0], 3), [(0, 1), (1, 2), (2, 3)])
+        self.assertEqual(split_rules([1, 1], 5), [(0, 1), (1, 2)])
+        self.assertEqual(split_words(10, 3), [(1, 5), (5, 8), (8, 11)])
+        self.assertEqual(split_words(2, 4), [(1, 2), (2, 3)])
+
+
+if __name__ == '__main__':
+    unittest.main()
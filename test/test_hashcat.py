@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+
+from PyHashcat import TargetStore, build_line_index, iter_lines, read_words, read_words_bytes, seek_line
+
+
+class ReaderTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as f_out:
+            f_out.write(b'password\r\n123456\n$HEX[70617373e9]\n\nqwerty\nlast')
+
+    def tearDown(self):
+        os.remove(self.path)
+        if os.path.exists(self.path + '.idx'):
+            os.remove(self.path + '.idx')
+
+    def test_iter_lines(self):
+        lines = list(iter_lines(self.path))
+        self.assertEqual([line for _, line in lines], [b'password', b'123456', b'pass\xe9', b'', b'qwerty', b'last'])
+        self.assertEqual(lines[1][0], 10)
+        self.assertEqual(list(iter_lines(self.path, lines[4][0])), lines[4:])
+
+    def test_seek(self):
+        build_line_index(self.path, step=2)
+        offsets = [offset for offset, _ in iter_lines(self.path)]
+        for line, offset in enumerate(offsets):
+            self.assertEqual(seek_line(self.path, line), offset)
+        expected = [(idx, word.encode()) for idx, word in read_words(self.path, 4)]
+        self.assertEqual(list(read_words_bytes(self.path, 4)), expected)
+        self.assertEqual(list(read_words_bytes(self.path, 5)), [(4, b'qwerty'), (5, b'last')])
+
+    def test_unwritable_index(self):
+        # a directory in place of the index can't be written, like a read-only directory
+        os.mkdir(self.path + '.idx')
+        try:
+            offsets = [offset for offset, _ in iter_lines(self.path)]
+            self.assertEqual(seek_line(self.path, 4), offsets[4])
+            self.assertEqual(list(read_words_bytes(self.path, 5)), [(4, b'qwerty'), (5, b'last')])
+        finally:
+            os.rmdir(self.path + '.idx')
+
+    def test_target_store(self):
+        store = TargetStore.from_file(self.path)
+        self.assertIn(b'123456', store)
+        self.assertIn('qwerty', store)
+        self.assertNotIn(b'1234567', store)
+        self.assertEqual(store.count(b'password'), 1)
+        self.assertEqual(TargetStore(['a', 'b', 'a']).count('a'), 2)
+        self.assertEqual(len(TargetStore(['a', 'b', 'a'])), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from PyCrack import count_hits
+from PyHashcat import TargetStore
+from PyHitLog import HitLogReader, HitLogWriter, convert, decode_varint, encode_varint, is_hit_log, read_log
+from PyRuleEngine import RuleEngine
+from PyRuleEngineDelete import count_log
+
+RULES = ['D0', 'D2$1', 'lD1', 'u', ':', 'D9'] + ['$%d' % i for i in range(300)]
+WORDS = ['password', 'Monkey', 'abc', 'DRAGON\xe9ć', 'x', 'bad\udce9', '']
+
+
+def records(n):
+    return [(WORDS[i % len(WORDS)], [(i * 7 + j * 131) % len(RULES) for j in range(i % 4)]) for i in range(n)]
+
+
+def write(log_records, chunk_size=3, close=True):
+    f_log = io.BytesIO()
+    writer = HitLogWriter(f_log, RULES, chunk_size)
+    for word, rule_ids in log_records:
+        writer.write(word, rule_ids)
+    if close:
+        writer.close()
+    return f_log.getvalue()
+
+
+class HitLogTest(unittest.TestCase):
+    def test_varint(self):
+        out = bytearray()
+        for n in (0, 127, 128, 300, 1 << 40):
+            encode_varint(n, out)
+        pos = 0
+        values = []
+        while pos < len(out):
+            n, pos = decode_varint(out, pos)
+            values.append(n)
+        self.assertEqual(values, [0, 127, 128, 300, 1 << 40])
+
+    def test_round_trip(self):
+        log_records = records(20)
+        log = HitLogReader(write(log_records))
+        self.assertEqual(log.rules, RULES)
+        self.assertEqual(list(log), log_records)
+        self.assertEqual([n for _, n in log.chunks], [3] * 6 + [2])
+        self.assertEqual(log.read_chunk(2), log_records[6:9])
+
+    def test_empty(self):
+        log = HitLogReader(write([]))
+        self.assertEqual(list(log), [])
+        self.assertEqual(log.chunks, [])
+
+    def test_without_index(self):
+        log_records = records(20)
+        data = write(log_records, close=False)
+        log = HitLogReader(data)
+        self.assertIsNone(log.chunks)
+        self.assertEqual(list(log), log_records[:18])
+        # an incomplete chunk ends the log, wherever it is cut
+        log = HitLogReader(data)
+        ends = []
+        pos = log.start
+        while pos < len(data):
+            pos = log._chunk(pos)[1]
+            ends.append(pos)
+        for size in range(log.start, len(data) + 1):
+            complete = sum(1 for end in ends if end <= size)
+            self.assertEqual(list(HitLogReader(data[:size])), log_records[:3 * complete], size)
+
+    def test_not_a_log(self):
+        with self.assertRaises(ValueError):
+            HitLogReader(b'["password", [1]]\n')
+
+
+class ConvertTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.json_path = os.path.join(self.tmp.name, 'hits.json')
+        self.log_path = os.path.join(self.tmp.name, 'hits.log')
+        self.records = records(50)
+        with open(self.json_path, 'w') as f_log:
+            f_log.write(json.dumps({'rules': RULES}) + '\n')
+            for word, rule_ids in self.records:
+                f_log.write(json.dumps([word, rule_ids]) + '\n')
+            f_log.write('["unfinished", [')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_convert(self):
+        self.assertEqual(convert(self.json_path, self.log_path, chunk_size=8), 50)
+        self.assertTrue(is_hit_log(self.log_path))
+        self.assertFalse(is_hit_log(self.json_path))
+        rules, log_records = read_log(self.log_path)
+        self.assertEqual((rules, list(log_records)), (RULES, self.records))
+        rules, log_records = read_log(self.json_path)
+        self.assertEqual((rules, list(log_records)), (RULES, self.records))
+
+    def test_count_log(self):
+        convert(self.json_path, self.log_path, chunk_size=8)
+        expected = count_log(self.json_path, 'Dlu').to_dict()
+        self.assertEqual(count_log(self.log_path, 'Dlu').to_dict(), expected)
+        self.assertEqual(count_log(self.log_path, 'Dlu', processes=2).to_dict(), expected)
+
+    def test_crack_hit_log(self):
+        engine = RuleEngine([':', '$1', 'u', '$2'])
+        targets = TargetStore([b'password1', b'abc', b'ABC'])
+        f_log = io.BytesIO()
+        with HitLogWriter(f_log, [':', '$1', 'u', '$2']) as hit_log:
+            count_hits(engine, ['password', 'abc', 'monkey'], targets, hit_log)
+        self.assertEqual(list(HitLogReader(f_log.getvalue())), [('password', [1]), ('abc', [0, 2])])
+
+
+if __name__ == '__main__':
+    unittest.main()
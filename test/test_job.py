@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from PyJob import GenerationJob
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptedJob(GenerationJob):
+    """Stops right after the n-th checkpoint, like a killed process"""
+
+    def __init__(self, *args, stop_after=1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stop_after = stop_after
+
+    def save_checkpoint(self, *args, **kwargs):
+        super().save_checkpoint(*args, **kwargs)
+        self.stop_after -= 1
+        if self.stop_after == 0:
+            raise Interrupted()
+
+
+class JobTest(unittest.TestCase):
+    rules = [':', 'l', 'u', 'c', '$1', 'r', 'd', 'sa@']
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.words = os.path.join(self.directory, 'words.txt')
+        with open(self.words, 'wb') as f_out:
+            f_out.write(b'password\nPassword\r\nabc\n\nqwerty\n$HEX[616263]\nlast')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_job(self, name, job_class=GenerationJob, **kwargs):
+        out = os.path.join(self.directory, name)
+        job = job_class(self.words, self.rules, out, interval=0, rule_block=3, capacity=1000, **kwargs)
+        return out, job
+
+    def read(self, path):
+        with open(path, 'rb') as f_in:
+            return f_in.read()
+
+    def test_resume(self):
+        out, job = self.run_job('full.txt')
+        stats = job.run()
+        expected = self.read(out)
+        self.assertEqual(stats['written'], len(expected.split(b'\n')) - 1)
+        self.assertEqual(stats['bytes_written'], len(expected))
+        # every checkpoint is a possible crash point
+        for stop_after in range(1, 20):
+            out, job = self.run_job('resumed.txt', InterruptedJob, stop_after=stop_after)
+            with self.assertRaises(Interrupted):
+                job.run()
+            # simulate output written after the checkpoint, which must be discarded
+            with open(out, 'ab') as f_out:
+                f_out.write(b'garbage\n')
+            _, job = self.run_job('resumed.txt')
+            self.assertEqual(job.run(), stats)
+            self.assertEqual(self.read(out), expected)
+            blooms = [name for name in os.listdir(self.directory) if name.startswith('resumed.txt.checkpoint.bloom.')]
+            self.assertEqual(len(blooms), 1)
+            for name in os.listdir(self.directory):
+                if name.startswith('resumed.txt'):
+                    os.remove(os.path.join(self.directory, name))
+
+    def test_done(self):
+        out, job = self.run_job('out.txt')
+        stats = job.run()
+        _, job = self.run_job('out.txt')
+        self.assertEqual(job.run(), stats)
+
+    def test_rules_changed(self):
+        out, job = self.run_job('out.txt')
+        job.run()
+        job = GenerationJob(self.words, self.rules[:-1], out)
+        with self.assertRaises(ValueError):
+            job.run()
+        rules = self.rules[:-1] + ['sa4']
+        job = GenerationJob(self.words, rules, out)
+        with self.assertRaises(ValueError):
+            job.run()
+
+    def test_other_words(self):
+        out, job = self.run_job('out.txt')
+        job.run()
+        words = os.path.join(self.directory, 'other.txt')
+        shutil.copy2(self.words, words)
+        job = GenerationJob(words, self.rules, out)
+        with self.assertRaises(ValueError):
+            job.run()
+
+    def test_words_changed(self):
+        out, job = self.run_job('out.txt', InterruptedJob)
+        with self.assertRaises(Interrupted):
+            job.run()
+        with open(self.words, 'ab') as f_out:
+            f_out.write(b'\nmore')
+        _, job = self.run_job('out.txt')
+        with self.assertRaises(ValueError):
+            job.run()
+
+
+if __name__ == '__main__':
+    unittest.main()
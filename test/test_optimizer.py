@@ -0,0 +1,33 @@
+import unittest
+
+from PyRuleOptimizer import PROBE_WORDS, canonicalize, optimize_rules
+
+
+class OptimizerTest(unittest.TestCase):
+    def test_canonicalize(self):
+        self.assertEqual(canonicalize([':']), ([], 1))
+        self.assertEqual(canonicalize(['l', 'u']), (['u'], 1))
+        self.assertEqual(canonicalize(['r', 'r', '$1']), (['$1'], 2))
+        self.assertEqual(canonicalize(['$a', ']', 'c', 'c']), (['c'], 3))
+        self.assertEqual(canonicalize(['T1', 'T1', 'z0', 'saa']), ([], 4))
+        self.assertEqual(canonicalize(['r', 'M', 'r']), (['r', 'M', 'r'], 0))
+
+    def test_optimize(self):
+        rules = [':', '$a]', 'lu', 'u', 'rr', '$1', 'c', 'Cr', '}{', 'ss$', 'sa@sb$', 'sb$sa@']
+        kept, stats = optimize_rules(rules)
+        self.assertEqual(kept, [':', 'u', '$1', 'c', 'Cr', 'ss$', 'sa@sb$', 'sb$sa@'])
+        self.assertEqual(stats['duplicates'], 4)
+        kept, stats = optimize_rules(rules, PROBE_WORDS)
+        self.assertEqual(kept, [':', 'u', '$1', 'c', 'Cr', 'ss$', 'sa@sb$'])
+        self.assertEqual(stats['equivalent'], 1)
+        self.assertEqual(stats['kept'], 7)
+
+    def test_not_equivalent(self):
+        rules = ['(~$1', '(~$2', '>z$1', '>z$2', 'sXY', 'sQR', '(#', '(%', 'sXYsQR', 'sQRsXY']
+        kept, stats = optimize_rules(rules, PROBE_WORDS)
+        self.assertEqual(kept, rules[:-1])
+        self.assertEqual(stats['equivalent'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+
+from PyParallel import generate, rule_ranges
+from PyRuleEngine import RuleContext, RuleEngine
+
+WORDS = ['password', 'princess', 'p@ssW0rd', 'abc', 'mycomputer']
+RULES = [':', '$1', 'u', 'ss$', 'r', 'T3']
+
+
+class ParallelTest(unittest.TestCase):
+    def test_rule_ranges(self):
+        self.assertEqual(list(rule_ranges(10, 3)), [(0, 4), (4, 7), (7, 10)])
+        self.assertEqual(list(rule_ranges(2, 4)), [(0, 1), (1, 2)])
+
+    def test_word_major(self):
+        engine = RuleEngine(RULES)
+        expected = [c for word in WORDS for c, _ in engine.apply(word)]
+        chunks = list(generate(WORDS, RULES, processes=2, chunk_size=2))
+        self.assertEqual([c for chunk in chunks for c in chunk], expected)
+
+    def test_rule_major(self):
+        engine = RuleEngine(RULES)
+        expected = [c for rule in engine.compiled for c in (rule(word, RuleContext()) for word in WORDS)]
+        chunks = list(generate(WORDS, RULES, processes=3, shard='rules', order='rule', chunk_size=10))
+        self.assertEqual([c for chunk in chunks for c in chunk], expected)
+
+    def test_unordered(self):
+        engine = RuleEngine(RULES)
+        expected = [c for word in WORDS for c, _ in engine.apply(word)]
+        chunks = list(generate(WORDS, RULES, processes=2, shard='rules', chunk_size=1, ordered=False))
+        self.assertEqual(sorted(c for chunk in chunks for c in chunk), sorted(expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
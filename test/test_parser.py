@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+
+from PyReversionEngine import ReversionEngine
+from PyRuleEngine import RuleEngine, functions_regex
+from PyRuleParser import RuleSyntaxError, check_rule_file, parse_rejected_rules, parse_rule, parse_rules
+
+
+class ParserTest(unittest.TestCase):
+    def test_tokens(self):
+        self.assertEqual(parse_rule(':'), (':',))
+        self.assertEqual(parse_rule('l$1 sa@X123'), ('l', '$1', 'sa@', 'X123'))
+        self.assertEqual(parse_rule('$ l'), ('$ ', 'l'))
+        self.assertEqual(parse_rule('>8<A!x'), ('>8', '<A', '!x'))
+        self.assertEqual(parse_rule('Tp'), ('Tp',))
+
+    def test_lenient_like_regex(self):
+        findall = functions_regex().findall
+        for rule in ['T', 'T$1', 'x1', 'x1$', 'w$1', '#u', 'i5', '$\n', 's', '3a']:
+            self.assertEqual(parse_rule(rule), tuple(findall(rule)), rule)
+
+    def test_strict(self):
+        cases = {
+            'w$1': (1, "unknown function 'w'"),
+            'l T': (4, "missing position argument of 'T'"),
+            'l i5': (5, "missing character argument of 'i'"),
+            '$1x1!': (5, "invalid position '!' for 'x'"),
+        }
+        for rule, (column, message) in cases.items():
+            with self.assertRaises(RuleSyntaxError) as error:
+                parse_rule(rule, strict=True, line=7)
+            self.assertEqual((error.exception.column, error.exception.message, error.exception.line),
+                             (column, message, 7), rule)
+        self.assertEqual(parse_rule('l  $1', strict=True), ('l', '$1'))
+
+    def test_parse_rules(self):
+        parsed = parse_rules(['$1', 'u', '$1'])
+        self.assertEqual(parsed, (('$1',), ('u',), ('$1',)))
+        self.assertIs(parsed[0], parsed[2])
+        with self.assertRaises(RuleSyntaxError) as error:
+            parse_rules(['$1', 'u', 'T'], strict=True, first_line=10)
+        self.assertEqual(error.exception.line, 12)
+
+    def test_rejected_rules(self):
+        self.assertEqual(parse_rejected_rules(['>6 $1', '%2s']), (('>6',), ('%2s',)))
+        with self.assertRaises(RuleSyntaxError) as error:
+            parse_rejected_rules(['>6 $1'], strict=True)
+        self.assertEqual(error.exception.column, 4)
+
+    def test_engines(self):
+        self.assertEqual([w for w, _ in RuleEngine(['>5$1', 'w$2']).apply('pass')], ['pass2'])
+        with self.assertRaises(RuleSyntaxError):
+            RuleEngine(['w$2'], strict=True)
+        # functions without reversion are skipped
+        reversion = ReversionEngine(['$1', 'k$1', '>5'])
+        self.assertEqual([w for w, _ in reversion.apply('pass1')], ['pass', 'pass', 'pass1'])
+
+    def test_check_rule_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            rule_path = os.path.join(tmp, 'rules.txt')
+            with open(rule_path, 'w') as f_rule:
+                f_rule.write('# comment w\n$1\n\nT\nu\nw\n')
+            errors = check_rule_file(rule_path)
+        self.assertEqual([(e.line, e.column) for e in errors], [(4, 2), (6, 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,15 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
-from PyReversionEngine import ReversionEngine
+
+import PyReversionEngine
+from PyReversionEngine import (ReversionEngine, ReversionIndex, load_reversion_dist, load_reversion_top,
+                               read_reversion_dist)
+from PyRuleEngine import RuleContext, RuleEngine
 
 reversion_engine = ReversionEngine()
 
@@ -148,5 +158,117 @@ class ReversionTest(unittest.TestCase):
     #     self.assertEqual(apply('123123wo', 'i8iD6'), '123123oi')
 
 
+class ReversionDistTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.json_path = os.path.join(self.tmp, 'reversion.json')
+        self.write({'D': {'0': {'a': 1, 'b': 2}}})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, dist):
+        with open(self.json_path, 'w') as fp:
+            json.dump(dist, fp)
+
+    def test_cache(self):
+        self.assertEqual(load_reversion_dist(self.json_path), {'D': {0: 'b'}})
+        self.assertTrue(os.path.exists(self.json_path + '.cache'))
+        self.assertEqual(load_reversion_dist(self.json_path), {'D': {0: 'b'}})
+        # a changed JSON invalidates the cache
+        self.write({'D': {'0': {'a': 3, 'b': 2}, '1': {'c': 1}}})
+        self.assertEqual(load_reversion_dist(self.json_path), {'D': {0: 'a', 1: 'c'}})
+
+    def test_top(self):
+        self.write({'D': {'0': {'a': 1, 'b': 2, 'c': 3}, '1': {'a': 5}}})
+        self.assertEqual(load_reversion_top(self.json_path), {'D': {0: 'cba', 1: 'a', -1: 'acb'}})
+        self.assertEqual(load_reversion_dist(self.json_path), {'D': {0: 'c', 1: 'a'}})
+
+    def test_corrupt_cache(self):
+        load_reversion_dist(self.json_path)
+        with open(self.json_path + '.cache', 'r+b') as fp:
+            data = fp.read()
+            fp.seek(0)
+            fp.write(data[:-3])
+            fp.truncate()
+        self.assertEqual(load_reversion_dist(self.json_path), {'D': {0: 'b'}})
+
+    def test_unwritable_cache(self):
+        cache_path = os.path.join(self.tmp, 'missing', 'reversion.cache')
+        self.assertEqual(load_reversion_dist(self.json_path, cache_path), {'D': {0: 'b'}})
+
+    def test_lazy(self):
+        self.assertEqual(PyReversionEngine.reversion_dist, read_reversion_dist())
+        self.assertIs(PyReversionEngine.__functions_regex__, PyReversionEngine.functions_regex())
+        code = ('import PyRuleEngine, PyReversionEngine; '
+                'print(PyReversionEngine.get_reversion_dist.cache_info().currsize, '
+                'PyRuleEngine.functions_regex.cache_info().currsize)')
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        out = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True)
+        self.assertEqual(out.stdout.split(), ['0', '0'])
+
+
+class BranchingTest(unittest.TestCase):
+    def test_preimages(self):
+        index = ReversionIndex(['Password', 'password', 'PASS', 'dragon1', 'sunny'])
+        engine = ReversionEngine(['u', 'c$1', ']', 'D2', 'uD2', 'l$1'])
+        self.assertEqual(engine.preimages('PASS', 0, index), ['PASS'])
+        self.assertEqual(engine.preimages('Password1', 1, index), ['Password', 'password'])
+        self.assertEqual(engine.preimages('dragon', 2, index), ['dragon1'])
+        self.assertEqual(engine.preimages('suny', 3, index), ['sunny'])
+        self.assertEqual(engine.preimages('SUNY', 4, index), ['sunny'])
+        self.assertEqual(engine.preimages('Password1', 5, index), ['Password', 'password'])
+
+    def test_limit(self):
+        index = ReversionIndex(['sunny'])
+        engine = ReversionEngine(['D2'])
+        self.assertEqual(engine.preimages('suny', 0, index, k=1), ['sunny'])
+        self.assertEqual(engine.preimages('suny', 0, index, k=3, limit=1), ['sunny'])
+        self.assertEqual(engine.preimages('suny', 0, index, k=0), [])
+
+    def test_duplicate(self):
+        index = ReversionIndex(['abcd', 'x'])
+        rules = ['y2$1', 'Y2$1', '$1y2', 'y5', 'Y0', 'y0']
+        engine = ReversionEngine(rules)
+        forward = RuleEngine(rules)
+        for idx, rule in enumerate(rules):
+            for word in index.words:
+                target = forward.compiled[idx](word, RuleContext())
+                self.assertIn(word, engine.preimages(target, idx, index), rule)
+        self.assertEqual(engine.preimages('ababcd1', 0, index), ['abcd'])
+        self.assertEqual(engine.preimages('abcdcd1', 1, index), ['abcd'])
+
+    def test_reachable_lengths(self):
+        index = ReversionIndex(['abcd', 'x'])
+        self.assertEqual(index.reachable_lengths(['$1', 'D0', 'y2', 'u']),
+                         [{1, 4}, {2, 5}, {1, 4}, {2, 6}, {2, 6}])
+        self.assertEqual(index.reachable_lengths(['@a', '$1']), [{1, 4}, None, None])
+        # '$1' can't give 'ab1' from a word of the index, so 'D0' isn't reversed
+        engine = ReversionEngine(['$1D0'])
+        self.assertEqual(engine.preimages('ab', 0, index), [])
+        self.assertEqual(engine.preimages('bcd1', 0, index, k=36), ['abcd'])
+
+    def test_omit(self):
+        words = ['', 'a', 'ab', 'abc', 'abcd', 'abcde']
+        index = ReversionIndex(words)
+        rules = ['O01', 'O12', 'O13', 'O23', 'O31', 'O50']
+        engine = ReversionEngine(rules)
+        forward = RuleEngine(rules)
+        for idx in range(len(rules)):
+            for word in words:
+                target = forward.compiled[idx](word, RuleContext())
+                if target == word:
+                    self.assertIn(word, engine.preimages(target, idx, index), rules[idx])
+        self.assertEqual(engine.preimages('abcd', 3, index), ['abcd'])
+        self.assertEqual(engine.preimages('abc', 2, index), ['abc'])
+
+    def test_purge(self):
+        index = ReversionIndex(['p@ssword', 'pssword', 'p@ss@word'])
+        engine = ReversionEngine(['@@'])
+        self.assertEqual(engine.preimages('pssword', 0, index, k=0), ['pssword'])
+        self.assertEqual(engine.preimages('pssword', 0, index, k=8), ['pssword', 'p@ssword'])
+        self.assertEqual(engine.preimages('p@ssword', 0, index, k=8), [])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+
+from PyHashcat import read_rules
+from PyRuleCache import RuleCache, encode_rules, load_rules
+from PyRuleEngine import RuleEngine
+from PyRuleParser import RuleSyntaxError, parse_rules
+
+RULES = [':', 'sa@T3$1', 'Dp%2s', 'x12O03', '$\xe9^€', 'i5 ', 'c$1$2$3', 'X123M4', 'TaDz', 'x0bO1B', 'u w']
+
+
+class RuleCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.rule_path = os.path.join(self.tmp.name, 'rules.rule')
+        self.write(RULES)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, rules):
+        with open(self.rule_path, 'w') as f_rule:
+            f_rule.write(''.join(rule + '\n' for rule in rules))
+
+    def test_round_trip(self):
+        parsed = parse_rules(RULES)
+        rules = RuleCache(encode_rules(parsed))
+        self.assertEqual(list(rules), [list(rule) for rule in parsed])
+        self.assertEqual(rules[-1], ['u'])
+        with self.assertRaises(ValueError):
+            RuleCache(encode_rules(parsed)[:-1])
+
+    def test_load(self):
+        rules = load_rules(self.rule_path)
+        self.assertTrue(os.path.exists(self.rule_path + '.cache'))
+        self.assertEqual(list(rules), [list(rule) for rule in parse_rules(RULES)])
+        self.assertEqual(list(load_rules(self.rule_path)), list(rules))
+        # a changed rule file builds the cache again
+        self.write(['$2', 'l'])
+        self.assertEqual(list(load_rules(self.rule_path)), [['$2'], ['l']])
+
+    def test_strict(self):
+        load_rules(self.rule_path)
+        with self.assertRaises(RuleSyntaxError):
+            load_rules(self.rule_path, strict=True)
+        self.write(['$2', 'l'])
+        self.assertEqual(len(load_rules(self.rule_path, strict=True)), 2)
+
+    def test_read_only(self):
+        cache_path = os.path.join(self.tmp.name, 'missing', 'rules.cache')
+        self.assertEqual(len(load_rules(self.rule_path, cache_path)), len(RULES))
+
+    def test_engine(self):
+        words = ['password', 'abc123', 'P\xe9']
+        engine = RuleEngine(read_rules(self.rule_path))
+        cached = RuleEngine.from_tokens(load_rules(self.rule_path))
+        for word in words:
+            self.assertEqual(list(cached.apply(word)), list(engine.apply(word)))
+        lazy = RuleEngine.from_tokens(load_rules(self.rule_path), indices=[1, 6])
+        self.assertEqual(sum(c is not None for c in lazy.compiled), 2)
+        self.assertEqual(list(lazy.apply_indexed('password')), [(1, 'p@sSword1'), (6, 'Password123')])
+        lazy.change_indices(range(len(RULES)))
+        self.assertEqual(list(lazy.apply_indexed('password')), list(engine.apply_indexed('password')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+
+from PyRuleEngine import RuleEngine
+from PyScheduler import AdaptiveScheduler
+
+RULES = [':', 'u', 'c', '$1', '$2', '$1$2$3', 'c$1', 'r', 'd', 'sa@']
+WORDS = ['password', 'monkey', 'dragon', 'shadow', 'master', 'letmein', 'qwerty', 'sunshine', 'princess',
+         'football', 'baseball', 'welcome', 'abc', 'admin', 'flower', 'hottie', 'loveme', 'zaq1zaq1']
+TARGETS = {'password1', 'monkey1', 'dragon1', 'Shadow1', 'master1', 'p@ssword', 'Letmein1', 'qwerty123',
+           'sunshine1', 'princess', 'football1', 'Baseball1', 'welcome1', 'abc123', 'admin1', 'flower1',
+           'hottie1', 'loveme1', 'zaq1zaq11', 'dragon123'}
+
+
+class SchedulerTest(unittest.TestCase):
+    def test_same_hits(self):
+        engine = RuleEngine(RULES)
+        expected = {candidate for word in WORDS for candidate, _ in engine.apply(word) if candidate in TARGETS}
+        for deterministic in [True, False]:
+            scheduler = AdaptiveScheduler(RULES, TARGETS.__contains__, sample_size=3, chunk_size=4,
+                                          deterministic=deterministic, interval=0.0)
+            hits = [candidate for candidate, _, _ in scheduler.run(WORDS)]
+            self.assertEqual(len(hits), len(set(hits)))
+            self.assertEqual(set(hits), expected)
+
+    def test_order(self):
+        runs = []
+        for _ in range(2):
+            scheduler = AdaptiveScheduler(RULES, TARGETS.__contains__, sample_size=3, chunk_size=4)
+            runs.append(list(scheduler.run(WORDS)))
+            # '$1' is the most productive rule, rules without hits keep their order
+            self.assertEqual(scheduler.order[0], 3)
+            self.assertEqual(scheduler.order[-5:], [1, 2, 4, 7, 8])
+            self.assertEqual(scheduler.engine.indices, scheduler.order)
+        self.assertEqual(runs[0], runs[1])
+        # hits of '$1' come first in every chunk
+        self.assertEqual([''.join(rule) for _, word, rule in runs[0] if word == 'shadow'], ['c$1'])
+        self.assertEqual([c for c, _, _ in runs[0][5:7]], ['master1', 'qwerty123'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import io
+import unittest
+
+from PyHashcat import TargetStore
+from PyRuleStats import RuleStats
+
+
+class StatsTest(unittest.TestCase):
+    def test_counts(self):
+        targets = TargetStore([b'password', b'password1', b'password1', b'PASSWORD', b'abc1'])
+        stats = RuleStats([':', '$1', 'u', 'l$1', '>9'], targets)
+        stats.feed_all(['password', 'Password', 'abc'])
+        self.assertEqual(list(stats.candidates), [3, 3, 3, 3, 0])
+        self.assertEqual(list(stats.hits), [1, 2, 2, 3, 0])
+        # 'l$1' hits password1 and abc1 after '$1' found them
+        self.assertEqual(list(stats.unique), [1, 2, 1, 0, 0])
+        self.assertEqual([r for r, _, _, _ in stats.sorted_rules()], ['l$1', '$1', 'u', ':', '>9'])
+        self.assertEqual([r for r, _, _, _ in stats.sorted_rules('unique')], ['$1', ':', 'u', 'l$1', '>9'])
+        f_out = io.StringIO()
+        stats.dump(f_out)
+        self.assertEqual(f_out.getvalue().splitlines()[0], '3\t0\t3\tl$1')
+        with self.assertRaises(ValueError):
+            stats.sorted_rules('rule')
+        # same counts with the passwords in a dict
+        other = RuleStats([':', '$1', 'u', 'l$1', '>9'], {'password': 1, 'password1': 2, 'PASSWORD': 1, 'abc1': 1})
+        other.feed_all(['password', 'Password', 'abc'])
+        self.assertEqual(other.sorted_rules(), stats.sorted_rules())
+
+
+if __name__ == '__main__':
+    unittest.main()
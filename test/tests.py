@@ -2,7 +2,7 @@
 Test whether rule engine has correct output for different rules as specified on
 https://hashcat.net/wiki/doku.php?id=rule_based_attack """
 import unittest
-from PyRuleEngine import RuleEngine
+from PyRuleEngine import RuleContext, RuleEngine, function_map
 
 rule_engine = RuleEngine()
 
@@ -164,6 +164,87 @@ class RuleTest(unittest.TestCase):
         self.assertEqual(apply('4210021837', 'O46z2'), '444210')
         self.assertEqual(apply('123123wo', 'i8iD6'), '123123oi')
 
+    def test_fused(self):
+        self.assertEqual(apply('pass', '$1$2$3'), 'pass123')
+        self.assertEqual(apply('pass', '^1^2^3'), '321pass')
+        self.assertEqual(apply('p@ssW0rd', 'clu'), 'P@SSW0RD')
+        self.assertEqual(apply('p@ssW0rd', 'uc$1l'), 'p@ssw0rd1')
+
+    def test_out_of_range(self):
+        self.assertEqual(apply('abc', 'T8'), 'abc')
+        self.assertEqual(apply('abc', 'T8$1'), 'abc1')
+        self.assertEqual(apply('', '{z2k'), '')
+        self.assertEqual(apply('abc', '*18'), 'abc')
+
+    def test_memory_per_application(self):
+        engine = RuleEngine(['uM', '4', 'lM$16'])
+        self.assertEqual([w for w, _ in engine.apply('Abc')], ['ABC', 'Abc', 'abcabc1'])
+        other = RuleEngine(['M4'])
+        self.assertEqual([w for w, _ in other.apply('xy')], ['xyxy'])
+        self.assertEqual([w for w, _ in engine.apply('Abc')], ['ABC', 'Abc', 'abcabc1'])
+
+    def test_function_map_signature(self):
+        ctx = RuleContext()
+        self.assertEqual(function_map['M']('ab', '', ctx), 'ab')
+        self.assertEqual(function_map['4']('x', '', ctx), 'xab')
+        self.assertEqual(function_map['6']('x', '', ctx), 'abx')
+        self.assertEqual(function_map['X']('xy', '011', ctx), 'xay')
+        self.assertEqual(function_map['4']('x', ''), 'x')
+        self.assertEqual(function_map['$']('x', '1'), 'x1')
+        ctx.p = 2
+        self.assertEqual(function_map['T']('abcd', 'p', ctx), 'abCd')
+        self.assertEqual(function_map['T']('abcd', 'p'), 'Abcd')
+
+    def test_reject(self):
+        engine = RuleEngine(['>5$1', '<5$1', '_4', '!a', '/a', '(p', ')d', '=1a', '%2s', 'MQ', 'M$1Q'])
+        self.assertEqual([w for w, _ in engine.apply('pass')], ['pass1', 'pass', 'pass', 'pass', 'pass',
+                                                               'pass', 'pass1'])
+        self.assertEqual([w for w, _ in engine.apply('password')], ['password1', 'password', 'password',
+                                                                   'password', 'password', 'password',
+                                                                   'password1'])
+
+    def test_reject_position(self):
+        self.assertEqual(apply('password', '/sDp'), 'pasword')
+        self.assertEqual(apply('password', '%2sDp'), 'pasword')
+        self.assertEqual(apply('password', '%1oTp'), 'passwOrd')
+        self.assertEqual(list(RuleEngine(['/x$1']).apply('password')), [])
+
+    def test_rejected_rules(self):
+        engine = RuleEngine([':', '$1', '$1$2'], rejected_rules=['>9', '!2'])
+        self.assertEqual([w for w, _ in engine.apply('password')], ['password1'])
+        self.assertTrue(engine.reject('password12'))
+        self.assertFalse(engine.reject('password1'))
+
+    def test_trie(self):
+        rules = ['l', 'l$1', 'l$1$2', 'l$1$2$3', 'c$1', ':', 'c$1', 'lM$1', 'lM$14', 'lM$2Tp', '/sDp', '/s$1',
+                 'l<5$1', 'l<5$2', 'T8$1', 'r']
+        for rejected_rules in [[], ['>6'], ['%2s']]:
+            engine = RuleEngine(rules, rejected_rules)
+            trie = RuleEngine(rules, rejected_rules, trie=True)
+            for word in ['', 'a', 'Pass', 'PassWord', 'sassy']:
+                self.assertEqual(list(trie.apply(word)), list(engine.apply(word)))
+            engine.change_indices([12, 3, 0, 3])
+            trie.change_indices([12, 3, 0, 3])
+            self.assertEqual(list(trie.apply('Pass')), list(engine.apply('Pass')))
+
+    def test_binary(self):
+        rules = [':', 'l', 'u', 'c', 'C', 't', 'T1', 'r', 'd', 'p1', 'f', '{', '}', '$1', '^1', '[', ']', 'D1',
+                 'x12', 'O12', 'i1!', 'o1!', "'2", 'sa@', '@a', 'z2', 'Z2', 'q', 'lMX112', 'uMl4', 'rMr6',
+                 'k', 'K', '*02', 'L1', 'R1', '+1', '-1', '.1', ',1', 'y2', 'Y2', 'E', 'e-', '31a', '=1a$1',
+                 '/aDp', '%2aTp', 'MlQ', '<5', '>5', '_4', '!a', '(p', ')d']
+        engine = RuleEngine(rules)
+        binary = RuleEngine(rules, binary=True)
+        trie = RuleEngine(rules, binary=True, trie=True)
+        for word in ['', 'a', 'pass', 'Pa-ss wa-ve', 'aaaa']:
+            expected = [(w.encode('latin-1'), r) for w, r in engine.apply(word)]
+            self.assertEqual(list(binary.apply(word.encode())), expected)
+            self.assertEqual(list(trie.apply(word.encode())), expected)
+        # bytes semantics: ASCII only case and wrapping arithmetic
+        binary = RuleEngine(['u', 'T0', '+0', '-0', 'L0', '$\xe9'], binary=True)
+        self.assertEqual([w for w, _ in binary.apply(b'\xe9\xff')], [b'\xe9\xff', b'\xe9\xff', b'\xea\xff',
+                                                                  b'\xe8\xff', b'\xd2\xff', b'\xe9\xff\xe9'])
+        self.assertEqual([w for w, _ in binary.apply(b'\x00')][2:5], [b'\x01', b'\xff', b'\x00'])
+
 
 if __name__ == '__main__':
     unittest.main()